@@ -0,0 +1,76 @@
+"""
+Пропускная способность проверки авторизации: поиск токена в auth_tokens против подписанного access-токена.
+
+    cd api && python -m benchmarks.bench_auth_tokens --requests 5000 --users 10000
+"""
+import argparse
+import asyncio
+import random
+import tempfile
+import time
+from datetime import date
+from pathlib import Path
+
+from sqlalchemy import create_engine, select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+from constants import BodyType, Gender
+from database.models import AuthToken, Base, City, User
+from utils.common import generate_auth_token
+from utils.jwt_manager import create_access_token, verify_token
+
+
+def seed(url: str, users: int) -> list:
+    engine = create_engine(url)
+    Base.metadata.create_all(engine)
+    tokens = [generate_auth_token() for _ in range(users)]
+    with sessionmaker(engine)() as db:
+        db.add(City(id=1, name="Москва", region="Москва и Московская обл."))
+        db.add_all(
+            User(id=i + 1, email=f"user{i}@example.com", name="Анна", birth_date=date(1995, 5, 15), height=170,
+                 body_type=BodyType.SLIM, gender=Gender.FEMALE, city_id=1)
+            for i in range(users)
+        )
+        db.add_all(AuthToken(token=token, user_id=i + 1) for i, token in enumerate(tokens))
+        db.commit()
+    engine.dispose()
+    return tokens
+
+
+async def run_db_lookup(url: str, tokens: list, requests: int) -> float:
+    engine = create_async_engine(url.replace("sqlite://", "sqlite+aiosqlite://"))
+    SessionLocal = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+    started = time.perf_counter()
+    for _ in range(requests):
+        async with SessionLocal() as db:
+            stmt = select(AuthToken).where(AuthToken.token == random.choice(tokens), AuthToken.is_active.is_(True))
+            assert (await db.scalars(stmt)).one_or_none() is not None
+    elapsed = time.perf_counter() - started
+    await engine.dispose()
+    return requests / elapsed
+
+
+def run_signed(users: int, requests: int) -> float:
+    tokens = [create_access_token({'sub': str(i + 1)}) for i in range(min(users, 1000))]
+    started = time.perf_counter()
+    for _ in range(requests):
+        verify_token(random.choice(tokens))
+    return requests / (time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--users", type=int, default=10000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        url = f"sqlite:///{Path(tmp) / 'bench.db'}"
+        tokens = seed(url, args.users)
+        print(f"auth_tokens lookup {asyncio.run(run_db_lookup(url, tokens, args.requests)):>10.0f} checks/s")
+    print(f"signed token       {run_signed(args.users, args.requests):>10.0f} checks/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,44 @@
+"""
+Время загрузки справочника городов, увеличенного в N раз: первая загрузка и повторный запуск.
+
+    cd api && python -m benchmarks.bench_city_loader --scale 10
+"""
+import argparse
+import json
+import tempfile
+import time
+from pathlib import Path
+
+from sqlalchemy import create_engine
+
+from database.models import Base
+from utils.load_cities import load_cities
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--scale", type=int, default=10)
+    args = parser.parse_args()
+
+    cities = json.loads(Path("cities.json").read_text(encoding="utf-8"))
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "cities.json"
+        items = [
+            {"city": item["city"] if i == 0 else f"{item['city']} {i}", "region": item["region"]}
+            for i in range(args.scale)
+            for item in cities
+        ]
+        path.write_text(json.dumps(items, ensure_ascii=False, indent=2), encoding="utf-8")
+        print(f"{len(items)} городов, {path.stat().st_size / 1024 / 1024:.1f} МБ")
+
+        engine = create_engine(f"sqlite:///{Path(tmp) / 'bench.db'}")
+        Base.metadata.create_all(engine)
+        for run in ("первая загрузка", "повторный запуск", "с --delete-missing"):
+            started = time.perf_counter()
+            report = load_cities(str(path), engine, with_delete=run.startswith("с "))
+            print(f"{run:<20} {time.perf_counter() - started:.2f} с — {report}")
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""
+Латентность автодополнения городов: прежний ILIKE-запрос против индекса CityAutocomplete.
+Запросы — последовательные нажатия клавиш при наборе названий из cities.json.
+
+    cd api && python -m benchmarks.bench_city_search --words 200
+"""
+import argparse
+import asyncio
+import json
+import random
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+from sqlalchemy import create_engine, insert, select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+from config import LIMIT_CITY_ENTITIES_FOR_SEARCH
+from database.models import Base, City
+from utils.cities import CityAutocomplete
+
+
+def keystrokes(cities: list, words: int) -> list:
+    queries = []
+    for item in random.sample(cities, words):
+        name = item['city'].strip()
+        queries.extend(name[:i] for i in range(1, len(name) + 1))
+    return queries
+
+
+async def run_sql(url: str, queries: list) -> list:
+    engine = create_async_engine(url.replace("sqlite://", "sqlite+aiosqlite://"))
+    SessionLocal = async_sessionmaker(engine, class_=AsyncSession)
+    latencies = []
+    async with SessionLocal() as db:
+        for q in queries:
+            started = time.perf_counter()
+            word = q.strip().capitalize()
+            stmt = select(City).where(City.name.ilike(f'{word}%')).order_by(City.name.asc()).limit(LIMIT_CITY_ENTITIES_FOR_SEARCH)
+            [{"id": city.id, "name": city.full_name} for city in (await db.scalars(stmt)).all()]
+            latencies.append(time.perf_counter() - started)
+    await engine.dispose()
+    return latencies
+
+
+def run_index(rows: list, queries: list) -> list:
+    index = CityAutocomplete()
+    index.load(rows)
+    latencies = []
+    for q in queries:
+        started = time.perf_counter()
+        index.lookup(q)
+        latencies.append(time.perf_counter() - started)
+    return latencies
+
+
+def report(name: str, latencies: list):
+    latencies = sorted(latencies)
+    p99 = latencies[int(len(latencies) * 0.99)]
+    print(f"{name:<12} p50={statistics.median(latencies) * 1e6:>8.1f}us  p99={p99 * 1e6:>8.1f}us")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--words", type=int, default=200)
+    args = parser.parse_args()
+
+    cities = json.loads(Path("cities.json").read_text(encoding="utf-8"))
+    queries = keystrokes(cities, args.words)
+    unique = {(item['city'].strip(), item['region'].strip()) for item in cities}
+    rows = [(i + 1, name, region, 0) for i, (name, region) in enumerate(sorted(unique))]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        url = f"sqlite:///{Path(tmp) / 'bench.db'}"
+        engine = create_engine(url)
+        Base.metadata.create_all(engine)
+        with engine.begin() as conn:
+            conn.execute(insert(City), [{"id": i, "name": name, "region": region} for i, name, region, _ in rows])
+        engine.dispose()
+        print(f"{len(queries)} запросов")
+        report("SQL ILIKE", asyncio.run(run_sql(url, queries)))
+    report("index", run_index(rows, queries))
+
+
+if __name__ == "__main__":
+    main()
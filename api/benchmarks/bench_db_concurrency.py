@@ -0,0 +1,130 @@
+"""
+p99-латентность обработчиков при смешанной нагрузке чтение/запись:
+синхронная Session внутри async-обработчика против AsyncSession.
+
+    cd api && python -m benchmarks.bench_db_concurrency --clients 50 --requests 40
+"""
+import argparse
+import asyncio
+import random
+import statistics
+import tempfile
+import time
+from datetime import date
+from pathlib import Path
+
+from sqlalchemy import create_engine, select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+from constants import BodyType, Gender
+from database.models import Base, City, User
+
+
+def seed(url: str, users: int):
+    engine = create_engine(url)
+    Base.metadata.create_all(engine)
+    with sessionmaker(engine)() as db:
+        db.add(City(id=1, name="Москва", region="Москва и Московская обл."))
+        db.add_all(
+            User(email=f"user{i}@example.com", name="Анна", birth_date=date(1995, 5, 15), height=170,
+                 body_type=BodyType.SLIM, gender=Gender.FEMALE, city_id=1)
+            for i in range(users)
+        )
+        db.commit()
+    engine.dispose()
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+async def run_sync(url: str, clients: int, requests: int, users: int, write_ratio: float):
+    engine = create_engine(url)
+    SessionLocal = sessionmaker(engine, autoflush=False)
+
+    async def handler(is_write: bool):
+        # Так работали обработчики до перехода на AsyncSession: запрос блокирует цикл событий
+        with SessionLocal() as db:
+            user = db.scalars(select(User).where(User.id == random.randint(1, users))).one()
+            if is_write:
+                user.height = random.randint(150, 200)
+                db.commit()
+        await asyncio.sleep(0)
+
+    result = await drive(handler, clients, requests, write_ratio)
+    engine.dispose()
+    return result
+
+
+async def run_async(url: str, clients: int, requests: int, users: int, write_ratio: float):
+    engine = create_async_engine(url.replace("sqlite://", "sqlite+aiosqlite://"))
+    SessionLocal = async_sessionmaker(engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+
+    async def handler(is_write: bool):
+        async with SessionLocal() as db:
+            user = (await db.scalars(select(User).where(User.id == random.randint(1, users)))).one()
+            if is_write:
+                user.height = random.randint(150, 200)
+                await db.commit()
+
+    result = await drive(handler, clients, requests, write_ratio)
+    await engine.dispose()
+    return result
+
+
+async def drive(handler, clients: int, requests: int, write_ratio: float):
+    latencies = {"read": [], "write": [], "loop lag": []}
+    done = asyncio.Event()
+
+    async def probe():
+        # Запрос без обращения к БД: показывает, насколько остальные обработчики блокируют цикл событий
+        while not done.is_set():
+            started = time.perf_counter()
+            await asyncio.sleep(0.001)
+            latencies["loop lag"].append(time.perf_counter() - started - 0.001)
+
+    async def client():
+        for _ in range(requests):
+            is_write = random.random() < write_ratio
+            started = time.perf_counter()
+            await handler(is_write)
+            latencies["write" if is_write else "read"].append(time.perf_counter() - started)
+
+    probe_task = asyncio.create_task(probe())
+    started = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(clients)))
+    elapsed = time.perf_counter() - started
+    done.set()
+    await probe_task
+    return elapsed, latencies
+
+
+def report(name: str, elapsed: float, latencies: dict):
+    total = len(latencies["read"]) + len(latencies["write"])
+    print(f"{name:<14} {total / elapsed:>9.0f} req/s", end="")
+    for kind, values in latencies.items():
+        if values:
+            print(f"  {kind}: p50={statistics.median(values) * 1000:.2f}ms p99={percentile(values, 0.99) * 1000:.2f}ms", end="")
+    print()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--clients", type=int, default=50)
+    parser.add_argument("--requests", type=int, default=40)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--write-ratio", type=float, default=0.2)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        url = f"sqlite:///{Path(tmp) / 'bench.db'}"
+        seed(url, args.users)
+        for name, runner in (("sync Session", run_sync), ("AsyncSession", run_async)):
+            elapsed, latencies = asyncio.run(runner(url, args.clients, args.requests, args.users, args.write_ratio))
+            report(name, elapsed, latencies)
+
+
+if __name__ == "__main__":
+    main()
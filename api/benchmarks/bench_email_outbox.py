@@ -0,0 +1,146 @@
+"""
+Письма: прежняя отправка aiosmtplib.send прямо в обработчике против постановки в email_outbox.
+Вместо настоящего SMTP поднимается локальный сервер-заглушка; задержка приветствия имитирует
+TLS-рукопожатие и AUTH удалённого сервера.
+
+    cd api && python -m benchmarks.bench_email_outbox --emails 200 --handshake-ms 150
+"""
+import argparse
+import asyncio
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+import aiosmtplib
+from sqlalchemy import create_engine, event
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+from config import EmailSettings
+from database.connect import apply_sqlite_pragmas, engine_options
+from database.models import Base
+from utils.email_sender import EmailOutbox, SMTPPool, build_message, email_dedup_key, enqueue_email
+
+
+class StubSMTPServer:
+    # Минимальный SMTP: EHLO/MAIL/RCPT/DATA/RSET/NOOP/QUIT, письма только считаются
+    def __init__(self, handshake_delay: float, message_delay: float):
+        self.handshake_delay = handshake_delay
+        self.message_delay = message_delay
+        self.received = 0
+        self.connections = 0
+        self.server = None
+
+    async def start(self) -> int:
+        self.server = await asyncio.start_server(self.handle, "127.0.0.1", 0)
+        return self.server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        self.server.close()
+        await self.server.wait_closed()
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.connections += 1
+        await asyncio.sleep(self.handshake_delay)
+        writer.write(b"220 stub ESMTP\r\n")
+        try:
+            while line := await reader.readline():
+                command = line[:4].upper()
+                if command == b"EHLO":
+                    writer.write(b"250-stub\r\n250 8BITMIME\r\n")
+                elif command == b"DATA":
+                    writer.write(b"354 end with .\r\n")
+                    await writer.drain()
+                    while (await reader.readline()) != b".\r\n":
+                        pass
+                    await asyncio.sleep(self.message_delay)
+                    self.received += 1
+                    writer.write(b"250 queued\r\n")
+                elif command == b"QUIT":
+                    writer.write(b"221 bye\r\n")
+                    await writer.drain()
+                    break
+                else:
+                    writer.write(b"250 ok\r\n")
+                await writer.drain()
+        finally:
+            writer.close()
+
+
+def percentiles(samples):
+    samples = sorted(samples)
+    return (
+        statistics.median(samples) * 1000,
+        samples[int(len(samples) * 0.95) - 1] * 1000,
+    )
+
+
+async def inline_send(port: int, emails: int):
+    latencies = []
+    for i in range(emails):
+        started = time.perf_counter()
+        await aiosmtplib.send(
+            build_message(f"user{i}@example.com", "Ваш пароль", f"Ваш пароль: {i}"),
+            hostname="127.0.0.1",
+            port=port,
+            use_tls=False,
+        )
+        latencies.append(time.perf_counter() - started)
+    return latencies
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--emails", type=int, default=200)
+    parser.add_argument("--handshake-ms", type=float, default=150)
+    parser.add_argument("--message-ms", type=float, default=2)
+    parser.add_argument("--inline-emails", type=int, default=20, help="прежний способ медленный, хватит и меньшей выборки")
+    args = parser.parse_args()
+
+    stub = StubSMTPServer(args.handshake_ms / 1000, args.message_ms / 1000)
+    port = await stub.start()
+
+    latencies = await inline_send(port, args.inline_emails)
+    p50, p95 = percentiles(latencies)
+    print(f"aiosmtplib.send в обработчике:  p50 {p50:7.2f} мс  p95 {p95:7.2f} мс  соединений: {stub.connections}")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "bench.db"
+        with create_engine(f"sqlite:///{path}").begin() as conn:
+            Base.metadata.create_all(conn)
+        async_engine = create_async_engine(f"sqlite+aiosqlite:///{path}", **engine_options())
+        event.listen(async_engine.sync_engine, "connect", apply_sqlite_pragmas)
+        sessions = async_sessionmaker(async_engine, class_=AsyncSession, expire_on_commit=False)
+
+        latencies = []
+        for i in range(args.emails):
+            started = time.perf_counter()
+            async with sessions() as db:
+                await enqueue_email(
+                    db, f"user{i}@example.com", "Ваш пароль", f"Ваш пароль: {i}",
+                    dedup_key=email_dedup_key(f"user{i}@example.com", "password", i),
+                )
+                await db.commit()
+            latencies.append(time.perf_counter() - started)
+        p50, p95 = percentiles(latencies)
+        print(f"постановка в email_outbox:      p50 {p50:7.2f} мс  p95 {p95:7.2f} мс")
+
+        settings = EmailSettings(use_tls=False)
+        outbox = EmailOutbox(settings, sessions, SMTPPool(settings, hostname="127.0.0.1", port=str(port)))
+        connections = stub.connections
+        started = time.perf_counter()
+        while await outbox.deliver_due():
+            pass
+        elapsed = time.perf_counter() - started
+        await outbox.stop()
+        print(
+            f"доставка очереди: {args.emails} писем за {elapsed:.2f} с ({args.emails / elapsed:.0f} писем/с), "
+            f"новых соединений: {stub.connections - connections}, {outbox.stats()}"
+        )
+        await async_engine.dispose()
+
+    await stub.stop()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
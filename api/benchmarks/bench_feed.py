@@ -0,0 +1,107 @@
+"""
+Латентность страницы ленты /users/feed/ в зависимости от глубины прокрутки:
+keyset-курсор против OFFSET на синтетической базе.
+
+    cd api && python -m benchmarks.bench_feed --users 1000000
+"""
+import argparse
+import asyncio
+import random
+import sqlite3
+import statistics
+import tempfile
+import time
+from datetime import date, timedelta
+from pathlib import Path
+
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+from constants import BodyType, Gender, Status, PhotoType, FEED_PAGE_SIZE
+from database.models import Base, User
+from views.users import build_feed_query
+
+
+def seed(path: Path, users: int):
+    engine = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(engine)
+    engine.dispose()
+
+    rnd = random.Random(1)
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=OFF")
+    conn.executemany("INSERT INTO cities (id, name, region) VALUES (?, ?, ?)", [(i, f"Город {i}", "Регион") for i in range(1, 101)])
+    statuses = [Status.ACTIVE.name] * 8 + [Status.PENDING.name, Status.INACTIVE.name]
+    body_types = [item.name for item in BodyType]
+    conn.executemany(
+        "INSERT INTO users (id, email, name, birth_date, height, body_type, gender, city_id, status, created_at) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        (
+            (i, f"user{i}@example.com", "Анна", (date(1960, 1, 1) + timedelta(days=rnd.randint(0, 16000))).isoformat(),
+             rnd.randint(150, 200), rnd.choice(body_types), rnd.choice((Gender.MALE.name, Gender.FEMALE.name)),
+             rnd.randint(1, 100), rnd.choice(statuses), "2024-01-01 00:00:00")
+            for i in range(1, users + 1)
+        ),
+    )
+    conn.executemany(
+        "INSERT INTO photos (user_id, file_path, photo_type, created_at) VALUES (?, ?, ?, ?)",
+        ((i, f"storage/uploads/user_{i}/avatar.jpg", PhotoType.AVATAR.name, "2024-01-01 00:00:00") for i in range(1, users + 1)),
+    )
+    conn.commit()
+    conn.execute("ANALYZE")
+    conn.close()
+
+
+async def measure(url: str, depths: list, repeats: int, filters: dict):
+    engine = create_async_engine(url)
+    SessionLocal = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+    async with SessionLocal() as db:
+        for depth in depths:
+            # Курсор на нужной глубине: id последней анкеты предыдущей страницы
+            offset = depth * FEED_PAGE_SIZE
+            stmt = build_feed_query(Gender.FEMALE, limit=offset, **filters).with_only_columns(User.id)
+            ids = (await db.scalars(stmt)).all()
+            if len(ids) < offset:
+                break
+            cursor = ids[-1] if ids else None
+
+            keyset, offset_based = [], []
+            for _ in range(repeats):
+                started = time.perf_counter()
+                (await db.scalars(build_feed_query(Gender.FEMALE, cursor, limit=FEED_PAGE_SIZE + 1, **filters))).unique().all()
+                keyset.append(time.perf_counter() - started)
+
+                started = time.perf_counter()
+                stmt = build_feed_query(Gender.FEMALE, limit=FEED_PAGE_SIZE + 1, **filters).offset(offset)
+                (await db.scalars(stmt)).unique().all()
+                offset_based.append(time.perf_counter() - started)
+
+            print(f"страница {depth + 1:>6}: keyset {statistics.median(keyset) * 1000:>7.2f} мс   "
+                  f"OFFSET {statistics.median(offset_based) * 1000:>8.2f} мс")
+    await engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=1_000_000)
+    parser.add_argument("--depths", type=int, nargs="+", default=[0, 10, 100, 1000, 5000])
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "bench.db"
+        started = time.perf_counter()
+        seed(path, args.users)
+        print(f"{args.users} пользователей за {time.perf_counter() - started:.1f} с")
+        url = f"sqlite+aiosqlite:///{path}"
+        for title, filters in (
+            ("без фильтров", {}),
+            ("город + возраст 25-35 + рост от 165", {"city_ids": [7], "age_min": 25, "age_max": 35, "height_min": 165}),
+        ):
+            print(title)
+            asyncio.run(measure(url, args.depths, args.repeats, filters))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,185 @@
+"""
+Горячие запросы обработчиков на большой базе: без индексов из миграции add_lookup_indexes
+(как на базе, созданной до их появления в моделях) и после применения миграций.
+
+    cd api && python -m benchmarks.bench_indexes --users 200000 --repeat 50
+"""
+import argparse
+import random
+import sqlite3
+import statistics
+import tempfile
+import time
+from datetime import date, timedelta
+from pathlib import Path
+
+from sqlalchemy import create_engine, event, func, select, text, update
+from sqlalchemy.orm import Session, selectinload
+
+from constants import BodyType, Gender, PhotoType, Status
+from database.connect import apply_sqlite_pragmas
+from database.migrations import MIGRATIONS, add_lookup_indexes, run_migrations
+from database.models import AuthToken, Base, City, Photo, User, utc_now
+from utils.sessions import revoked_values
+from views.moderation import build_queue_query
+from views.users import build_feed_query
+
+
+LOOKUP_INDEXES = (
+    'idx_users_feed', 'idx_users_feed_city', 'idx_users_city_id',
+    'idx_photos_user_id', 'idx_photos_file_path', 'idx_auth_tokens_user_device', 'idx_auth_tokens_expires_at',
+)
+
+
+def seed(path: Path, users: int, cities: int):
+    engine = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(engine)
+    engine.dispose()
+
+    rnd = random.Random(1)
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=OFF")
+    conn.executemany(
+        "INSERT INTO cities (id, name, region) VALUES (?, ?, 'Регион')",
+        ((i, f"Город {i}") for i in range(1, cities + 1)),
+    )
+    body_types = [item.name for item in BodyType]
+    statuses = (Status.ACTIVE.name,) * 8 + (Status.PENDING.name, Status.INACTIVE.name)
+    conn.executemany(
+        "INSERT INTO users (id, email, name, birth_date, height, body_type, gender, city_id, status, created_at) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        (
+            (i, f"user{i}@example.com", "Анна", (date(1960, 1, 1) + timedelta(days=rnd.randint(0, 16000))).isoformat(),
+             rnd.randint(150, 200), rnd.choice(body_types), rnd.choice((Gender.MALE.name, Gender.FEMALE.name)),
+             rnd.randint(1, cities), rnd.choice(statuses), "2024-01-01 00:00:00")
+            for i in range(1, users + 1)
+        ),
+    )
+    conn.executemany(
+        "INSERT INTO photos (user_id, file_path, photo_type, created_at) VALUES (?, ?, ?, ?)",
+        (
+            (i, f"storage/blobs/00/{i}_{kind}.jpg", kind, "2024-01-01 00:00:00")
+            for i in range(1, users + 1)
+            for kind in (PhotoType.AVATAR.name, PhotoType.GALLERY.name)
+        ),
+    )
+    conn.executemany(
+        "INSERT INTO auth_tokens (user_id, token, is_active, created_at, expires_at) VALUES (?, ?, 1, ?, ?)",
+        (
+            # Истёкших, ждущих очистки, — малая доля
+            (i % users + 1, f"token-{i}", "2024-01-01 00:00:00",
+             "2024-02-01 00:00:00" if rnd.random() < 0.05 else "2099-01-01 00:00:00")
+            for i in range(users * 2)
+        ),
+    )
+    # База «до миграции»: индексов нет, версия схемы — предыдущая
+    for name in LOOKUP_INDEXES:
+        conn.execute(f"DROP INDEX IF EXISTS {name}")
+    conn.execute(f"PRAGMA user_version = {MIGRATIONS.index(add_lookup_indexes)}")
+    conn.commit()
+    conn.execute("ANALYZE")
+    conn.close()
+
+
+def hot_queries(users: int, cities: int):
+    # Те же выражения, что строят обработчики; параметры меняются от повтора к повтору
+    def feed(rnd):
+        return build_feed_query(rnd.choice(list(Gender)))
+
+    def feed_city(rnd):
+        return build_feed_query(rnd.choice(list(Gender)), city_ids=rnd.sample(range(1, cities + 1), 5))
+
+    def user_photos(rnd):
+        return select(User).options(selectinload(User.photos)).where(User.id == rnd.randint(1, users))
+
+    def revoke_sessions(rnd):
+        return (
+            update(AuthToken)
+            .where(AuthToken.user_id == rnd.randint(1, users), AuthToken.is_active.is_(True))
+            .values(**revoked_values())
+        )
+
+    def purge_sessions(rnd):
+        return select(AuthToken.token).where(AuthToken.expires_at <= utc_now()).limit(1000)
+
+    def photo_variants(rnd):
+        path = f"storage/blobs/00/{rnd.randint(1, users)}_{PhotoType.AVATAR.name}.jpg"
+        return select(Photo.file_path, Photo.variants).where(Photo.file_path.in_([path]), Photo.variants.is_not(None))
+
+    def city_counts(rnd):
+        users_count = select(User.city_id, func.count().label("total")).group_by(User.city_id).subquery()
+        return (
+            select(City.id, City.name, City.region, func.coalesce(users_count.c.total, 0))
+            .outerjoin(users_count, users_count.c.city_id == City.id)
+        )
+
+    def moderation_queue(rnd):
+        return build_queue_query(None, 51)
+
+    return {
+        "лента": feed,
+        "лента по городам": feed_city,
+        "анкета с фото": user_photos,
+        "отзыв сессий": revoke_sessions,
+        "истёкшие сессии": purge_sessions,
+        "копии фото по пути": photo_variants,
+        "анкет по городам": city_counts,
+        "очередь модерации": moderation_queue,
+    }
+
+
+def measure(path: Path, queries, repeat: int):
+    engine = create_engine(f"sqlite:///{path}")
+    event.listen(engine, "connect", apply_sqlite_pragmas)
+    results = {}
+    with Session(engine) as session:
+        for name, build in queries.items():
+            rnd = random.Random(2)
+            samples = []
+            for _ in range(repeat):
+                stmt = build(rnd)
+                started = time.perf_counter()
+                result = session.execute(stmt)
+                if stmt.is_select:
+                    result.unique().all()
+                samples.append(time.perf_counter() - started)
+                # Изменения не сохраняются: каждый повтор видит исходные данные
+                session.rollback()
+            results[name] = statistics.median(samples) * 1000
+    engine.dispose()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=200_000)
+    parser.add_argument("--cities", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "bench.db"
+        started = time.perf_counter()
+        seed(path, args.users, args.cities)
+        print(f"{args.users} анкет, {args.users * 2} фото и сессий за {time.perf_counter() - started:.1f} с")
+
+        queries = hot_queries(args.users, args.cities)
+        before = measure(path, queries, args.repeat)
+
+        engine = create_engine(f"sqlite:///{path}")
+        started = time.perf_counter()
+        with engine.begin() as conn:
+            run_migrations(conn)
+            version = conn.execute(text("PRAGMA user_version")).scalar()
+        engine.dispose()
+        print(f"миграции до версии {version} за {time.perf_counter() - started:.1f} с")
+
+        after = measure(path, queries, args.repeat)
+        print(f"{'запрос':<22}{'без индексов, мс':>18}{'с индексами, мс':>18}{'ускорение':>12}")
+        for name in queries:
+            print(f"{name:<22}{before[name]:>18.3f}{after[name]:>18.3f}{before[name] / after[name]:>11.0f}x")
+
+
+if __name__ == "__main__":
+    main()
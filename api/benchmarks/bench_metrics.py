@@ -0,0 +1,63 @@
+"""
+Накладные расходы метрик на запрос: MetricsMiddleware вокруг пустого ASGI-приложения против
+приложения без неё, плюс учёт одного SQL-запроса (observe_query).
+
+    cd api && python -m benchmarks.bench_metrics --requests 200000
+"""
+import argparse
+import asyncio
+import time
+from types import SimpleNamespace
+
+from utils.metrics import MetricsMiddleware, observe_query, registry
+
+
+ROUTE = SimpleNamespace(path="/api/v1/users/me/")
+START = {"type": "http.response.start", "status": 200, "headers": []}
+BODY = {"type": "http.response.body", "body": b"{}"}
+
+
+async def endpoint(scope, receive, send):
+    # Как маршрутизатор FastAPI: найденный маршрут кладётся в scope
+    scope["route"] = ROUTE
+    await send(START)
+    await send(BODY)
+
+
+async def receive():
+    return {"type": "http.request", "body": b"", "more_body": False}
+
+
+async def send(message):
+    pass
+
+
+async def per_request(app, requests: int) -> float:
+    started = time.perf_counter()
+    for _ in range(requests):
+        await app({"type": "http", "method": "GET", "path": "/api/v1/users/me/"}, receive, send)
+    return (time.perf_counter() - started) / requests * 1_000_000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=200_000)
+    args = parser.parse_args()
+
+    bare = asyncio.run(per_request(endpoint, args.requests))
+    measured = asyncio.run(per_request(MetricsMiddleware(endpoint), args.requests))
+    print(f"без метрик:    {bare:.2f} мкс на запрос")
+    print(f"с метриками:   {measured:.2f} мкс на запрос (+{measured - bare:.2f} мкс)")
+
+    started = time.perf_counter()
+    for _ in range(args.requests):
+        observe_query("SELECT 1", 0.0001)
+    print(f"observe_query: {(time.perf_counter() - started) / args.requests * 1_000_000:.2f} мкс на SQL-запрос")
+
+    started = time.perf_counter()
+    body = registry.render()
+    print(f"/metrics: {len(body)} байт за {(time.perf_counter() - started) * 1000:.2f} мс")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""
+Разбор очереди модерации: одобрение анкет пачками через views.moderation (страница очереди + UPDATE
+по множеству строк) против загрузки и изменения каждой анкеты через ORM.
+
+    cd api && python -m benchmarks.bench_moderation --users 100000 --page 500
+"""
+import argparse
+import asyncio
+import random
+import shutil
+import sqlite3
+import tempfile
+import time
+from datetime import date, timedelta
+from pathlib import Path
+from types import SimpleNamespace
+
+from sqlalchemy import create_engine, event, select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.orm import selectinload
+
+from constants import BodyType, Gender, PhotoType, Status
+from database.connect import apply_sqlite_pragmas
+from database.models import Base, User
+from schemas import ModerationDecision
+from views.moderation import approve, build_queue_query
+
+
+def seed(path: Path, users: int):
+    engine = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(engine)
+    engine.dispose()
+
+    rnd = random.Random(1)
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=OFF")
+    conn.execute("INSERT INTO cities (id, name, region) VALUES (1, 'Город', 'Регион')")
+    body_types = [item.name for item in BodyType]
+    conn.executemany(
+        "INSERT INTO users (id, email, name, birth_date, height, body_type, gender, city_id, status, created_at) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?, 1, ?, ?)",
+        (
+            (i, f"user{i}@example.com", "Анна", (date(1960, 1, 1) + timedelta(days=rnd.randint(0, 16000))).isoformat(),
+             rnd.randint(150, 200), rnd.choice(body_types), rnd.choice((Gender.MALE.name, Gender.FEMALE.name)),
+             Status.PENDING.name, "2024-01-01 00:00:00")
+            for i in range(1, users + 1)
+        ),
+    )
+    conn.executemany(
+        "INSERT INTO photos (user_id, file_path, photo_type, created_at) VALUES (?, ?, ?, ?)",
+        (
+            (i, f"storage/blobs/00/{i}_{kind}.jpg", kind, "2024-01-01 00:00:00")
+            for i in range(1, users + 1)
+            for kind in (PhotoType.VERIFICATION.name, PhotoType.PENDING.name)
+        ),
+    )
+    conn.commit()
+    conn.execute("ANALYZE")
+    conn.close()
+
+
+def sessions_for(path: Path):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+    event.listen(engine.sync_engine, "connect", apply_sqlite_pragmas)
+    return engine, async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False, autoflush=False)
+
+
+async def set_based(path: Path, page: int) -> float:
+    engine, sessions = sessions_for(path)
+    moderator = SimpleNamespace(id=0)
+    started = time.perf_counter()
+    cursor, cleared = None, 0
+    async with sessions() as db:
+        while True:
+            # Модератор смотрит страницу очереди и одобряет её целиком
+            rows = (await db.execute(build_queue_query(cursor, page))).all()
+            if not rows:
+                break
+            ids = sorted({row.id for row in rows})
+            result = await approve(ModerationDecision(user_ids=ids), moderator, db)
+            cleared += result.users
+            cursor = ids[-1]
+    elapsed = time.perf_counter() - started
+    await engine.dispose()
+    print(f"пачками по {page}: {cleared} анкет за {elapsed:.2f} с ({cleared / elapsed:,.0f} анкет/с)")
+    return elapsed
+
+
+async def per_row(path: Path, users: int, page: int) -> float:
+    engine, sessions = sessions_for(path)
+    started = time.perf_counter()
+    async with sessions() as db:
+        for first in range(1, users + 1, page):
+            ids = range(first, min(first + page, users + 1))
+            for user_id in ids:
+                stmt = select(User).options(selectinload(User.photos)).where(User.id == user_id)
+                user = (await db.scalars(stmt)).one()
+                user.status = Status.ACTIVE
+                for photo in user.photos:
+                    if photo.photo_type == PhotoType.PENDING:
+                        photo.photo_type = PhotoType.GALLERY
+            await db.commit()
+    elapsed = time.perf_counter() - started
+    await engine.dispose()
+    print(f"по одной через ORM: {users} анкет за {elapsed:.2f} с ({users / elapsed:,.0f} анкет/с)")
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=100_000)
+    parser.add_argument("--page", type=int, default=500)
+    parser.add_argument("--per-row-users", type=int, default=5000, help="ORM-вариант медленный, меряется на части очереди")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "bench.db"
+        started = time.perf_counter()
+        seed(path, args.users)
+        print(f"{args.users} анкет на модерации за {time.perf_counter() - started:.1f} с")
+        copy = Path(tmp) / "copy.db"
+        shutil.copy(path, copy)
+
+        fast = asyncio.run(set_based(path, args.page))
+        slow = asyncio.run(per_row(copy, args.per_row_users, args.page))
+        estimate = slow / args.per_row_users * args.users
+        print(f"оценка ORM на всю очередь: {estimate:.1f} с — в {estimate / fast:.0f} раз дольше")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+"""
+Пропускная способность входа: проверка PBKDF2 в цикле событий против пула процессов utils.hashing.
+Параллельно с входами идёт лёгкий запрос — по нему видно, насколько блокируется цикл событий.
+
+    cd api && python -m benchmarks.bench_password_hashing --logins 200 --workers 1 2 4
+"""
+import argparse
+import asyncio
+import time
+
+from config import HashingSettings
+from utils import hashing
+
+
+async def measure(verify, logins: int):
+    password_hash = hashing.get_context().hash("password123")
+    lags = []
+    done = asyncio.Event()
+
+    async def probe():
+        while not done.is_set():
+            started = time.perf_counter()
+            await asyncio.sleep(0.001)
+            lags.append(time.perf_counter() - started - 0.001)
+
+    probe_task = asyncio.create_task(probe())
+    started = time.perf_counter()
+    await asyncio.gather(*(verify("password123", password_hash) for _ in range(logins)))
+    elapsed = time.perf_counter() - started
+    done.set()
+    await probe_task
+    return logins / elapsed, max(lags) if lags else elapsed
+
+
+async def inline_verify(password: str, password_hash: str):
+    return hashing.get_context().verify_and_update(password, password_hash)
+
+
+def report(name: str, rate: float, lag: float):
+    print(f"{name:<16} {rate:>8.1f} logins/s  max loop stall={lag * 1000:.1f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--logins", type=int, default=200)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    args = parser.parse_args()
+
+    print(f"pbkdf2_sha256, раундов: {HashingSettings.rounds}")
+    report("event loop", *asyncio.run(measure(inline_verify, args.logins)))
+    for workers in args.workers:
+        HashingSettings.workers = workers
+        report(f"pool x{workers}", *asyncio.run(measure(hashing.verify_password, args.logins)))
+        hashing.shutdown()
+
+
+if __name__ == "__main__":
+    main()
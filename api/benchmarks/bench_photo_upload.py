@@ -0,0 +1,86 @@
+"""
+Запись загруженных фото: прежний shutil.copyfileobj по очереди против utils.uploads.save_photos.
+Каждый клиент загружает MAX_PHOTOS файлов за запрос.
+
+    cd api && python -m benchmarks.bench_photo_upload --clients 32 --size-kb 2048
+"""
+import argparse
+import asyncio
+import os
+import shutil
+import tempfile
+import time
+from pathlib import Path
+from tempfile import SpooledTemporaryFile
+
+from fastapi import UploadFile
+
+from constants import MAX_PHOTOS
+from utils import blobs
+from utils.uploads import save_photos
+
+
+def make_upload(payload: bytes, name: str) -> UploadFile:
+    # Как в Starlette: файл больше 1 МБ уже лежит на диске во временном файле
+    spooled = SpooledTemporaryFile(max_size=1024 * 1024)
+    spooled.write(payload)
+    spooled.seek(0)
+    return UploadFile(spooled, filename=name, size=len(payload))
+
+
+async def old_handler(uploads, directory: Path):
+    directory.mkdir(parents=True, exist_ok=True)
+    for i, upload in enumerate(uploads):
+        with open(directory / f"photo_{i}.jpg", "wb") as buffer:
+            shutil.copyfileobj(upload.file, buffer)
+
+
+async def new_handler(uploads, directory: Path):
+    # Временные файлы в storage/blobs текущего каталога; как после commit в обработчике — перенос в хранилище
+    staged = await save_photos(uploads)
+    await blobs.publish(staged)
+
+
+async def run(handler, root: Path, clients: int, payload: bytes):
+    requests = [[make_upload(payload, f"{i}.jpg") for i in range(MAX_PHOTOS)] for _ in range(clients)]
+    lags = []
+    done = asyncio.Event()
+
+    async def probe():
+        while not done.is_set():
+            started = time.perf_counter()
+            await asyncio.sleep(0.001)
+            lags.append(time.perf_counter() - started - 0.001)
+
+    probe_task = asyncio.create_task(probe())
+    started = time.perf_counter()
+    await asyncio.gather(*(handler(uploads, root / f"client_{n}") for n, uploads in enumerate(requests)))
+    elapsed = time.perf_counter() - started
+    done.set()
+    await probe_task
+    return elapsed, max(lags) if lags else elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--clients", type=int, default=32)
+    parser.add_argument("--size-kb", type=int, default=2048)
+    args = parser.parse_args()
+
+    payload = b'\xff\xd8\xff\xe0' + os.urandom(args.size_kb * 1024 - 4)
+    total_mb = len(payload) * MAX_PHOTOS * args.clients / 1024 / 1024
+    cwd = os.getcwd()
+    for name, handler in (("copyfileobj", old_handler), ("save_photos", new_handler)):
+        # Рабочий каталог — временный: storage/ бенчмарка не смешивается с рабочим
+        with tempfile.TemporaryDirectory() as tmp:
+            os.chdir(tmp)
+            try:
+                elapsed, lag = asyncio.run(run(handler, Path(tmp), args.clients, payload))
+            finally:
+                os.chdir(cwd)
+        print(f"{name:<12} {args.clients * MAX_PHOTOS / elapsed:>7.0f} фото/с  {total_mb / elapsed:>7.0f} МБ/с  "
+              f"max loop stall={lag * 1000:.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""
+Копии фото в WebP: сколько байт уходит на страницу ленты с оригиналами и с копиями,
+и сколько фото в секунду обрабатывает пул utils.images при разном числе процессов.
+
+    cd api && python -m benchmarks.bench_photo_variants --photos 48 --side 3000
+"""
+import argparse
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from constants import FEED_PAGE_SIZE, PHOTO_VARIANT_SIZES
+from utils.images import render_variants
+
+
+def make_photo(path: Path, side: int, seed: int):
+    # Градиенты с лёгким шумом: по размеру JPEG похоже на снимок с телефона
+    from PIL import Image
+
+    size = (side, side * 3 // 4)
+    channels = [
+        Image.linear_gradient("L").resize(size),
+        Image.radial_gradient("L").resize(size),
+        Image.linear_gradient("L").rotate(90 + seed).resize(size),
+    ]
+    image = Image.merge("RGB", channels)
+    noise = Image.effect_noise(size, 30).convert("RGB")
+    Image.blend(image, noise, 0.15).save(path, format="JPEG", quality=90)
+
+
+def run_pool(sources, workers: int) -> float:
+    started = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        list(executor.map(render_variants, sources))
+    return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--photos", type=int, default=48)
+    parser.add_argument("--side", type=int, default=3000, help="Длинная сторона исходника, px")
+    parser.add_argument("--photos-per-user", type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        root = Path(tmp)
+        sources = []
+        for i in range(args.photos):
+            path = root / f"photo_{i}.jpg"
+            make_photo(path, args.side, i)
+            sources.append(str(path))
+
+        variants = [render_variants(source) for source in sources[:4]]
+        originals = sum(os.path.getsize(source) for source in sources[:4]) / 4
+        per_page = FEED_PAGE_SIZE * args.photos_per_user
+        print(f"Страница ленты: {FEED_PAGE_SIZE} анкет x {args.photos_per_user} фото")
+        print(f"  original  {originals * per_page / 1024 / 1024:8.2f} МБ")
+        for size in sorted(PHOTO_VARIANT_SIZES, key=PHOTO_VARIANT_SIZES.get):
+            average = sum(os.path.getsize(v[size.value]) for v in variants) / len(variants)
+            print(f"  {size.value:<8}  {average * per_page / 1024 / 1024:8.2f} МБ  ({originals / average:.0f}x меньше)")
+
+        cores = os.cpu_count() or 1
+        print(f"\nКонвейер, {args.photos} фото {args.side}px, ядер: {cores}")
+        for workers in sorted({1, max(cores // 2, 1), cores}):
+            elapsed = run_pool(sources, workers)
+            rate = args.photos / elapsed
+            print(f"  процессов {workers:>2}: {rate:6.1f} фото/с, {rate / workers:6.1f} фото/с на процесс")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+"""
+Стоимость сериализации анкеты и страницы ленты: прежний путь FastAPI (модель UserData, повторная
+проверка по response_model, json.dumps в JSONResponse) против utils.responses (ORM -> dict -> orjson).
+
+    cd api && DATABASE_NAME=tmp python -m benchmarks.bench_serialization --rounds 2000
+"""
+import argparse
+import asyncio
+import json
+import time
+from datetime import date
+from urllib.parse import urljoin
+
+from fastapi import Request
+from fastapi.responses import JSONResponse
+from fastapi.routing import APIRoute, serialize_response
+
+from constants import BodyType, Gender, PhotoSize, PhotoType, Status, FEED_PAGE_SIZE
+from database.models import City, Photo, User
+from schemas import FeedPage, UserData
+from utils.common import calculate_age
+from utils.responses import feed_response, user_response
+from views.users import router
+
+
+def make_users(count: int):
+    city = City(id=1, name="Нижний Новгород", region="Нижегородская область")
+    users = []
+    for i in range(1, count + 1):
+        user = User(
+            id=i, email=f"user{i}@example.com", name="Анна", birth_date=date(1990, 5, i % 28 + 1), height=170,
+            body_type=BodyType.SLIM, gender=Gender.FEMALE, city_id=1, status=Status.ACTIVE,
+            bio="Люблю горы и кино", desires=None,
+        )
+        user.city = city
+        digest = f"{i:064x}"
+        user.photos = [
+            Photo(id=i * 10 + n, user_id=i, file_path=f"storage/blobs/{digest[:2]}/{digest}.jpg", photo_type=kind,
+                  variants={size.value: f"storage/blobs/{digest[:2]}/{digest}_{size.value}.{digest[:16]}.webp"
+                            for size in PhotoSize if size != PhotoSize.ORIGINAL})
+            for n, kind in enumerate((PhotoType.AVATAR, PhotoType.VERIFICATION, PhotoType.GALLERY, PhotoType.GALLERY))
+        ]
+        users.append(user)
+    return users
+
+
+def legacy_user_data(request: Request, user: User, size: PhotoSize) -> UserData:
+    # get_user_data до перехода на utils.responses
+    avatar = ''
+    photos = []
+    base_url = str(request.base_url)
+    for img in user.photos:
+        file_path = img.file_path
+        if size != PhotoSize.ORIGINAL and img.variants:
+            file_path = img.variants.get(size.value, file_path)
+        full_path = urljoin(base_url, file_path)
+        if img.photo_type == PhotoType.AVATAR:
+            avatar = full_path
+        elif img.photo_type == PhotoType.VERIFICATION:
+            continue
+        photos.append(full_path)
+    return UserData(
+        id=user.id, email=user.email, name=user.name, age=calculate_age(user.birth_date), status=user.status,
+        height=user.height, body_type=user.body_type, gender=user.gender, city=user.city.full_name,
+        city_id=user.city_id, avatar=avatar, photos=photos, bio=user.bio, desires=user.desires,
+    )
+
+
+async def legacy_response(route: APIRoute, content) -> bytes:
+    # То же, что делает FastAPI с возвращённой моделью при заданном response_model
+    serialized = await serialize_response(
+        field=route.response_field, response_content=content, exclude=route.response_model_exclude,
+    )
+    return JSONResponse(serialized).body
+
+
+def timed(rounds: int, run) -> float:
+    started = time.perf_counter()
+    for _ in range(rounds):
+        run()
+    return (time.perf_counter() - started) / rounds * 1_000_000
+
+
+async def timed_async(rounds: int, run) -> float:
+    started = time.perf_counter()
+    for _ in range(rounds):
+        await run()
+    return (time.perf_counter() - started) / rounds * 1_000_000
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rounds", type=int, default=2000)
+    parser.add_argument("--page", type=int, default=FEED_PAGE_SIZE)
+    args = parser.parse_args()
+
+    request = Request({
+        "type": "http", "scheme": "http", "server": ("api.example.com", 80), "root_path": "",
+        "path": "/", "query_string": b"", "headers": [],
+    })
+    routes = {route.path: route for route in router.routes if isinstance(route, APIRoute)}
+    me_route, feed_route = routes["/users/me/"], routes["/users/feed/"]
+    users = make_users(args.page)
+    user = users[0]
+
+    def legacy_page():
+        return FeedPage(items=[legacy_user_data(request, item, PhotoSize.CARD) for item in users], next_cursor=1)
+
+    # Ответы совпадают по содержанию, меняется только способ сериализации
+    assert json.loads(await legacy_response(feed_route, legacy_page())) == \
+        json.loads(feed_response(request, users, 1, PhotoSize.CARD).body)
+    assert json.loads(await legacy_response(me_route, legacy_user_data(request, user, PhotoSize.ORIGINAL))) == \
+        json.loads(user_response(request, user).body)
+
+    legacy_profile = await timed_async(
+        args.rounds, lambda: legacy_response(me_route, legacy_user_data(request, user, PhotoSize.ORIGINAL))
+    )
+    fast_profile = timed(args.rounds, lambda: user_response(request, user, PhotoSize.ORIGINAL))
+
+    page_rounds = max(args.rounds // args.page, 50)
+    legacy_page_us = await timed_async(page_rounds, lambda: legacy_response(feed_route, legacy_page()))
+    fast_page_us = timed(page_rounds, lambda: feed_response(request, users, 1, PhotoSize.CARD))
+
+    print(f"{'':<28}{'UserData + FastAPI, мкс':>26}{'utils.responses, мкс':>22}{'ускорение':>12}")
+    print(f"{'анкета /users/me/':<28}{legacy_profile:>26.1f}{fast_profile:>22.1f}{legacy_profile / fast_profile:>11.1f}x")
+    print(f"{f'страница ленты ({args.page} анкет)':<28}{legacy_page_us:>26.1f}{fast_page_us:>22.1f}"
+          f"{legacy_page_us / fast_page_us:>11.1f}x")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,95 @@
+"""
+Конкуренция писателей SQLite: настройки по умолчанию против профиля DatabaseSettings.
+Каждый процесс имитирует воркер uvicorn: читает и обновляет случайных пользователей.
+
+    cd api && python -m benchmarks.bench_sqlite_writers --workers 8 --transactions 300
+"""
+import argparse
+import random
+import tempfile
+import time
+from dataclasses import replace
+from datetime import date
+from multiprocessing import Pool
+from pathlib import Path
+
+from sqlalchemy import create_engine, event, select, update
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import sessionmaker
+
+from config import DatabaseSettings
+from constants import BodyType, Gender
+from database.connect import apply_sqlite_pragmas, engine_options
+from database.models import Base, City, User
+
+
+USERS = 1000
+# Значения SQLite и pysqlite по умолчанию (timeout=5 с)
+DEFAULT_PROFILE = DatabaseSettings(
+    echo=False, journal_mode="DELETE", synchronous="FULL", busy_timeout=5000, cache_size=-2000, mmap_size=0,
+)
+
+
+def make_engine(url: str, settings: DatabaseSettings):
+    engine = create_engine(url, **engine_options(settings))
+    event.listen(engine, "connect", lambda conn, record: apply_sqlite_pragmas(conn, record, settings))
+    return engine
+
+
+def seed(url: str):
+    engine = create_engine(url)
+    Base.metadata.create_all(engine)
+    with sessionmaker(engine)() as db:
+        db.add(City(id=1, name="Москва", region="Москва и Московская обл."))
+        db.add_all(
+            User(email=f"user{i}@example.com", name="Анна", birth_date=date(1995, 5, 15), height=170,
+                 body_type=BodyType.SLIM, gender=Gender.FEMALE, city_id=1)
+            for i in range(USERS)
+        )
+        db.commit()
+    engine.dispose()
+
+
+def worker(args):
+    url, settings, transactions = args
+    engine = make_engine(url, settings)
+    SessionLocal = sessionmaker(engine)
+    done = locked = 0
+    for _ in range(transactions):
+        try:
+            with SessionLocal() as db:
+                db.scalars(select(User).where(User.id == random.randint(1, USERS))).one()
+                db.execute(update(User).where(User.id == random.randint(1, USERS)).values(height=random.randint(150, 200)))
+                db.commit()
+            done += 1
+        except OperationalError:
+            locked += 1
+    engine.dispose()
+    return done, locked
+
+
+def run(name: str, settings: DatabaseSettings, workers: int, transactions: int):
+    with tempfile.TemporaryDirectory() as tmp:
+        url = f"sqlite:///{Path(tmp) / 'bench.db'}"
+        seed(url)
+        started = time.perf_counter()
+        with Pool(workers) as pool:
+            results = pool.map(worker, [(url, settings, transactions)] * workers)
+        elapsed = time.perf_counter() - started
+    done = sum(r[0] for r in results)
+    locked = sum(r[1] for r in results)
+    print(f"{name:<10} {done / elapsed:>8.0f} tx/s  committed={done}  'database is locked'={locked}  {elapsed:.2f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--transactions", type=int, default=300)
+    args = parser.parse_args()
+
+    run("default", DEFAULT_PROFILE, args.workers, args.transactions)
+    run("profile", replace(DatabaseSettings(), echo=False), args.workers, args.transactions)
+
+
+if __name__ == "__main__":
+    main()
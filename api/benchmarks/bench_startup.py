@@ -0,0 +1,123 @@
+"""
+Время запуска воркера: импорт main, сборка приложения (create_app), lifespan (таблицы и миграции,
+каталог городов) и первый ответ — каждый запуск в новом интерпретаторе, на пустой и на готовой базе.
+Плюс самые дорогие при импорте модули проекта (python -X importtime).
+
+    cd api && python -m benchmarks.bench_startup --runs 5
+"""
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+
+API_DIR = Path(__file__).resolve().parent.parent
+PROJECT_MODULES = re.compile(r"^(main|config|constants|schemas|views|utils|database)(\.|$)")
+
+# Выполняется в дочернем процессе; httpx импортируется до замеров — он нужен только клиенту
+CHILD = """
+import asyncio, json, time
+import httpx
+started = time.perf_counter()
+import main
+imported = time.perf_counter()
+app = main.create_app()
+created = time.perf_counter()
+
+async def serve():
+    from database.connect import async_engine
+    async with app.router.lifespan_context(app):
+        ready = time.perf_counter()
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            response = await client.get("/api/v1/cities/")
+        answered = time.perf_counter()
+    await async_engine.dispose()
+    assert response.status_code == 200, response.text
+    return ready, answered
+
+ready, answered = asyncio.run(serve())
+print(json.dumps({
+    "import main": imported - started,
+    "create_app": created - imported,
+    "lifespan": ready - created,
+    "первый ответ": answered - ready,
+}))
+"""
+
+PHASES = ("import main", "create_app", "lifespan", "первый ответ")
+
+
+def run_python(args, workdir: Path) -> tuple:
+    env = {**os.environ, "PYTHONPATH": str(API_DIR), "DATABASE_NAME": "bench_startup", "SMTP_SERVER": ""}
+    started = time.perf_counter()
+    result = subprocess.run([sys.executable, *args], cwd=workdir, env=env, capture_output=True, text=True, check=True)
+    return time.perf_counter() - started, result
+
+
+def interpreter_baseline(workdir: Path, code: str, runs: int) -> float:
+    return statistics.median(run_python(["-c", code], workdir)[0] for _ in range(runs))
+
+
+def cold_start(workdir: Path, runs: int, fresh_db: bool) -> dict:
+    samples = {phase: [] for phase in (*PHASES, "процесс целиком")}
+    for _ in range(runs):
+        if fresh_db:
+            for path in (workdir / "database").glob("bench_startup.db*"):
+                path.unlink()
+        wall, result = run_python(["-c", CHILD], workdir)
+        phases = json.loads(result.stdout.strip().splitlines()[-1])
+        for phase, value in phases.items():
+            samples[phase].append(value)
+        samples["процесс целиком"].append(wall)
+    return {phase: statistics.median(values) * 1000 for phase, values in samples.items()}
+
+
+def heaviest_modules(workdir: Path, limit: int) -> list:
+    # Собственное время импорта модулей проекта (без вложенных импортов), мкс
+    _, result = run_python(["-X", "importtime", "-c", "import main; main.create_app()"], workdir)
+    modules = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        own, _, name = line.removeprefix("import time:").split("|")
+        name = name.strip()
+        if PROJECT_MODULES.match(name):
+            modules.append((int(own), name))
+    return sorted(modules, reverse=True)[:limit]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--modules", type=int, default=10, help="сколько самых дорогих модулей показать")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # Отдельный рабочий каталог: база и storage/ бенчмарка не смешиваются с рабочими
+        workdir = Path(tmp)
+        (workdir / "database").mkdir()
+
+        print(f"python -c pass:      {interpreter_baseline(workdir, 'pass', args.runs) * 1000:8.1f} мс")
+        print(f"import fastapi:      {interpreter_baseline(workdir, 'import fastapi', args.runs) * 1000:8.1f} мс")
+        print(f"import main:         {interpreter_baseline(workdir, 'import main', args.runs) * 1000:8.1f} мс")
+
+        fresh = cold_start(workdir, args.runs, fresh_db=True)
+        ready = cold_start(workdir, args.runs, fresh_db=False)
+        print(f"\n{'фаза, мс':<20}{'пустая база':>14}{'готовая база':>14}")
+        for phase in fresh:
+            print(f"{phase:<20}{fresh[phase]:>14.1f}{ready[phase]:>14.1f}")
+
+        print("\nсамые дорогие модули проекта при импорте (собственное время):")
+        for own, name in heaviest_modules(workdir, args.modules):
+            print(f"  {own / 1000:7.1f} мс  {name}")
+
+
+if __name__ == "__main__":
+    main()
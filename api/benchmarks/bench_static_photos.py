@@ -0,0 +1,87 @@
+"""
+Отдача фото: прежний StaticFiles против utils.static.PhotoStaticFiles.
+Сценарии: первый просмотр (полный GET), повторный просмотр с If-None-Match и запрос Range.
+Запросы идут через ASGI без сети, поэтому цифры — нагрузка на само приложение.
+
+    cd api && python -m benchmarks.bench_static_photos --requests 2000 --size-kb 120
+"""
+import argparse
+import asyncio
+import hashlib
+import os
+import tempfile
+import time
+from pathlib import Path
+
+import httpx
+from starlette.applications import Starlette
+from starlette.routing import Mount
+from starlette.staticfiles import StaticFiles
+
+from constants import PHOTO_HASH_LENGTH
+from utils.static import PhotoStaticFiles
+
+
+async def run(app, url: str, requests: int, concurrency: int, headers=None):
+    transport = httpx.ASGITransport(app=app)
+    sent = 0
+    statuses = set()
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        queue = iter(range(requests))
+
+        async def worker():
+            nonlocal sent
+            for _ in queue:
+                response = await client.get(url, headers=headers)
+                sent += len(response.content)
+                statuses.add(response.status_code)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+    return requests / elapsed, sent / requests, statuses
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--size-kb", type=int, default=120)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        payload = os.urandom(args.size_kb * 1024)
+        digest = hashlib.sha256(payload).hexdigest()[:PHOTO_HASH_LENGTH]
+        name = f"photo_card.{digest}.webp"
+        Path(tmp, name).write_bytes(payload)
+
+        apps = {
+            "StaticFiles": Starlette(routes=[Mount("/storage", StaticFiles(directory=tmp))]),
+            "PhotoStaticFiles": Starlette(routes=[Mount("/storage", PhotoStaticFiles(directory=tmp))]),
+        }
+        url = f"/storage/{name}"
+
+        for label, app in apps.items():
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+                first = await client.get(url)
+            etag = first.headers["etag"]
+            print(f"{label}: cache-control={first.headers.get('cache-control')!r} etag={etag}")
+
+            scenarios = {
+                "полный GET": None,
+                "If-None-Match": {"If-None-Match": etag},
+                "Range 64 КБ": {"Range": "bytes=0-65535"},
+            }
+            for scenario, headers in scenarios.items():
+                rps, per_request, statuses = await run(app, url, args.requests, args.concurrency, headers)
+                print(f"  {scenario:<14} {rps:8.0f} rps  {per_request / 1024:8.1f} КБ/запрос  статусы {sorted(statuses)}")
+
+        print(
+            "\nС immutable браузер не перепроверяет фото до истечения max-age: "
+            "повторный просмотр анкеты не доходит до сервера вовсе (0 запросов, 0 байт)."
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
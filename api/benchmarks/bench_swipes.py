@@ -0,0 +1,203 @@
+"""
+Свайпы на SQLite в режиме WAL: запись каждого свайпа своей транзакцией против буфера SwipeBuffer,
+сбрасываемого пачками. Параллельные «запросы» выполняют то же, что POST /swipes/: проверку анкеты
+и встречного свайпа (swipe_state_query) и добавление свайпа. Печатаются свайпов в секунду, задержка
+проверки взаимности в обработчике и время сброса пачки; в конце число пар в matches сверяется
+с парами взаимных лайков в swipes.
+
+    cd api && python -m benchmarks.bench_swipes --users 20000 --existing 200000 --swipes 20000
+"""
+import argparse
+import asyncio
+import random
+import sqlite3
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+from config import DatabaseSettings, SwipeSettings
+from database.connect import apply_sqlite_pragmas, engine_options
+from database.models import Base
+from utils.swipes import SwipeBuffer, swipe_state_query
+
+
+MUTUAL_PAIRS = (
+    "SELECT count(*) FROM swipes AS a JOIN swipes AS b ON b.user_id = a.target_id AND b.target_id = a.user_id "
+    "WHERE a.liked AND b.liked AND a.user_id < a.target_id"
+)
+
+
+def seed(path: Path, users: int, existing: int, rnd: random.Random) -> dict:
+    engine = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(engine)
+    engine.dispose()
+
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=OFF")
+    conn.execute("INSERT INTO cities (id, name, region) VALUES (1, 'Город', 'Регион')")
+    conn.executemany(
+        "INSERT INTO users (id, email, name, birth_date, height, body_type, gender, city_id, status, created_at) "
+        "VALUES (?, ?, 'Анна', '1990-01-01', 170, 'SLIM', ?, 1, 'ACTIVE', '2024-01-01 00:00:00')",
+        ((i, f"user{i}@example.com", 'MALE' if i % 2 else 'FEMALE') for i in range(1, users + 1)),
+    )
+    swipes = {}
+    while len(swipes) < existing:
+        user_id, target_id = rnd.randint(1, users), rnd.randint(1, users)
+        if user_id != target_id:
+            swipes.setdefault((user_id, target_id), rnd.random() < 0.5)
+    conn.executemany(
+        "INSERT INTO swipes (user_id, target_id, liked, created_at) VALUES (?, ?, ?, '2024-01-01 00:00:00')",
+        ((user_id, target_id, liked) for (user_id, target_id), liked in sorted(swipes.items())),
+    )
+    # Взаимные лайки исходных данных уже совпали: matches согласована со swipes
+    conn.execute(
+        "INSERT INTO matches (user_id, matched_id, created_at) SELECT a.user_id, a.target_id, '2024-01-01 00:00:00' "
+        "FROM swipes AS a JOIN swipes AS b ON b.user_id = a.target_id AND b.target_id = a.user_id "
+        "WHERE a.liked AND b.liked"
+    )
+    conn.commit()
+    conn.execute("ANALYZE")
+    conn.close()
+    return swipes
+
+
+def workload(rnd: random.Random, users: int, count: int, taken: dict, mutual: float) -> list:
+    # Доля mutual — ответ на чужой лайк (из исходных данных или этой же нагрузки): будущие совпадения
+    likes = [key for key, liked in taken.items() if liked]
+    swipes = []
+    while len(swipes) < count:
+        if likes and rnd.random() < mutual:
+            target_id, user_id = likes[rnd.randrange(len(likes))]
+            liked = True
+        else:
+            user_id, target_id = rnd.randint(1, users), rnd.randint(1, users)
+            liked = rnd.random() < 0.5
+        if user_id == target_id or (user_id, target_id) in taken:
+            continue
+        taken[(user_id, target_id)] = liked
+        swipes.append((user_id, target_id, liked))
+        if liked:
+            likes.append((user_id, target_id))
+    return swipes
+
+
+async def run(sessions, buffer: SwipeBuffer, swipes: list, concurrency: int) -> tuple:
+    # Как обработчик: проверка анкеты и встречного свайпа в базе и в буфере, затем свайп в буфер
+    checks = []
+    matched = 0
+
+    async def worker(part):
+        nonlocal matched
+        for user_id, target_id, liked in part:
+            started = time.perf_counter()
+            async with sessions() as db:
+                state = (await db.execute(swipe_state_query(user_id, target_id))).first()
+            theirs = state.theirs if state.theirs is not None else buffer.pending(target_id, user_id)
+            checks.append(time.perf_counter() - started)
+            matched += bool(liked and theirs)
+            await buffer.add(user_id, target_id, liked)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(swipes[i::concurrency]) for i in range(concurrency)))
+    # Учитывается и запись остатка буфера
+    await buffer.stop()
+    return time.perf_counter() - started, checks, matched
+
+
+def percentile(samples: list, fraction: float) -> float:
+    samples = sorted(samples)
+    return samples[min(int(len(samples) * fraction), len(samples) - 1)]
+
+
+def report(title: str, count: int, elapsed: float, checks: list, matched: int, buffer: SwipeBuffer):
+    print(
+        f"{title:<34}{count / elapsed:>10.0f} свайпов/с  проверка взаимности p50 {statistics.median(checks) * 1000:6.2f} мс"
+        f"  p99 {percentile(checks, 0.99) * 1000:6.2f} мс  совпадений сразу/при сбросе: {matched}/{buffer.matched},"
+        f" пачек: {buffer.flushes}"
+    )
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=20000)
+    parser.add_argument("--existing", type=int, default=200000, help="свайпов в базе до замера")
+    parser.add_argument("--swipes", type=int, default=20000, help="свайпов через буфер")
+    parser.add_argument("--direct", type=int, default=2000, help="свайпов с транзакцией на каждый: медленно, хватит меньшей выборки")
+    parser.add_argument("--concurrency", type=int, default=50, help="одновременных запросов")
+    parser.add_argument("--mutual", type=float, default=0.2, help="доля ответов на чужой лайк")
+    args = parser.parse_args()
+
+    rnd = random.Random(1)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "bench.db"
+        started = time.perf_counter()
+        taken = seed(path, args.users, args.existing, rnd)
+        print(f"база: {args.users} анкет, {args.existing} свайпов за {time.perf_counter() - started:.1f} с")
+
+        async_engine = create_async_engine(f"sqlite+aiosqlite:///{path}", **engine_options())
+        event.listen(async_engine.sync_engine, "connect", apply_sqlite_pragmas)
+        sessions = async_sessionmaker(async_engine, class_=AsyncSession, expire_on_commit=False)
+        settings = DatabaseSettings()
+        print(f"journal_mode={settings.journal_mode} synchronous={settings.synchronous}, запросов одновременно: {args.concurrency}\n")
+
+        # Задержка самой проверки, без очереди из одновременных запросов: анкета и два поиска по ключу
+        checks = []
+        for _ in range(2000):
+            user_id, target_id = rnd.randint(1, args.users), rnd.randint(1, args.users)
+            started = time.perf_counter()
+            async with sessions() as db:
+                (await db.execute(swipe_state_query(user_id, target_id))).first()
+            checks.append(time.perf_counter() - started)
+        print(
+            f"{'проверка взаимности без нагрузки':<34}p50 {statistics.median(checks) * 1000:6.3f} мс"
+            f"  p99 {percentile(checks, 0.99) * 1000:6.3f} мс"
+        )
+
+        # Без запущенной фоновой задачи add записывает каждый свайп сразу: транзакция на свайп
+        direct = workload(rnd, args.users, args.direct, taken, args.mutual)
+        buffer = SwipeBuffer(SwipeSettings(), sessions)
+        elapsed, checks, matched = await run(sessions, buffer, direct, args.concurrency)
+        report("транзакция на свайп", len(direct), elapsed, checks, matched, buffer)
+
+        buffered = workload(rnd, args.users, args.swipes, taken, args.mutual)
+        buffer = SwipeBuffer(SwipeSettings(), sessions)
+        buffer.start()
+        elapsed, checks, matched = await run(sessions, buffer, buffered, args.concurrency)
+        report(f"буфер (пачка до {buffer.settings.batch_size})", len(buffered), elapsed, checks, matched, buffer)
+
+        # Только запись пачками, без проверок в обработчике: предел самого буфера
+        only_writes = workload(rnd, args.users, args.swipes, taken, args.mutual)
+        buffer = SwipeBuffer(SwipeSettings(), sessions)
+        buffer.start()
+        flushes = []
+        started = time.perf_counter()
+        for user_id, target_id, liked in only_writes:
+            await buffer.add(user_id, target_id, liked)
+            if len(buffer) >= buffer.settings.batch_size:
+                flush_started = time.perf_counter()
+                await buffer.flush()
+                flushes.append(time.perf_counter() - flush_started)
+        await buffer.stop()
+        elapsed = time.perf_counter() - started
+        print(
+            f"{'запись пачками':<34}{len(only_writes) / elapsed:>10.0f} свайпов/с  сброс пачки p50 "
+            f"{statistics.median(flushes) * 1000:6.2f} мс  p99 {percentile(flushes, 0.99) * 1000:6.2f} мс"
+        )
+        await async_engine.dispose()
+
+        conn = sqlite3.connect(path)
+        mutual_pairs = conn.execute(MUTUAL_PAIRS).fetchone()[0]
+        match_rows = conn.execute("SELECT count(*) FROM matches").fetchone()[0]
+        swipe_rows = conn.execute("SELECT count(*) FROM swipes").fetchone()[0]
+        conn.close()
+        print(f"\nswipes: {swipe_rows} строк, пар взаимных лайков: {mutual_pairs}, строк matches: {match_rows} (по две на пару)")
+        assert match_rows == mutual_pairs * 2, "matches расходится со swipes"
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
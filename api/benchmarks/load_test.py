@@ -0,0 +1,349 @@
+"""
+Нагрузочный тест API: виртуальные пользователи выполняют смесь сценариев (регистрация с верификацией,
+вход, /users/me/, поиск города, загрузка фото) в приложении внутри процесса или на локальном uvicorn.
+Результат — JSON с пропускной способностью и перцентилями задержек по маршрутам, его удобно сравнивать
+между релизами (--compare).
+
+    cd api && python -m utils.seed_users --users 100000
+    cd api && python -m benchmarks.load_test --target asgi --duration 30 --concurrency 16 --output load.json
+    cd api && python -m benchmarks.load_test --target uvicorn --mix me=60,cities=20,login=10,upload=5,registration=5
+    cd api && python -m benchmarks.load_test --target http://127.0.0.1:8000 --compare load.json
+"""
+import argparse
+import asyncio
+import io
+import json
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+import httpx
+
+from constants import MAX_PHOTOS
+
+
+DEFAULT_MIX = "me=50,cities=25,login=10,upload=8,registration=7"
+CITY_QUERIES = ("мос", "санкт", "нижн", "екат", "новос", "каз", "сам", "рост", "уф", "крас", "ворон", "пер")
+PERCENTILES = (50, 90, 95, 99)
+API = "/api/v1"
+
+
+@dataclass
+class RouteStats:
+    latencies: List[float] = field(default_factory=list)
+    statuses: Dict[int, int] = field(default_factory=lambda: defaultdict(int))
+    errors: int = 0
+
+    def report(self, duration: float) -> dict:
+        samples = sorted(self.latencies)
+        result = {
+            "requests": len(samples),
+            "errors": self.errors,
+            "rps": round(len(samples) / duration, 2),
+            "statuses": {str(code): count for code, count in sorted(self.statuses.items())},
+        }
+        if samples:
+            result["mean_ms"] = round(sum(samples) / len(samples) * 1000, 3)
+            for p in PERCENTILES:
+                # Ближайший ранг: p-й перцентиль — значение, не меньше которого p% выборки
+                result[f"p{p}_ms"] = round(samples[max(0, -(-len(samples) * p // 100) - 1)] * 1000, 3)
+            result["max_ms"] = round(samples[-1] * 1000, 3)
+        return result
+
+
+class LoadTest:
+    def __init__(self, client: httpx.AsyncClient, accounts: List[dict], password: str, mix: Dict[str, int], seed: int):
+        self.client = client
+        self.accounts = accounts
+        self.password = password
+        self.actions = list(mix)
+        self.weights = list(mix.values())
+        self.rnd = random.Random(seed)
+        self.stats: Dict[str, RouteStats] = defaultdict(RouteStats)
+        self.images = [image_bytes(self.rnd) for _ in range(8)]
+        self.registered = 0
+
+    async def request(self, route: str, method: str, url: str, expected: int = 200, **kwargs) -> Optional[httpx.Response]:
+        started = time.perf_counter()
+        try:
+            response = await self.client.request(method, url, **kwargs)
+        except httpx.HTTPError:
+            self.stats[route].errors += 1
+            return None
+        self.stats[route].latencies.append(time.perf_counter() - started)
+        self.stats[route].statuses[response.status_code] += 1
+        if response.status_code != expected:
+            self.stats[route].errors += 1
+        return response
+
+    async def login(self, session: dict) -> None:
+        # Аккаунт берётся из общего списка: у каждого виртуального пользователя свой
+        account = self.accounts.pop()
+        response = await self.request("POST /login/", "POST", f"{API}/login/",
+                                      data={"username": account["email"], "password": self.password})
+        session["account"] = account
+        if response is not None and response.status_code == 200:
+            session["headers"] = {"Authorization": f"Bearer {response.json()['access_token']}"}
+        else:
+            session["headers"] = {}
+        self.accounts.insert(0, account)
+
+    async def me(self, session: dict) -> None:
+        await self.request("GET /users/me/", "GET", f"{API}/users/me/", headers=session["headers"])
+
+    async def cities(self, session: dict) -> None:
+        query = self.rnd.choice(CITY_QUERIES)
+        await self.request("GET /cities/search", "GET", f"{API}/cities/search", params={"q": query})
+
+    async def upload(self, session: dict) -> None:
+        account = session["account"]
+        if account["photos"] >= MAX_PHOTOS:
+            # Лимит фото исчерпан: дальше работаем под другой анкетой, как новый посетитель
+            await self.login(session)
+            account = session["account"]
+            if account["photos"] >= MAX_PHOTOS:
+                return
+        response = await self.request(
+            "POST /users/photos/upload/", "POST", f"{API}/users/photos/upload/", headers=session["headers"],
+            files=[("photos", ("photo.jpg", self.rnd.choice(self.images), "image/jpeg"))],
+        )
+        if response is not None and response.status_code == 200:
+            account["photos"] += 1
+
+    async def registration(self, session: dict) -> None:
+        self.registered += 1
+        gender = self.rnd.choice(("male", "female"))
+        response = await self.request("POST /registration/", "POST", f"{API}/registration/", expected=201, json={
+            "email": f"load-{os.getpid()}-{time.time_ns()}-{self.registered}@example.com",
+            "name": "Нагрузка",
+            "birth_date": f"{self.rnd.randint(1960, 2004)}-0{self.rnd.randint(1, 9)}-1{self.rnd.randint(0, 9)}",
+            "height": self.rnd.randint(150, 200),
+            "body_type": self.rnd.choice(("average", "slim", "athletic")),
+            "gender": gender,
+            "city_id": self.rnd.choice(self.accounts)["city_id"],
+            "device_info": {"os": "load-test"},
+        })
+        if response is None or response.status_code != 201:
+            return
+        await self.request("POST /verification/", "POST", f"{API}/verification/",
+                           data={"user_id": response.json()["user_id"]}, files={
+                               "avatar": ("avatar.jpg", self.rnd.choice(self.images), "image/jpeg"),
+                               "verification_photo": ("selfie.jpg", self.rnd.choice(self.images), "image/jpeg"),
+                           })
+
+    async def virtual_user(self, deadline: float) -> None:
+        session: dict = {}
+        await self.login(session)
+        while time.perf_counter() < deadline:
+            action = self.rnd.choices(self.actions, self.weights)[0]
+            if action == "login":
+                await self.login(session)
+            else:
+                await getattr(self, action)(session)
+
+    async def run(self, concurrency: int, duration: float) -> float:
+        started = time.perf_counter()
+        deadline = started + duration
+        await asyncio.gather(*(self.virtual_user(deadline) for _ in range(concurrency)))
+        return time.perf_counter() - started
+
+
+def image_bytes(rnd: random.Random) -> bytes:
+    from PIL import Image
+
+    buffer = io.BytesIO()
+    color = (rnd.randrange(256), rnd.randrange(256), rnd.randrange(256))
+    Image.new("RGB", (640, 800), color).save(buffer, format="JPEG", quality=85)
+    return buffer.getvalue()
+
+
+def load_accounts(limit: int) -> List[dict]:
+    # Анкеты из utils.seed_users: у всех известный пароль
+    from database.connect import engine
+    from utils.seed_users import SEED_EMAIL_DOMAIN
+
+    with engine.connect() as conn:
+        rows = conn.exec_driver_sql(
+            "SELECT users.email, users.city_id, (SELECT count(*) FROM photos WHERE photos.user_id = users.id) "
+            "FROM users WHERE users.email LIKE ? AND users.status = 'ACTIVE' ORDER BY random() LIMIT ?",
+            (f"%@{SEED_EMAIL_DOMAIN}", limit),
+        ).all()
+    engine.dispose()
+    return [{"email": email, "city_id": city_id, "photos": photos} for email, city_id, photos in rows]
+
+
+def parse_mix(value: str) -> Dict[str, int]:
+    mix = {}
+    for item in value.split(","):
+        name, _, weight = item.partition("=")
+        if name not in ("me", "cities", "login", "upload", "registration"):
+            raise argparse.ArgumentTypeError(f"неизвестный сценарий: {name}")
+        mix[name] = int(weight)
+    return mix
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@asynccontextmanager
+async def asgi_client():
+    # Приложение в том же процессе: без сети и сериализации HTTP, lifespan запускается вручную
+    from database.connect import async_engine
+    from main import app
+
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://loadtest", timeout=60) as client:
+            yield client
+    # Иначе соединения aiosqlite держат процесс после завершения
+    await async_engine.dispose()
+
+
+@asynccontextmanager
+async def uvicorn_client(workers: int):
+    port = free_port()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--workers", str(workers),
+         "--log-level", "warning", "--no-access-log"],
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=None)
+    try:
+        async with httpx.AsyncClient(base_url=base_url, timeout=60, limits=limits) as client:
+            for _ in range(100):
+                if server.poll() is not None:
+                    raise RuntimeError(f"uvicorn завершился с кодом {server.returncode}")
+                try:
+                    await client.get("/")
+                    break
+                except httpx.TransportError:
+                    await asyncio.sleep(0.1)
+            yield client
+    finally:
+        server.terminate()
+        server.wait(timeout=10)
+
+
+@asynccontextmanager
+async def remote_client(base_url: str):
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=None)
+    async with httpx.AsyncClient(base_url=base_url, timeout=60, limits=limits) as client:
+        yield client
+
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_table(result: dict) -> None:
+    print(f"{'маршрут':<30}{'запросов':>10}{'ошибок':>8}{'rps':>10}{'p50, мс':>10}{'p95, мс':>10}{'p99, мс':>10}",
+          file=sys.stderr)
+    for route, stats in result["routes"].items():
+        print(f"{route:<30}{stats['requests']:>10}{stats['errors']:>8}{stats['rps']:>10.1f}"
+              f"{stats.get('p50_ms', 0):>10.2f}{stats.get('p95_ms', 0):>10.2f}{stats.get('p99_ms', 0):>10.2f}",
+              file=sys.stderr)
+
+
+def print_comparison(baseline: dict, result: dict) -> None:
+    print(f"\nсравнение с {baseline['meta'].get('revision') or 'базовым прогоном'}:", file=sys.stderr)
+    for route, stats in result["routes"].items():
+        before = baseline["routes"].get(route)
+        if not before or "p50_ms" not in before or "p50_ms" not in stats:
+            continue
+        changes = "  ".join(
+            f"{key} {(stats[key] - before[key]) / before[key] * 100:+.0f}%"
+            for key in ("rps", "p50_ms", "p95_ms", "p99_ms") if before.get(key)
+        )
+        print(f"{route:<30}{changes}", file=sys.stderr)
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--target", default="asgi", help="asgi, uvicorn или адрес запущенного сервера")
+    parser.add_argument("--workers", type=int, default=1, help="процессов uvicorn для --target uvicorn")
+    parser.add_argument("--concurrency", type=int, default=16, help="виртуальных пользователей")
+    parser.add_argument("--duration", type=float, default=30, help="секунд")
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix(DEFAULT_MIX), help="сценарий=вес через запятую")
+    parser.add_argument("--password", default=None, help="пароль анкет utils.seed_users")
+    parser.add_argument("--accounts", type=int, default=1000, help="сколько сгенерированных анкет использовать")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="файл для JSON-результата (по умолчанию stdout)")
+    parser.add_argument("--compare", help="JSON предыдущего прогона для сравнения")
+    parser.add_argument("--rate-limit", action="store_true", help="не отключать ограничение частоты входа")
+    args = parser.parse_args()
+
+    # Все виртуальные пользователи входят с одного IP: с ограничением частоты вход мерил бы ответы 429.
+    # До импорта config, uvicorn получает то же окружение.
+    if not args.rate_limit:
+        os.environ["RATE_LIMIT_ENABLED"] = "false"
+
+    from utils.seed_users import SEED_PASSWORD
+
+    accounts = load_accounts(args.accounts)
+    if len(accounts) < args.concurrency:
+        sys.exit(f"Сгенерированных анкет {len(accounts)}, нужно не меньше {args.concurrency}: python -m utils.seed_users")
+
+    if args.target == "asgi":
+        client_context = asgi_client()
+    elif args.target == "uvicorn":
+        client_context = uvicorn_client(args.workers)
+    else:
+        client_context = remote_client(args.target)
+
+    async with client_context as client:
+        test = LoadTest(client, accounts, args.password or SEED_PASSWORD, args.mix, args.seed)
+        elapsed = await test.run(args.concurrency, args.duration)
+
+    # Ключи отсортированы, числа округлены: файлы разных релизов сравниваются обычным diff
+    result = {
+        "meta": {
+            "target": args.target,
+            "concurrency": args.concurrency,
+            "duration_s": round(elapsed, 3),
+            "mix": args.mix,
+            "rate_limit": args.rate_limit,
+            "revision": git_revision(),
+            "python": platform.python_version(),
+            "cpus": os.cpu_count(),
+            "started_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        },
+        "routes": {route: stats.report(elapsed) for route, stats in sorted(test.stats.items())},
+    }
+    total = RouteStats()
+    for stats in test.stats.values():
+        total.latencies.extend(stats.latencies)
+        total.errors += stats.errors
+        for code, count in stats.statuses.items():
+            total.statuses[code] += count
+    result["total"] = total.report(elapsed)
+
+    body = json.dumps(result, ensure_ascii=False, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            file.write(body + "\n")
+    else:
+        print(body)
+    print_table(result)
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as file:
+            print_comparison(json.load(file), result)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -2,32 +2,169 @@ import os
 import logging
 from pathlib import Path
 from dataclasses import dataclass
+from typing import Optional
 
-from dotenv import load_dotenv
+from dotenv import dotenv_values
 
 
-load_dotenv()
+# Значения из .env читаются в словарь, os.environ при импорте не меняется.
+# Переменные окружения процесса важнее .env, как и раньше с load_dotenv.
+_dotenv = dotenv_values()
+
+
+def env(name: str, default=None):
+    value = os.environ.get(name)
+    return value if value is not None else _dotenv.get(name, default)
 
 
 # SMTP MAIL
-SMTP_SERVER = os.getenv("SMTP_SERVER")
-SMTP_PORT = os.getenv("SMTP_PORT")
-SMTP_USERNAME = os.getenv("SMTP_USERNAME")
-SMTP_PASSWORD = os.getenv("SMTP_PASSWORD")
+SMTP_SERVER = env("SMTP_SERVER")
+SMTP_PORT = env("SMTP_PORT")
+SMTP_USERNAME = env("SMTP_USERNAME")
+SMTP_PASSWORD = env("SMTP_PASSWORD")
+EMAIL_FROM = env("EMAIL_FROM") or SMTP_USERNAME or "noreply@localhost"
+
+
+# Очередь писем (таблица email_outbox) и пул SMTP-соединений
+@dataclass
+class EmailSettings:
+    use_tls: bool = env("SMTP_USE_TLS", "true").lower() == "true"
+    timeout: float = float(env("SMTP_TIMEOUT", 30))  # с
+    pool_size: int = int(env("EMAIL_POOL_SIZE", 2))
+    batch_size: int = int(env("EMAIL_BATCH_SIZE", 50))
+    max_attempts: int = int(env("EMAIL_MAX_ATTEMPTS", 8))
+    backoff_base: float = 5.0  # с, удваивается с каждой попыткой
+    backoff_max: float = 3600.0
+    poll_interval: float = 5.0  # как часто проверять отложенные повторы
+    lease_seconds: float = 120.0  # взятое в отправку письмо не берётся повторно в течение этого времени
+    idle_check_seconds: float = 30.0  # простоявшее соединение перед отправкой проверяется NOOP
+
+
+DATABASE_NAME = env("DATABASE_NAME")
+
+
+# Профиль движка SQLite, применяется при каждом новом соединении
+@dataclass
+class DatabaseSettings:
+    echo: bool = env("DATABASE_ECHO", "false").lower() == "true"
+    journal_mode: str = env("DATABASE_JOURNAL_MODE", "WAL")
+    synchronous: str = env("DATABASE_SYNCHRONOUS", "NORMAL")
+    busy_timeout: int = int(env("DATABASE_BUSY_TIMEOUT", 5000))  # мс
+    cache_size: int = int(env("DATABASE_CACHE_SIZE", -64000))  # < 0 — размер в КиБ
+    mmap_size: int = int(env("DATABASE_MMAP_SIZE", 256 * 1024 * 1024))
+    pool_size: int = int(env("DATABASE_POOL_SIZE", 5))
+    max_overflow: int = int(env("DATABASE_MAX_OVERFLOW", 10))
+    # Таблицы и миграции при запуске; false — база готовится заранее (python -m utils.init_db)
+    init_on_startup: bool = env("DATABASE_INIT_ON_STARTUP", "true").lower() == "true"
+
+# Метрики /metrics и журнал медленных запросов
+@dataclass
+class MetricsSettings:
+    enabled: bool = env("METRICS_ENABLED", "true").lower() == "true"
+    slow_query_ms: float = float(env("SLOW_QUERY_MS", 200))  # запросы дольше пишутся в журнал
+
+
+# Профилирование отдельных запросов: по подписанному заголовку X-Profile или доле sample_rate.
+# Профили лежат вне storage/, который раздаётся как статика.
+@dataclass
+class ProfilerSettings:
+    enabled: bool = env("PROFILER_ENABLED", "true").lower() == "true"
+    sample_rate: float = float(env("PROFILE_SAMPLE_RATE", 0))  # доля запросов, 0 — только по заголовку
+    interval_ms: float = float(env("PROFILE_INTERVAL_MS", 5))  # чаще не выйдет: интервал переключения GIL 5 мс
+    secret: Optional[str] = env("PROFILE_SECRET")  # по умолчанию — SECRET_KEY
+    directory: Path = Path(env("PROFILE_DIR", "profiles/"))
+    max_files: int = int(env("PROFILE_MAX_FILES", 500))
+    max_depth: int = 64  # кадров стека в одной выборке
+
+
+# Ограничение частоты входа, смены и сброса пароля, верификации — до хеширования и запросов к БД.
+# Лимит — «число/период», период: second, minute, hour, day.
+@dataclass
+class RateLimitSettings:
+    enabled: bool = env("RATE_LIMIT_ENABLED", "true").lower() == "true"
+    backend: str = env("RATE_LIMIT_BACKEND", "memory")  # memory — свой у воркера, sqlite — общий для воркеров
+    sqlite_path: str = env("RATE_LIMIT_DB", "database/rate_limits.db")
+    max_keys: int = int(env("RATE_LIMIT_MAX_KEYS", 100000))  # ключей в памяти, самые старые вытесняются
+    # Сколько своих обратных прокси стоит перед приложением: IP клиента — столько адресов от конца
+    # X-Forwarded-For. Левые записи присылает сам клиент, им верить нельзя. 0 — заголовок не читается.
+    trusted_proxies: int = int(env("RATE_LIMIT_TRUSTED_PROXIES", 0))
+    login_per_ip: str = env("RATE_LIMIT_LOGIN_IP", "30/minute")
+    login_per_email: str = env("RATE_LIMIT_LOGIN_EMAIL", "5/minute")
+    change_password_per_ip: str = env("RATE_LIMIT_CHANGE_PASSWORD_IP", "10/minute")
+    change_password_per_email: str = env("RATE_LIMIT_CHANGE_PASSWORD_EMAIL", "5/minute")
+    reset_password_per_ip: str = env("RATE_LIMIT_RESET_PASSWORD_IP", "5/minute")
+    reset_password_per_email: str = env("RATE_LIMIT_RESET_PASSWORD_EMAIL", "3/hour")
+    verification_per_ip: str = env("RATE_LIMIT_VERIFICATION_IP", "5/minute")
+    verification_per_user: str = env("RATE_LIMIT_VERIFICATION_USER", "3/hour")
 
 
-DATABASE_NAME = os.getenv("DATABASE_NAME")
 LIMIT_CITY_ENTITIES_FOR_SEARCH = 5
 LOG_LEVEL = logging.INFO
 
 STORAGE_DIR = Path('storage/')
 STORAGE_UPLOADS = STORAGE_DIR / 'uploads'
-STORAGE_UPLOADS.mkdir(parents=True, exist_ok=True)
+# Фото по хэшу содержимого: storage/blobs/ab/abcd....jpg
+STORAGE_BLOBS = STORAGE_DIR / 'blobs'
+# Недописанные загрузки: в том же томе, что и blobs (перенос — атомарный os.replace), но /storage
+# каталоги с точкой не отдаёт (utils.static)
+STORAGE_STAGING = STORAGE_DIR / '.staging'
+
+
+def create_storage_dirs() -> None:
+    # При запуске приложения (lifespan), а не при импорте
+    STORAGE_UPLOADS.mkdir(parents=True, exist_ok=True)
+    STORAGE_BLOBS.mkdir(parents=True, exist_ok=True)
+    STORAGE_STAGING.mkdir(parents=True, exist_ok=True)
+
+# Кеш токенов авторизации (get_current_user)
+@dataclass
+class AuthCacheSettings:
+    maxsize: int = int(env("AUTH_CACHE_MAXSIZE", 10000))
+    # секунды; изменение анкеты на другом воркере сбрасывает снимок через revocation_sync_interval
+    ttl: int = int(env("AUTH_CACHE_TTL", 300))
+
+
+# Хеширование паролей
+@dataclass
+class HashingSettings:
+    rounds: int = int(env("PASSWORD_HASH_ROUNDS", 29000))
+    workers: int = int(env("PASSWORD_HASH_WORKERS", os.cpu_count() or 1))
+    max_pending: int = int(env("PASSWORD_HASH_MAX_PENDING", 64))  # задач одновременно в пуле
+
+
+# Генерация уменьшенных копий фото
+@dataclass
+class ImageSettings:
+    workers: int = int(env("IMAGE_WORKERS", os.cpu_count() or 1))
+
 
 # JWT
 @dataclass
 class JWTSettings:
     algorithm: str = 'HS256'
-    secret_key: str = os.getenv("SECRET_KEY")
+    secret_key: str = env("SECRET_KEY")
     access_token_expire_minutes: int = 10
+    leeway_seconds: int = 10
+    # Как часто воркер дочитывает общий журнал отзыва (revoked_tokens): столько секунд отозванный
+    # на другом воркере токен ещё принимается
+    revocation_sync_interval: float = float(env("TOKEN_REVOCATION_SYNC_INTERVAL", 1))
+
+
 
+# Сессии (refresh-токены в auth_tokens) и их очистка
+@dataclass
+class SessionSettings:
+    refresh_token_expire_days: int = int(env("REFRESH_TOKEN_EXPIRE_DAYS", 30))
+    # Отозванный или ротированный токен хранится столько, чтобы распознать его повторное использование
+    revoked_retention_hours: int = int(env("REVOKED_TOKEN_RETENTION_HOURS", 24))
+    purge_interval: float = float(env("SESSION_PURGE_INTERVAL", 3600))  # с
+    purge_batch_size: int = int(env("SESSION_PURGE_BATCH_SIZE", 1000))  # строк за одну транзакцию
+
+
+# Свайпы: буфер отложенной записи, сбрасывается в swipes пачкой по размеру или по времени
+@dataclass
+class SwipeSettings:
+    batch_size: int = int(env("SWIPE_BATCH_SIZE", 500))  # свайпов в одной транзакции
+    flush_interval: float = float(env("SWIPE_FLUSH_INTERVAL_MS", 50)) / 1000  # с
+    # Сверх этого запрос сам сбрасывает буфер и ждёт записи: память не растёт, если диск не успевает
+    max_pending: int = int(env("SWIPE_MAX_PENDING", 10000))
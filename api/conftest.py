@@ -0,0 +1 @@
+# Модули приложения импортируются от каталога api, как при запуске uvicorn main:app
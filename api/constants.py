@@ -22,8 +22,50 @@ class Status(str, Enum):
     DELETED = "deleted"
 
 
+class EmailStatus(str, Enum):
+    PENDING = "pending"
+    SENT = "sent"
+    FAILED = "failed"
+
+
 ALLOWED_PHOTO_EXTENSIONS = ['.jpg', '.jpeg', '.png', '.webp']
 MAX_PHOTOS = 7
+MAX_PHOTO_BYTES = 10 * 1024 * 1024  # один файл
+MAX_UPLOAD_BYTES = MAX_PHOTOS * MAX_PHOTO_BYTES  # все файлы одного запроса
+UPLOAD_CHUNK_SIZE = 256 * 1024
+UPLOAD_SNIFF_BYTES = 4 * 1024  # по началу файла определяется формат
+
+FEED_PAGE_SIZE = 20
+MAX_FEED_PAGE_SIZE = 50
+
+MODERATION_PAGE_SIZE = 50
+MAX_MODERATION_PAGE_SIZE = 500
+MAX_MODERATION_BATCH = 10000  # id в одном решении модератора
+
+MATCHES_PAGE_SIZE = 20
+MAX_MATCHES_PAGE_SIZE = 50
+
+
+# Уменьшенные копии фото: размер по длинной стороне в пикселях
+class PhotoSize(str, Enum):
+    THUMB = "thumb"
+    CARD = "card"
+    FULL = "full"
+    ORIGINAL = "original"
+
+
+PHOTO_VARIANT_SIZES = {
+    PhotoSize.THUMB: 160,
+    PhotoSize.CARD: 640,
+    PhotoSize.FULL: 1280,
+}
+PHOTO_VARIANT_FORMAT = "webp"
+PHOTO_VARIANT_QUALITY = 80
+
+# Имена файлов фото содержат хэш содержимого: по такому адресу байты никогда не меняются
+PHOTO_HASH_LENGTH = 16
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+REVALIDATE_CACHE_CONTROL = "no-cache"
 
 
 class PhotoType(str, Enum):
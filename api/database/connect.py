@@ -1,40 +1,87 @@
-from sqlalchemy import create_engine, event
+import time
+
+from sqlalchemy import Engine, create_engine, event
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker
 
-from config import DATABASE_NAME
+from config import DATABASE_NAME, DatabaseSettings, MetricsSettings, ProfilerSettings
 from database.models import Base
+from database.migrations import run_migrations
+from utils.metrics import observe_query
+from utils.profiler import record_query
 
 
-engine = create_engine(f"sqlite:///database/{DATABASE_NAME}.db", echo=True)
-Base.metadata.create_all(engine)
-SessionLocal = sessionmaker(bind=engine, autocommit=False, autoflush=False)
+DATABASE_URL = f"sqlite:///database/{DATABASE_NAME}.db"
+ASYNC_DATABASE_URL = f"sqlite+aiosqlite:///database/{DATABASE_NAME}.db"
+
+
+def apply_sqlite_pragmas(dbapi_connection, connection_record, settings: DatabaseSettings = DatabaseSettings()):
+    cursor = dbapi_connection.cursor()
+    cursor.execute(f"PRAGMA journal_mode={settings.journal_mode}")
+    cursor.execute(f"PRAGMA synchronous={settings.synchronous}")
+    cursor.execute(f"PRAGMA busy_timeout={settings.busy_timeout}")
+    cursor.execute(f"PRAGMA cache_size={settings.cache_size}")
+    cursor.execute(f"PRAGMA mmap_size={settings.mmap_size}")
+    cursor.close()
+
 
+def engine_options(settings: DatabaseSettings = DatabaseSettings()) -> dict:
+    return {
+        "echo": settings.echo,
+        "pool_size": settings.pool_size,
+        "max_overflow": settings.max_overflow,
+    }
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
 
+# Число и время SQL-запросов для /metrics и хронология SQL в профиле запроса.
+# Вложенные запросы одного соединения — стек времён начала.
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_started", []).append(time.perf_counter())
 
 
-# from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
-# from sqlalchemy.orm import sessionmaker
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info["query_started"].pop()
+    elapsed = time.perf_counter() - started
+    observe_query(statement, elapsed)
+    record_query(statement, started, elapsed)
+
+
+def instrument_engine(
+    sync_engine,
+    metrics: MetricsSettings = MetricsSettings(),
+    profiler: ProfilerSettings = ProfilerSettings(),
+) -> None:
+    if metrics.enabled or profiler.enabled:
+        event.listen(sync_engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(sync_engine, "after_cursor_execute", _after_cursor_execute)
+
+
+# Синхронное подключение (CLI-утилиты, скрипты). Создание движка к базе не подключается.
+engine = create_engine(DATABASE_URL, **engine_options())
+event.listen(engine, "connect", apply_sqlite_pragmas)
+instrument_engine(engine)
+SessionLocal = sessionmaker(bind=engine, autocommit=False, autoflush=False)
 
-# Асинхронное подключение
-# async_engine = create_async_engine(f"sqlite:///database/{DATABASE_NAME}.db")
-# AsyncSessionLocal = sessionmaker(async_engine, class_=AsyncSession, expire_on_commit=False)
+# Асинхронное подключение (обработчики FastAPI)
+async_engine = create_async_engine(ASYNC_DATABASE_URL, **engine_options())
+event.listen(async_engine.sync_engine, "connect", apply_sqlite_pragmas)
+instrument_engine(async_engine.sync_engine)
+AsyncSessionLocal = async_sessionmaker(async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
 
 
-# async def init_db():
-#     async with async_engine.begin() as conn:
-#         await conn.run_sync(Base.metadata.create_all)
+def init_db(target: Engine = engine) -> int:
+    # Таблицы и миграции — при запуске приложения (lifespan) или командой python -m utils.init_db,
+    # а не при импорте. BEGIN IMMEDIATE сразу берёт блокировку записи: одновременно стартующие воркеры
+    # выполняют это по очереди, и следующий видит уже созданные таблицы и номер миграции.
+    with target.connect() as conn:
+        conn.exec_driver_sql("BEGIN IMMEDIATE")
+        Base.metadata.create_all(conn)
+        run_migrations(conn)
+        version = conn.exec_driver_sql("PRAGMA user_version").scalar()
+        conn.commit()
+    return version
 
 
-# async def get_session():
-#     async with AsyncSessionLocal() as session:
-#         try:
-#             yield session
-#         finally:
-#             await session.close()
+async def get_db():
+    async with AsyncSessionLocal() as session:
+        yield session
@@ -0,0 +1,87 @@
+import logging
+from typing import Callable, List
+
+from sqlalchemy import Connection, inspect, text
+
+from config import SessionSettings
+
+
+logger = logging.getLogger(__name__)
+
+
+# create_all создаёт только недостающие таблицы, поэтому изменения существующих таблиц
+# оформляются миграциями. Номер применённой миграции хранится в PRAGMA user_version.
+# Каждая миграция должна быть идемпотентной: на новой базе create_all уже создал всё нужное.
+
+
+def _add_column(conn: Connection, table: str, column: str, ddl: str) -> None:
+    columns = {item['name'] for item in inspect(conn).get_columns(table)}
+    if column not in columns:
+        conn.execute(text(f'ALTER TABLE {table} ADD COLUMN {column} {ddl}'))
+
+
+def add_city_coordinates(conn: Connection) -> None:
+    _add_column(conn, 'cities', 'latitude', 'FLOAT')
+    _add_column(conn, 'cities', 'longitude', 'FLOAT')
+
+
+def add_photo_variants(conn: Connection) -> None:
+    _add_column(conn, 'photos', 'variants', 'JSON')
+
+
+def add_moderation(conn: Connection) -> None:
+    _add_column(conn, 'users', 'is_moderator', 'BOOLEAN NOT NULL DEFAULT 0')
+    conn.execute(text('CREATE INDEX IF NOT EXISTS idx_users_status ON users (status, id)'))
+
+
+def add_lookup_indexes(conn: Connection) -> None:
+    # Индексы, объявленные в моделях после создания таблиц: create_all их на старых базах не строит
+    statements = (
+        'CREATE INDEX IF NOT EXISTS idx_users_feed ON users (status, gender, id)',
+        'CREATE INDEX IF NOT EXISTS idx_users_feed_city ON users (status, gender, city_id, id)',
+        'CREATE INDEX IF NOT EXISTS idx_users_city_id ON users (city_id)',
+        'CREATE INDEX IF NOT EXISTS idx_photos_user_id ON photos (user_id)',
+        'CREATE INDEX IF NOT EXISTS idx_photos_file_path ON photos (file_path)',
+        'CREATE INDEX IF NOT EXISTS idx_auth_tokens_user_id ON auth_tokens (user_id, is_active)',
+    )
+    for statement in statements:
+        conn.execute(text(statement))
+    # Статистика для планировщика по новым индексам
+    conn.execute(text('ANALYZE'))
+
+
+def add_session_expiry(conn: Connection, settings: SessionSettings = SessionSettings()) -> None:
+    _add_column(conn, 'auth_tokens', 'device_id', 'VARCHAR(64)')
+    _add_column(conn, 'auth_tokens', 'expires_at', 'DATETIME')
+    # Старые сессии получают полный срок с момента миграции, отозванные — только срок хранения
+    conn.execute(text(
+        "UPDATE auth_tokens SET expires_at = CASE WHEN is_active "
+        "THEN strftime('%Y-%m-%d %H:%M:%f', 'now', :active) "
+        "ELSE strftime('%Y-%m-%d %H:%M:%f', 'now', :revoked) END "
+        "WHERE expires_at IS NULL"
+    ), {
+        'active': f'+{settings.refresh_token_expire_days} days',
+        'revoked': f'+{settings.revoked_retention_hours} hours',
+    })
+    # idx_token_active дублировал первичный ключ, idx_auth_tokens_user_id — префикс нового индекса
+    conn.execute(text('DROP INDEX IF EXISTS idx_token_active'))
+    conn.execute(text('DROP INDEX IF EXISTS idx_auth_tokens_user_id'))
+    conn.execute(text('CREATE INDEX IF NOT EXISTS idx_auth_tokens_user_device ON auth_tokens (user_id, device_id, is_active)'))
+    conn.execute(text('CREATE INDEX IF NOT EXISTS idx_auth_tokens_expires_at ON auth_tokens (expires_at)'))
+
+
+MIGRATIONS: List[Callable[[Connection], None]] = [
+    add_city_coordinates,
+    add_photo_variants,
+    add_moderation,
+    add_lookup_indexes,
+    add_session_expiry,
+]
+
+
+def run_migrations(conn: Connection) -> None:
+    version = conn.execute(text('PRAGMA user_version')).scalar()
+    for number, migration in enumerate(MIGRATIONS[version:], start=version + 1):
+        logger.info(f'Миграция {number}: {migration.__name__}')
+        migration(conn)
+        conn.execute(text(f'PRAGMA user_version = {number}'))
@@ -1,35 +1,91 @@
 from typing import List, Optional
 
-from datetime import date, datetime, timezone
+from datetime import date, datetime, timedelta, timezone
 
-from passlib.hash import pbkdf2_sha256
-from sqlalchemy import ForeignKey, String, Enum as SQLEnum, Index, UniqueConstraint, JSON, Text
+from sqlalchemy import ForeignKey, String, Enum as SQLEnum, Index, UniqueConstraint, JSON, Text, text
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship
 
-from constants import BodyType, Gender, Status, PhotoType
+from config import SessionSettings
+from constants import BodyType, EmailStatus, Gender, Status, PhotoType
+from utils import hashing
 
 
 class Base(DeclarativeBase):
     pass
 
 
+def utc_now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def session_expiry() -> datetime:
+    # Без аргументов: вызываемому default с параметром SQLAlchemy передаёт контекст выполнения
+    return utc_now() + timedelta(days=SessionSettings.refresh_token_expire_days)
+
+
 class AuthToken(Base):
     __tablename__ = "auth_tokens"
-    __table_args__ = (Index('idx_token_active', 'token', 'is_active'),)
+    __table_args__ = (
+        # Сессия устройства при входе и отзыв всех сессий пользователя; поиск по токену — первичный ключ
+        Index('idx_auth_tokens_user_device', 'user_id', 'device_id', 'is_active'),
+        # Очистка истёкших и отозванных токенов
+        Index('idx_auth_tokens_expires_at', 'expires_at'),
+    )
 
     user_id: Mapped[int] = mapped_column(ForeignKey("users.id", ondelete="CASCADE"))
     token: Mapped[str] = mapped_column(primary_key=True)
+    device_id: Mapped[Optional[str]] = mapped_column(String(64), nullable=True, comment="Новый вход с устройства закрывает его прежнюю сессию")
     is_active: Mapped[bool] = mapped_column(default=True)
-    created_at: Mapped[datetime] = mapped_column(default=datetime.now(timezone.utc))
+    created_at: Mapped[datetime] = mapped_column(default=utc_now)
+    expires_at: Mapped[datetime] = mapped_column(default=session_expiry)
 
     user: Mapped["User"] = relationship(back_populates="auth_tokens")
 
+    def __repr__(self) -> str:
+        return f"{self.__class__.__name__}(user_id={self.user_id!r}, device_id={self.device_id!r})"
+
+
+class RevokedToken(Base):
+    # Общий для воркеров журнал отзыва access-токенов: каждый воркер дочитывает новые строки по id
+    __tablename__ = "revoked_tokens"
+    __table_args__ = (Index('idx_revoked_tokens_expires_at', 'expires_at'),)
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    jti: Mapped[Optional[str]] = mapped_column(String(32), nullable=True, comment="Отозван один токен")
+    user_id: Mapped[Optional[int]] = mapped_column(nullable=True, comment="Отозваны все токены, выданные до revoked_at")
+    revoked_at: Mapped[float] = mapped_column(comment="Unix-время, сравнивается с iat токена")
+    expires_at: Mapped[float] = mapped_column(comment="Unix-время, после которого отозванные токены истекли сами")
+
+    def __repr__(self) -> str:
+        return f"{self.__class__.__name__}(jti={self.jti!r}, user_id={self.user_id!r})"
+
+
+class ProfileChange(Base):
+    # Журнал изменений анкет для кеша снимков пользователя (token_cache): воркеры дочитывают его
+    # вместе с revoked_tokens и сбрасывают снимки. Строка нужна, пока снимок мог жить в кеше.
+    __tablename__ = "profile_changes"
+    __table_args__ = (Index('idx_profile_changes_expires_at', 'expires_at'),)
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    user_id: Mapped[int]
+    expires_at: Mapped[float] = mapped_column(comment="Unix-время, после которого прежние снимки истекли сами")
+
     def __repr__(self) -> str:
         return f"{self.__class__.__name__}(user_id={self.user_id!r})"
 
 
 class User(Base):
     __tablename__ = "users"
+    __table_args__ = (
+        # Лента: фильтр по статусу и полу, keyset-пагинация по id (с городом и без)
+        Index('idx_users_feed', 'status', 'gender', 'id'),
+        Index('idx_users_feed_city', 'status', 'gender', 'city_id', 'id'),
+        # Очередь модерации: статус + keyset по id
+        Index('idx_users_status', 'status', 'id'),
+        # Число анкет по городам для автодополнения и внешний ключ на cities
+        Index('idx_users_city_id', 'city_id'),
+    )
 
     id: Mapped[int] = mapped_column(primary_key=True)
     email: Mapped[str] = mapped_column(String(100), unique=True, nullable=False)
@@ -41,24 +97,32 @@ class User(Base):
     gender: Mapped[Gender] = mapped_column(SQLEnum(Gender))
     city_id: Mapped[int] = mapped_column(ForeignKey("cities.id"))
     status: Mapped[Status] = mapped_column(SQLEnum(Status), default=Status.PENDING)
+    is_moderator: Mapped[bool] = mapped_column(default=False, server_default=text('0'))
     device_info: Mapped[Optional[dict]] = mapped_column(JSON, nullable=True)
     bio: Mapped[Optional[str]] = mapped_column(Text, nullable=True, comment="Биография пользователя")
     desires: Mapped[Optional[str]] = mapped_column(Text, nullable=True, comment="Пожелания пользователя")
     last_login: Mapped[datetime] = mapped_column(nullable=True)
-    created_at: Mapped[datetime] = mapped_column(default=datetime.now(timezone.utc))
+    created_at: Mapped[datetime] = mapped_column(default=utc_now)
 
-    auth_tokens: Mapped["AuthToken"] = relationship(back_populates="user")
+    auth_tokens: Mapped[List["AuthToken"]] = relationship(back_populates="user")
     city: Mapped["City"] = relationship(back_populates="users")
     photos: Mapped[List["Photo"]] = relationship(back_populates="user")
 
     def __repr__(self) -> str:
         return f"{self.__class__.__name__}(id={self.id!r}, name={self.name!r})"
 
-    def set_password(self, password: str) -> None:
-        self.password = pbkdf2_sha256.hash(password)
+    async def set_password(self, password: str) -> None:
+        self.password = await hashing.hash_password(password)
+
+    async def verify_password(self, password: str) -> bool:
+        if not self.password:
+            return False
 
-    def verify_password(self, password: str) -> bool:
-        return pbkdf2_sha256.verify(password, self.password)
+        is_valid, new_hash = await hashing.verify_password(password, self.password)
+        if is_valid and new_hash:
+            # Параметры хеширования изменились — сохраняем пересчитанный хеш
+            self.password = new_hash
+        return is_valid
 
 
 class City(Base):
@@ -71,6 +135,8 @@ class City(Base):
     id: Mapped[int] = mapped_column(primary_key=True)
     name: Mapped[str] = mapped_column(String(50), nullable=False)
     region: Mapped[str] = mapped_column(String(50), nullable=False)
+    latitude: Mapped[Optional[float]] = mapped_column(nullable=True)
+    longitude: Mapped[Optional[float]] = mapped_column(nullable=True)
 
     users: Mapped[List["User"]] = relationship(back_populates="city")
 
@@ -82,16 +148,105 @@ class City(Base):
         return f"{self.name}, {self.region}"
 
 
+class DataVersion(Base):
+    # Номер версии набора данных, который воркеры держат в памяти (справочник городов). Кто меняет
+    # данные — в том числе CLI в отдельном процессе — увеличивает номер в той же транзакции,
+    # воркеры сверяют его и пересобирают свои копии.
+    __tablename__ = "data_versions"
+
+    name: Mapped[str] = mapped_column(String(50), primary_key=True)
+    version: Mapped[int] = mapped_column(default=0)
+
+    @classmethod
+    def bump(cls, name: str):
+        stmt = sqlite_insert(cls).values(name=name, version=1)
+        return stmt.on_conflict_do_update(index_elements=[cls.name], set_={"version": cls.version + 1})
+
+    def __repr__(self) -> str:
+        return f"{self.__class__.__name__}(name={self.name!r}, version={self.version!r})"
+
+
+class Blob(Base):
+    __tablename__ = "blobs"
+    __table_args__ = (Index('idx_blobs_unreferenced', 'hash', sqlite_where=text('refcount <= 0')),)
+
+    hash: Mapped[str] = mapped_column(String(64), primary_key=True, comment="sha256 содержимого")
+    file_path: Mapped[str] = mapped_column(String(500))
+    size: Mapped[int]
+    refcount: Mapped[int] = mapped_column(default=0, comment="Сколько записей photos ссылается на файл")
+
+    def __repr__(self) -> str:
+        return f"{self.__class__.__name__}(hash={self.hash!r}, refcount={self.refcount!r})"
+
+
 class Photo(Base):
     __tablename__ = "photos"
+    __table_args__ = (
+        Index('idx_photos_user_id', 'user_id'),
+        # Поиск готовых копий у других записей с тем же файлом
+        Index('idx_photos_file_path', 'file_path'),
+    )
 
     id: Mapped[int] = mapped_column(primary_key=True)
     user_id: Mapped[int] = mapped_column(ForeignKey("users.id", ondelete="CASCADE"))
     file_path: Mapped[str] = mapped_column(String(500))
     photo_type: Mapped[PhotoType] = mapped_column(SQLEnum(PhotoType), default=PhotoType.GALLERY)
-    created_at: Mapped[datetime] = mapped_column(default=datetime.now(timezone.utc))
+    variants: Mapped[Optional[dict]] = mapped_column(JSON, nullable=True, comment="Размер -> путь к уменьшенной копии")
+    created_at: Mapped[datetime] = mapped_column(default=utc_now)
 
     user: Mapped["User"] = relationship(back_populates="photos")
 
     def __repr__(self) -> str:
         return f"{self.__class__.__name__}(id={self.id!r}, photo_type={self.photo_type!r})"
+
+
+class OutboxEmail(Base):
+    __tablename__ = "email_outbox"
+    __table_args__ = (Index('idx_email_outbox_due', 'status', 'next_attempt_at'),)
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    dedup_key: Mapped[str] = mapped_column(String(64), unique=True, comment="Повторная постановка того же письма игнорируется или заменяет его")
+    to_email: Mapped[str] = mapped_column(String(255))
+    subject: Mapped[str] = mapped_column(String(255))
+    body: Mapped[str] = mapped_column(Text, comment="Очищается после отправки")
+    status: Mapped[EmailStatus] = mapped_column(SQLEnum(EmailStatus), default=EmailStatus.PENDING)
+    attempts: Mapped[int] = mapped_column(default=0)
+    next_attempt_at: Mapped[datetime] = mapped_column(default=lambda: datetime.now(timezone.utc))
+    last_error: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
+    created_at: Mapped[datetime] = mapped_column(default=lambda: datetime.now(timezone.utc))
+    sent_at: Mapped[Optional[datetime]] = mapped_column(nullable=True)
+
+    def __repr__(self) -> str:
+        return f"{self.__class__.__name__}(id={self.id!r}, status={self.status!r})"
+
+
+class Swipe(Base):
+    __tablename__ = "swipes"
+    # Строка на пару (кто, кого): первичный ключ и есть таблица (WITHOUT ROWID), без отдельного индекса
+    # и rowid. Встречный свайп — поиск по тому же ключу с переставленными id.
+    __table_args__ = {"sqlite_with_rowid": False}
+
+    user_id: Mapped[int] = mapped_column(ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    target_id: Mapped[int] = mapped_column(ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    liked: Mapped[bool] = mapped_column(comment="Лайк или пропуск")
+    created_at: Mapped[datetime] = mapped_column(default=utc_now)
+
+    def __repr__(self) -> str:
+        return f"{self.__class__.__name__}(user_id={self.user_id!r}, target_id={self.target_id!r}, liked={self.liked!r})"
+
+
+class Match(Base):
+    __tablename__ = "matches"
+    __table_args__ = (
+        # Пара записана дважды, по строке на каждого: список совпадений — keyset по id у своего user_id
+        UniqueConstraint('user_id', 'matched_id', name='uq_match_pair'),
+        Index('idx_matches_user_id', 'user_id', 'id'),
+    )
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    user_id: Mapped[int] = mapped_column(ForeignKey("users.id", ondelete="CASCADE"))
+    matched_id: Mapped[int] = mapped_column(ForeignKey("users.id", ondelete="CASCADE"))
+    created_at: Mapped[datetime] = mapped_column(default=utc_now)
+
+    def __repr__(self) -> str:
+        return f"{self.__class__.__name__}(user_id={self.user_id!r}, matched_id={self.matched_id!r})"
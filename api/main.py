@@ -1,39 +1,57 @@
+import asyncio
 import logging
+import math
+from contextlib import asynccontextmanager
 
 from fastapi import  FastAPI, Request, status, HTTPException
-from fastapi.responses import JSONResponse
+from fastapi.responses import ORJSONResponse, PlainTextResponse
 from fastapi.exceptions import RequestValidationError
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
 
-from views.auth import router as auth_router
-from views.service import router as service_router
-from views.users import router as users_router
-from config import LOG_LEVEL
+from config import LOG_LEVEL, SMTP_SERVER, DatabaseSettings, MetricsSettings, ProfilerSettings, create_storage_dirs
+from constants import MAX_UPLOAD_BYTES
+from utils.metrics import MetricsMiddleware, registry
+from utils.rate_limit import RateLimitExceeded
 
 
-logging.basicConfig(
-    level=LOG_LEVEL,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    datefmt='%Y-%m-%d %H:%M:%S'
-)
+# Импорт модуля ничего не создаёт и не трогает базу и диск: приложение собирает create_app
+# (uvicorn --factory main:create_app или main:app, см. __getattr__), а база и каталоги
+# готовятся в lifespan. Обработчики, ORM и фоновые задачи импортируются только внутри create_app.
+logger = logging.getLogger(__name__)
 
 
-app = FastAPI()
-app.include_router(auth_router, prefix="/api/v1", tags=['Auth'])
-app.include_router(service_router, prefix="/api/v1", tags=['Service'])
-app.include_router(users_router, prefix="/api/v1", tags=['Users'])
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=['*'],
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
-app.mount("/storage", StaticFiles(directory="storage"), name="storage")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    from database.connect import engine, init_db
+    from utils import hashing, images
+    from utils.cities import city_catalogue, city_versions
+    from utils.email_sender import email_outbox
+    from utils.sessions import session_purger
+    from utils.swipes import swipe_buffer
+
+    create_storage_dirs()
+    if DatabaseSettings.init_on_startup:
+        await asyncio.to_thread(init_db)
+        # Синхронный движок приложению больше не нужен
+        engine.dispose()
+    # Версия справочника запоминается до сборки: загрузка после неё не потеряется
+    await city_versions.check()
+    await city_catalogue.rebuild()
+    session_purger.start()
+    swipe_buffer.start()
+    if SMTP_SERVER:
+        email_outbox.start()
+    else:
+        logger.warning("SMTP_SERVER не задан: письма остаются в очереди email_outbox")
+    yield
+    # Свайпы из буфера записываются до остановки воркера
+    await swipe_buffer.stop()
+    await email_outbox.stop()
+    await session_purger.stop()
+    hashing.shutdown()
+    images.shutdown()
 
 
-@app.exception_handler(RequestValidationError)
 async def validation_exception_handler(request: Request, exc: RequestValidationError):
     errors = []
     for error in exc.errors():
@@ -51,7 +69,7 @@ async def validation_exception_handler(request: Request, exc: RequestValidationE
             "type": error["type"]
         })
 
-    return JSONResponse(
+    return ORJSONResponse(
         status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
         content={
             "success": False,
@@ -62,7 +80,6 @@ async def validation_exception_handler(request: Request, exc: RequestValidationE
     )
 
 
-@app.exception_handler(HTTPException)
 async def http_exception_handler(request: Request, exc: HTTPException):
     if isinstance(exc.detail, dict) and "code" in exc.detail:
         detail = exc.detail
@@ -72,15 +89,90 @@ async def http_exception_handler(request: Request, exc: HTTPException):
             "message": str(exc.detail)
         }
 
-    return JSONResponse(
+    return ORJSONResponse(
         status_code=exc.status_code,
         content={
             "success": False,
             **detail
-        }
+        },
+        headers=exc.headers,
+    )
+
+
+async def rate_limit_exception_handler(request: Request, exc: RateLimitExceeded):
+    return ORJSONResponse(
+        status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+        content={
+            "success": False,
+            "code": "RATE_LIMITED",
+            "message": "Слишком много попыток, повторите позже",
+        },
+        headers={"Retry-After": str(math.ceil(exc.retry_after))},
     )
 
 
-@app.get("/")
+async def metrics():
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
 async def read_root():
     return {"Hello": "World"}
+
+
+def create_app() -> FastAPI:
+    from views.auth import router as auth_router
+    from views.moderation import router as moderation_router
+    from views.profiles import router as profiles_router
+    from views.service import router as service_router
+    from views.swipes import router as swipes_router
+    from views.users import router as users_router
+    from utils.profiler import ProfilerMiddleware
+    from utils.static import PhotoStaticFiles
+    from utils.uploads import RequestSizeLimitMiddleware
+
+    logging.basicConfig(
+        level=LOG_LEVEL,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+        datefmt='%Y-%m-%d %H:%M:%S'
+    )
+
+    # orjson для всех ответов по умолчанию; анкеты сериализуются напрямую (utils.responses)
+    app = FastAPI(lifespan=lifespan, default_response_class=ORJSONResponse)
+    app.include_router(auth_router, prefix="/api/v1", tags=['Auth'])
+    app.include_router(service_router, prefix="/api/v1", tags=['Service'])
+    app.include_router(users_router, prefix="/api/v1", tags=['Users'])
+    app.include_router(swipes_router, prefix="/api/v1", tags=['Swipes'])
+    app.include_router(moderation_router, prefix="/api/v1", tags=['Moderation'])
+    app.include_router(profiles_router, prefix="/api/v1", tags=['Debug'])
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=['*'],
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+    )
+    # Тело запроса с заведомо слишком большим Content-Length не читается вовсе
+    app.add_middleware(RequestSizeLimitMiddleware, max_bytes=MAX_UPLOAD_BYTES + 1024 * 1024)
+    # Последним добавлен — выполняется первым: в метрики попадают и отклонённые по размеру запросы
+    if MetricsSettings.enabled:
+        app.add_middleware(MetricsMiddleware)
+    # Снаружи метрик: запись профиля на диск не попадает в http_request_duration_seconds
+    if ProfilerSettings.enabled:
+        app.add_middleware(ProfilerMiddleware, exclude_paths=("/api/v1/profiles/", "/metrics"))
+    # Каталог создаётся в lifespan
+    app.mount("/storage", PhotoStaticFiles(directory="storage", check_dir=False), name="storage")
+
+    app.add_exception_handler(RequestValidationError, validation_exception_handler)
+    app.add_exception_handler(HTTPException, http_exception_handler)
+    app.add_exception_handler(RateLimitExceeded, rate_limit_exception_handler)
+    app.add_api_route("/metrics", metrics, methods=["GET"], include_in_schema=False)
+    app.add_api_route("/", read_root, methods=["GET"])
+    return app
+
+
+def __getattr__(name: str):
+    # main:app для uvicorn и тестов: приложение собирается при первом обращении, а не при импорте
+    if name == "app":
+        app = globals()["app"] = create_app()
+        return app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
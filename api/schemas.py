@@ -5,7 +5,7 @@ from typing import Dict, List, Optional, Any
 from fastapi import Form
 from pydantic import BaseModel, Field, field_validator, EmailStr, ValidationError, model_validator
 
-from constants import BodyType, Gender, Status
+from constants import BodyType, Gender, Status, PhotoType, MAX_MODERATION_BATCH
 
 
 class RegistrationForm(BaseModel):
@@ -47,6 +47,17 @@ class Token(BaseModel):
     token: str
 
 
+class TokenPair(BaseModel):
+    access_token: str
+    refresh_token: str
+    token_type: str = "bearer"
+    expires_in: int
+
+
+class RefreshTokenRequest(BaseModel):
+    refresh_token: str
+
+
 class UserData(BaseModel):
     id: int
     email: EmailStr
@@ -64,6 +75,74 @@ class UserData(BaseModel):
     desires: Optional[str]
 
 
+# Анкета другого пользователя (лента, совпадения): как UserData, но без email
+class FeedItem(BaseModel):
+    id: int
+    name: str
+    age: int
+    status: Status
+    height: int
+    body_type: BodyType
+    gender: Gender
+    city: str
+    city_id: int
+    avatar: str
+    photos: List[str]
+    bio: Optional[str]
+    desires: Optional[str]
+
+
+class FeedPage(BaseModel):
+    items: List[FeedItem]
+    next_cursor: Optional[int] = Field(description="id последней анкеты, передаётся в cursor для следующей страницы")
+
+
+class SwipeRequest(BaseModel):
+    target_id: int
+    liked: bool = Field(description="Лайк или пропуск")
+
+
+class SwipeResult(BaseModel):
+    success: bool
+    matched: bool = Field(description="Встречный лайк уже есть — взаимная симпатия")
+
+
+class MatchPage(BaseModel):
+    items: List[FeedItem]
+    next_cursor: Optional[int] = Field(description="id последнего совпадения, передаётся в cursor для следующей страницы")
+
+
+class ModerationPhoto(BaseModel):
+    id: int
+    url: str
+    photo_type: PhotoType
+
+
+class ModerationItem(BaseModel):
+    id: int
+    email: EmailStr
+    name: str
+    age: int
+    gender: Gender
+    city_id: int
+    photos: List[ModerationPhoto]
+
+
+class ModerationPage(BaseModel):
+    items: List[ModerationItem]
+    next_cursor: Optional[int] = Field(description="id последней анкеты, передаётся в cursor для следующей страницы")
+
+
+class ModerationDecision(BaseModel):
+    user_ids: List[int] = Field(default=[], max_length=MAX_MODERATION_BATCH, description="Анкеты на модерации")
+    photo_ids: List[int] = Field(default=[], max_length=MAX_MODERATION_BATCH, description="Фото на модерации")
+
+
+class ModerationResult(BaseModel):
+    users: int = Field(description="Сколько анкет изменено")
+    photos: int = Field(description="Сколько фото изменено")
+
+
 class UserEditForm(BaseModel):
     name: str
     height: int
@@ -100,22 +179,3 @@ class ChangePasswordRequest(BaseModel):
         if self.old_password == self.new_password:
             raise ValueError('Новый пароль должен отличаться от старого')
         return self
-
-
-external_data = {
-    "email": '12312das@mail.ru',
-    "name": "Анна",
-    "birth_date": "1995-05-15",
-    "height": 156,
-    "body_type": "slim",
-    "gender": Gender.MALE,
-    "city": "Москва"
-}
-
-
-# user = RegistrationForm(**external_data)
-# print(user.model_dump_json())
-
-
-
-
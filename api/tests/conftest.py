@@ -0,0 +1,62 @@
+import asyncio
+from datetime import date
+from pathlib import Path
+
+import pytest
+from sqlalchemy import create_engine, event
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+from constants import BodyType, Gender, Status
+from database.connect import apply_sqlite_pragmas, engine_options
+from database.models import Base, City, User
+
+
+@pytest.fixture
+def db_path(tmp_path) -> Path:
+    # Чистая база со всеми таблицами на каждый тест
+    path = tmp_path / "test.db"
+    engine = create_engine(f"sqlite:///{path}")
+    with engine.begin() as conn:
+        Base.metadata.create_all(conn)
+    engine.dispose()
+    return path
+
+
+@pytest.fixture
+def run_with_db(db_path):
+    # run(scenario): scenario(sessions) выполняется в своём цикле событий с сессиями на чистую базу
+    def run(scenario):
+        async def main():
+            engine = create_async_engine(f"sqlite+aiosqlite:///{db_path}", **engine_options())
+            event.listen(engine.sync_engine, "connect", apply_sqlite_pragmas)
+            sessions = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+            try:
+                return await scenario(sessions)
+            finally:
+                await engine.dispose()
+
+        return asyncio.run(main())
+
+    return run
+
+
+@pytest.fixture
+def add_users():
+    # add_users(db, count, **fields) — анкеты с городом, по умолчанию одобренные
+    async def add(db: AsyncSession, count: int, **fields):
+        city = City(name="Москва", region="Москва и Московская обл.")
+        db.add(city)
+        await db.flush()
+        fields.setdefault("status", Status.ACTIVE)
+        users = [
+            User(
+                email=f"user{i}@example.com", name=f"user{i}", birth_date=date(1995, 5, 15), height=170,
+                body_type=BodyType.SLIM, gender=Gender.FEMALE if i % 2 else Gender.MALE, city_id=city.id, **fields,
+            )
+            for i in range(count)
+        ]
+        db.add_all(users)
+        await db.commit()
+        return users
+
+    return add
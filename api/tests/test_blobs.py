@@ -0,0 +1,98 @@
+import hashlib
+
+import pytest
+from sqlalchemy import select
+
+from config import STORAGE_STAGING, create_storage_dirs
+from database.models import Blob
+from utils import blobs
+
+
+@pytest.fixture(autouse=True)
+def storage(tmp_path, monkeypatch):
+    # Каталоги хранилища относительные: у каждого теста своё
+    monkeypatch.chdir(tmp_path)
+    create_storage_dirs()
+
+
+def stage(content: bytes, name: str) -> blobs.StagedBlob:
+    tmp_path = STORAGE_STAGING / f"{name}.part"
+    tmp_path.write_bytes(content)
+    return blobs.StagedBlob(tmp_path, hashlib.sha256(content).hexdigest(), ".jpg", len(content))
+
+
+async def refcounts(sessions):
+    async with sessions() as db:
+        return dict((await db.execute(select(Blob.hash, Blob.refcount))).all())
+
+
+async def upload(sessions, staged):
+    async with sessions() as db:
+        await blobs.acquire(db, staged)
+        await db.commit()
+    await blobs.publish(staged)
+
+
+def test_same_content_is_stored_once(run_with_db):
+    async def scenario(sessions):
+        first, second = stage(b"photo", "a"), stage(b"photo", "b")
+        await upload(sessions, [first, second])
+        await upload(sessions, [stage(b"photo", "c")])
+
+        assert first.path == second.path
+        assert first.path.read_bytes() == b"photo"
+        assert blobs.is_blob_path(str(first.path))
+        assert await refcounts(sessions) == {first.digest: 3}
+        assert list(STORAGE_STAGING.iterdir()) == []
+
+    run_with_db(scenario)
+
+
+def test_file_is_removed_with_last_reference(run_with_db):
+    async def scenario(sessions):
+        shared, single = stage(b"shared", "a"), stage(b"single", "b")
+        await upload(sessions, [shared, stage(b"shared", "c"), single])
+        variant = shared.path.parent / f"{shared.digest}_card.0123.webp"
+        variant.write_bytes(b"variant")
+
+        async with sessions() as db:
+            assert await blobs.release(db, [str(shared.path), str(single.path)]) == []
+            await db.commit()
+            assert await blobs.collect_garbage(db) == 1
+        assert await refcounts(sessions) == {shared.digest: 1}
+        assert shared.path.exists() and variant.exists()
+        assert not single.path.exists()
+
+        # Последняя ссылка: удаляются и сам файл, и его уменьшенные копии
+        async with sessions() as db:
+            await blobs.release(db, [str(shared.path)])
+            await db.commit()
+            assert await blobs.collect_garbage(db) == 1
+        assert await refcounts(sessions) == {}
+        assert not shared.path.exists() and not variant.exists()
+
+    run_with_db(scenario)
+
+
+def test_release_returns_files_outside_blob_storage(run_with_db):
+    async def scenario(sessions):
+        blob = stage(b"photo", "a")
+        await upload(sessions, [blob])
+        async with sessions() as db:
+            legacy = await blobs.release(db, ["storage/uploads/old.jpg", str(blob.path)])
+            await db.commit()
+            assert [str(path) for path in legacy] == ["storage/uploads/old.jpg"]
+            assert await blobs.collect_garbage(db) == 1
+
+    run_with_db(scenario)
+
+
+def test_discarded_upload_leaves_no_files(run_with_db):
+    async def scenario(sessions):
+        blob = stage(b"photo", "a")
+        await blobs.discard([blob])
+        assert not blob.tmp_path.exists() and not blob.path.exists()
+        async with sessions() as db:
+            assert await blobs.collect_garbage(db) == 0
+
+    run_with_db(scenario)
@@ -0,0 +1,190 @@
+import asyncio
+import email
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from sqlalchemy import create_engine, event, select, update
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+from config import EmailSettings
+from constants import EmailStatus
+from database.connect import apply_sqlite_pragmas, engine_options
+from database.models import Base, OutboxEmail
+from utils.email_sender import EmailOutbox, SMTPPool, email_dedup_key, enqueue_email, send_password
+
+
+class StandInSMTPServer:
+    # Локальный SMTP вместо настоящего: принимает письма в received; fail_data — сколько следующих
+    # писем отклонить временной ошибкой 451; on_data вызывается перед ответом на письмо
+    def __init__(self):
+        self.received = []
+        self.fail_data = 0
+        self.on_data = None
+        self.server = None
+        self.port = None
+
+    async def start(self) -> None:
+        self.server = await asyncio.start_server(self.handle, "127.0.0.1", 0)
+        self.port = self.server.sockets[0].getsockname()[1]
+
+    async def stop(self) -> None:
+        self.server.close()
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        writer.write(b"220 stand-in ESMTP\r\n")
+        try:
+            while line := await reader.readline():
+                command = line[:4].upper()
+                if command == b"EHLO":
+                    writer.write(b"250-stand-in\r\n250 8BITMIME\r\n")
+                elif command == b"DATA":
+                    writer.write(b"354 end with .\r\n")
+                    await writer.drain()
+                    lines = []
+                    while (data := await reader.readline()) != b".\r\n":
+                        lines.append(data)
+                    if self.on_data is not None:
+                        await self.on_data()
+                    if self.fail_data:
+                        self.fail_data -= 1
+                        writer.write(b"451 try again later\r\n")
+                    else:
+                        message = email.message_from_bytes(b"".join(lines))
+                        self.received.append(message.get_payload(0).get_payload(decode=True).decode())
+                        writer.write(b"250 queued\r\n")
+                elif command == b"QUIT":
+                    writer.write(b"221 bye\r\n")
+                    await writer.drain()
+                    break
+                else:
+                    writer.write(b"250 ok\r\n")
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+
+def run_with_outbox(tmp_path: Path, scenario, **settings):
+    # scenario(outbox, sessions, smtp) выполняется с чистой базой и запущенным SMTP
+    async def main():
+        path = tmp_path / "outbox.db"
+        with create_engine(f"sqlite:///{path}").begin() as conn:
+            Base.metadata.create_all(conn)
+        engine = create_async_engine(f"sqlite+aiosqlite:///{path}", **engine_options())
+        event.listen(engine.sync_engine, "connect", apply_sqlite_pragmas)
+        sessions = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+        smtp = StandInSMTPServer()
+        await smtp.start()
+        email_settings = EmailSettings(use_tls=False, **settings)
+        outbox = EmailOutbox(
+            email_settings, sessions, SMTPPool(email_settings, hostname="127.0.0.1", port=str(smtp.port), username=None)
+        )
+        try:
+            await scenario(outbox, sessions, smtp)
+        finally:
+            await outbox.stop()
+            await smtp.stop()
+            await engine.dispose()
+
+    asyncio.run(main())
+
+
+async def outbox_rows(sessions):
+    async with sessions() as db:
+        return (await db.scalars(select(OutboxEmail).order_by(OutboxEmail.id))).all()
+
+
+def test_enqueued_email_is_delivered(tmp_path):
+    async def scenario(outbox, sessions, smtp):
+        async with sessions() as db:
+            await send_password(db, 1, "anna@example.com", "secret-1")
+            await db.commit()
+
+        assert await outbox.deliver_due() == 1
+        assert len(smtp.received) == 1
+        assert "secret-1" in smtp.received[0]
+        [row] = await outbox_rows(sessions)
+        assert row.status == EmailStatus.SENT
+        assert row.body == ""
+        assert await outbox.deliver_due() == 0
+
+    run_with_outbox(tmp_path, scenario)
+
+
+def test_smtp_failure_is_retried_after_backoff(tmp_path):
+    async def scenario(outbox, sessions, smtp):
+        async with sessions() as db:
+            await send_password(db, 1, "anna@example.com", "secret-1")
+            await db.commit()
+
+        smtp.fail_data = 1
+        started = datetime.utcnow()
+        await outbox.deliver_due()
+        [row] = await outbox_rows(sessions)
+        assert row.status == EmailStatus.PENDING
+        assert row.attempts == 1
+        assert "451" in row.last_error
+        # Первая пауза — backoff_base с разбросом 0.5..1
+        assert started + timedelta(seconds=4) <= row.next_attempt_at <= datetime.utcnow() + timedelta(seconds=10)
+        # До истечения паузы письмо не берётся
+        assert await outbox.deliver_due() == 0
+
+        async with sessions() as db:
+            await db.execute(update(OutboxEmail).values(next_attempt_at=datetime.utcnow() - timedelta(seconds=1)))
+            await db.commit()
+        assert await outbox.deliver_due() == 1
+        [row] = await outbox_rows(sessions)
+        assert row.status == EmailStatus.SENT
+        assert row.attempts == 2
+        assert len(smtp.received) == 1
+
+    run_with_outbox(tmp_path, scenario, backoff_base=10.0)
+
+
+def test_same_email_is_enqueued_once(tmp_path):
+    async def scenario(outbox, sessions, smtp):
+        key = email_dedup_key("anna@example.com", "welcome", 1)
+        for _ in range(2):
+            async with sessions() as db:
+                await enqueue_email(db, "anna@example.com", "Привет", "Добро пожаловать", dedup_key=key)
+                await db.commit()
+        # Новый пароль заменяет прежнее письмо, а не добавляет второе
+        for password in ("secret-1", "secret-2"):
+            async with sessions() as db:
+                await send_password(db, 1, "anna@example.com", password)
+                await db.commit()
+
+        assert len(await outbox_rows(sessions)) == 2
+        assert await outbox.deliver_due() == 2
+        assert len(smtp.received) == 2
+        assert "secret-2" in smtp.received[1] and "secret-1" not in smtp.received[1]
+
+    run_with_outbox(tmp_path, scenario)
+
+
+def test_password_replaced_during_sending_is_sent_again(tmp_path):
+    async def scenario(outbox, sessions, smtp):
+        async with sessions() as db:
+            await send_password(db, 1, "anna@example.com", "secret-1")
+            await db.commit()
+
+        async def replace():
+            smtp.on_data = None
+            async with sessions() as db:
+                await send_password(db, 1, "anna@example.com", "secret-2")
+                await db.commit()
+
+        # Новый пароль выдан, пока письмо со старым уже у SMTP-сервера
+        smtp.on_data = replace
+        await outbox.deliver_due()
+        [row] = await outbox_rows(sessions)
+        assert row.status == EmailStatus.PENDING
+        assert "secret-2" in row.body
+
+        assert await outbox.deliver_due() == 1
+        assert "secret-2" in smtp.received[-1]
+        [row] = await outbox_rows(sessions)
+        assert row.status == EmailStatus.SENT
+
+    run_with_outbox(tmp_path, scenario)
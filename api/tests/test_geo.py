@@ -0,0 +1,38 @@
+from utils.geo import CityGeoIndex, haversine_km
+
+
+ROWS = [
+    (1, "Москва", "Москва и Московская обл.", 55.752, 37.6178),
+    (2, "Реутов", "Москва и Московская обл.", 55.7606, 37.8553),
+    (3, "Тверь", "Тверская обл.", 56.8584, 35.9006),
+    (4, "Анадырь", "Чукотский АО", 64.7342, 177.5103),
+    (5, "Эгвекинот", "Чукотский АО", 66.3232, -179.1184),
+    (6, "Без координат", "Регион", None, None),
+]
+
+
+def make_index() -> CityGeoIndex:
+    index = CityGeoIndex()
+    index.load(ROWS)
+    return index
+
+
+def test_within_radius_sorted_by_distance():
+    index = make_index()
+    assert [city_id for city_id, _ in index.within(1, 20)] == [1, 2]
+    assert [city_id for city_id, _ in index.within(1, 200)] == [1, 2, 3]
+    # Больше MAX_PRECOMPUTED_KM — обход сетки, результат тот же
+    assert [city_id for city_id, _ in index.within(1, 1000)] == [1, 2, 3]
+
+
+def test_radius_crosses_antimeridian():
+    index = make_index()
+    distance = round(haversine_km(64.7342, 177.5103, 66.3232, -179.1184), 1)
+    assert index.within(5, 300) == [(5, 0.0), (4, distance)]
+    assert index.within(4, 300) == [(4, 0.0), (5, distance)]
+
+
+def test_city_without_coordinates_finds_itself():
+    index = make_index()
+    assert index.within(6, 500) == [(6, 0.0)]
+    assert index.name(6) == "Без координат, Регион"
@@ -0,0 +1,78 @@
+import json
+from datetime import date
+
+from sqlalchemy import create_engine, insert, select
+
+from constants import BodyType, Gender
+from database.models import City, DataVersion, User
+from utils.load_cities import load_cities
+
+
+CITIES = [
+    {"city": "Москва", "region": "Москва и Московская обл.", "lat": 55.752, "lon": 37.6178},
+    {"city": "Тверь", "region": "Тверская обл."},
+]
+
+
+def write_cities(tmp_path, cities):
+    path = tmp_path / "cities.json"
+    path.write_text(json.dumps(cities, ensure_ascii=False), encoding="utf-8")
+    return str(path)
+
+
+def cities_version(engine):
+    with engine.connect() as conn:
+        return conn.scalar(select(DataVersion.version).where(DataVersion.name == "cities"))
+
+
+def test_repeated_load_changes_nothing(tmp_path, db_path):
+    engine = create_engine(f"sqlite:///{db_path}")
+    path = write_cities(tmp_path, CITIES)
+
+    report = load_cities(path, engine, batch_size=1)
+    assert (report.inserted, report.updated, report.unchanged) == (2, 0, 0)
+    version = cities_version(engine)
+    with engine.connect() as conn:
+        before = conn.execute(select(City.id, City.name, City.latitude)).all()
+
+    report = load_cities(path, engine, batch_size=1)
+    assert (report.inserted, report.updated, report.unchanged) == (0, 0, 2)
+    # Версия не меняется: воркеры не пересобирают справочник впустую
+    assert cities_version(engine) == version
+    with engine.connect() as conn:
+        assert conn.execute(select(City.id, City.name, City.latitude)).all() == before
+
+
+def test_reload_updates_coordinates_and_keeps_missing_ones(tmp_path, db_path):
+    engine = create_engine(f"sqlite:///{db_path}")
+    load_cities(write_cities(tmp_path, CITIES), engine)
+    version = cities_version(engine)
+
+    # Тверь получает координаты, у Москвы их нет в файле — прежние не затираются
+    updated = [
+        {"city": "Москва", "region": "Москва и Московская обл."},
+        {"city": "Тверь", "region": "Тверская обл.", "lat": 56.8584, "lon": 35.9006},
+    ]
+    report = load_cities(write_cities(tmp_path, updated), engine)
+    assert (report.inserted, report.updated, report.unchanged) == (0, 1, 1)
+    assert cities_version(engine) != version
+    with engine.connect() as conn:
+        rows = conn.execute(select(City.name, City.latitude, City.longitude).order_by(City.id)).all()
+    assert rows == [("Москва", 55.752, 37.6178), ("Тверь", 56.8584, 35.9006)]
+
+
+def test_delete_missing_keeps_cities_in_use(tmp_path, db_path):
+    engine = create_engine(f"sqlite:///{db_path}")
+    extra = {"city": "Реутов", "region": "Москва и Московская обл."}
+    load_cities(write_cities(tmp_path, [*CITIES, extra]), engine)
+    with engine.begin() as conn:
+        moscow = conn.scalar(select(City.id).where(City.name == "Москва"))
+        conn.execute(insert(User).values(
+            email="anna@example.com", name="Анна", birth_date=date(1995, 5, 15), height=170,
+            body_type=BodyType.SLIM, gender=Gender.FEMALE, city_id=moscow,
+        ))
+
+    report = load_cities(write_cities(tmp_path, [extra]), engine, with_delete=True)
+    assert (report.deleted, report.kept_in_use) == (1, 1)
+    with engine.connect() as conn:
+        assert set(conn.scalars(select(City.name))) == {"Москва", "Реутов"}
@@ -0,0 +1,98 @@
+import asyncio
+import hashlib
+
+import pytest
+from fastapi import HTTPException
+
+from sqlalchemy import select
+
+from constants import PhotoType, Status
+from database.models import Blob, Photo, User
+from schemas import ModerationDecision
+from views.moderation import approve, get_current_moderator, reject
+
+
+async def add_photos(db, user_id: int, photo_type: PhotoType, count: int):
+    photos = [Photo(user_id=user_id, file_path=f"storage/uploads/{user_id}_{i}.jpg", photo_type=photo_type) for i in range(count)]
+    db.add_all(photos)
+    await db.commit()
+    return [photo.id for photo in photos]
+
+
+async def statuses(sessions):
+    async with sessions() as db:
+        return dict((await db.execute(select(User.id, User.status))).all())
+
+
+async def photo_types(sessions):
+    async with sessions() as db:
+        return dict((await db.execute(select(Photo.id, Photo.photo_type))).all())
+
+
+def test_approve_activates_profiles_with_their_pending_photos(run_with_db, add_users):
+    async def scenario(sessions):
+        async with sessions() as db:
+            moderator, anna, boris = await add_users(db, 3)
+            moderator.is_moderator = True
+            anna.status = boris.status = Status.PENDING
+            await db.commit()
+            anna_photos = await add_photos(db, anna.id, PhotoType.PENDING, 2)
+            [verification] = await add_photos(db, anna.id, PhotoType.VERIFICATION, 1)
+            [boris_photo] = await add_photos(db, boris.id, PhotoType.PENDING, 1)
+
+        async with sessions() as db:
+            result = await approve(ModerationDecision(user_ids=[anna.id, moderator.id]), moderator, db)
+        # Одобренная ранее анкета не считается повторно
+        assert (result.users, result.photos) == (1, 2)
+        assert await statuses(sessions) == {moderator.id: Status.ACTIVE, anna.id: Status.ACTIVE, boris.id: Status.PENDING}
+        types = await photo_types(sessions)
+        assert [types[photo_id] for photo_id in anna_photos] == [PhotoType.GALLERY, PhotoType.GALLERY]
+        assert types[verification] == PhotoType.VERIFICATION
+        assert types[boris_photo] == PhotoType.PENDING
+
+        # Фото одобряется отдельно от анкеты
+        async with sessions() as db:
+            result = await approve(ModerationDecision(photo_ids=[boris_photo]), moderator, db)
+        assert (result.users, result.photos) == (0, 1)
+        assert (await statuses(sessions))[boris.id] == Status.PENDING
+
+    run_with_db(scenario)
+
+
+def test_reject_keeps_profile_photos_and_deletes_rejected_ones(run_with_db, add_users, tmp_path, monkeypatch):
+    async def scenario(sessions):
+        async with sessions() as db:
+            moderator, anna = await add_users(db, 2)
+            moderator.is_moderator = True
+            anna.status = Status.PENDING
+            await db.commit()
+            kept, rejected = await add_photos(db, anna.id, PhotoType.PENDING, 2)
+            # Отклонённое фото лежит в хранилище blobs и больше ни на что не ссылается
+            digest = hashlib.sha256(b"rejected").hexdigest()
+            blob_path = f"storage/blobs/{digest[:2]}/{digest}.jpg"
+            (tmp_path / blob_path).parent.mkdir(parents=True)
+            (tmp_path / blob_path).write_bytes(b"rejected")
+            photo = await db.get(Photo, rejected)
+            photo.file_path = blob_path
+            db.add(Blob(hash=digest, file_path=blob_path, size=8, refcount=1))
+            await db.commit()
+
+        async with sessions() as db:
+            result = await reject(ModerationDecision(user_ids=[anna.id], photo_ids=[rejected]), moderator, db)
+        assert (result.users, result.photos) == (1, 1)
+        assert (await statuses(sessions))[anna.id] == Status.REJECTED
+        assert await photo_types(sessions) == {kept: PhotoType.PENDING}
+        assert not (tmp_path / blob_path).exists()
+        async with sessions() as db:
+            assert (await db.scalars(select(Blob))).all() == []
+
+    monkeypatch.chdir(tmp_path)
+    run_with_db(scenario)
+
+
+def test_only_moderators_pass():
+    moderator = User(id=1, is_moderator=True)
+    assert asyncio.run(get_current_moderator(moderator)) is moderator
+    with pytest.raises(HTTPException) as exc_info:
+        asyncio.run(get_current_moderator(User(id=2, is_moderator=False)))
+    assert exc_info.value.status_code == 403
@@ -0,0 +1,49 @@
+import asyncio
+
+import pytest
+from starlette.requests import Request
+
+from config import RateLimitSettings
+from utils.rate_limit import RateLimiter, RateLimitExceeded
+
+
+def make_request(forwarded: str, client: str = "10.0.0.2") -> Request:
+    return Request({
+        "type": "http",
+        "method": "POST",
+        "path": "/token",
+        "headers": [(b"x-forwarded-for", forwarded.encode())],
+        "client": (client, 50000),
+    })
+
+
+def make_limiter(trusted_proxies: int) -> RateLimiter:
+    return RateLimiter(RateLimitSettings(
+        enabled=True,
+        backend="memory",
+        trusted_proxies=trusted_proxies,
+        login_per_ip="3/minute",
+        login_per_email="100/minute",
+    ))
+
+
+def test_spoofed_leftmost_forwarded_for_does_not_reset_ip_counter():
+    limiter = make_limiter(trusted_proxies=1)
+
+    async def attempts():
+        # Прокси дописывает настоящий адрес клиента в конец, левую часть присылает клиент
+        for i in range(3):
+            await limiter.check(make_request(f"198.51.100.{i}, 203.0.113.7"), "login", email=f"user{i}@example.com")
+        await limiter.check(make_request("198.51.100.99, 203.0.113.7"), "login", email="other@example.com")
+
+    with pytest.raises(RateLimitExceeded) as exc_info:
+        asyncio.run(attempts())
+    assert exc_info.value.scope == "ip"
+
+
+def test_client_ip_counts_back_trusted_hops():
+    assert make_limiter(2).client_ip(make_request("1.1.1.1, 203.0.113.7, 10.0.0.1")) == "203.0.113.7"
+    # Записей меньше, чем прокси, — заголовок неполный, берётся адрес соединения
+    assert make_limiter(2).client_ip(make_request("203.0.113.7")) == "10.0.0.2"
+    # Без доверенных прокси заголовок не читается
+    assert make_limiter(0).client_ip(make_request("203.0.113.7")) == "10.0.0.2"
@@ -0,0 +1,86 @@
+import jwt
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import select
+
+from database.models import AuthToken, RevokedToken
+from schemas import RefreshTokenRequest
+from utils.jwt_manager import verify_token
+from utils.sessions import open_session
+from views.auth import refresh_tokens
+
+
+async def refresh(sessions, token: str):
+    async with sessions() as db:
+        return await refresh_tokens(RefreshTokenRequest(refresh_token=token), db)
+
+
+async def active_tokens(sessions, user_id: int):
+    async with sessions() as db:
+        stmt = select(AuthToken.token).where(AuthToken.user_id == user_id, AuthToken.is_active.is_(True))
+        return set((await db.scalars(stmt)).all())
+
+
+def test_refresh_rotates_token_of_same_device(run_with_db, add_users):
+    async def scenario(sessions):
+        async with sessions() as db:
+            [user] = await add_users(db, 1)
+            await open_session(db, user.id, "phone-1", device_id="phone")
+            await db.commit()
+
+        pair = await refresh(sessions, "phone-1")
+        assert pair.refresh_token != "phone-1"
+        assert verify_token(pair.access_token)["sub"] == str(user.id)
+        assert await active_tokens(sessions, user.id) == {pair.refresh_token}
+        async with sessions() as db:
+            rotated = await db.get(AuthToken, pair.refresh_token)
+            assert rotated.device_id == "phone"
+
+        # Новый токен тоже ротируется
+        assert (await refresh(sessions, pair.refresh_token)).refresh_token != pair.refresh_token
+
+    run_with_db(scenario)
+
+
+def test_reused_refresh_token_revokes_all_sessions(run_with_db, add_users):
+    async def scenario(sessions):
+        async with sessions() as db:
+            [user, other] = await add_users(db, 2)
+            await open_session(db, user.id, "phone-1", device_id="phone")
+            await open_session(db, user.id, "laptop-1", device_id="laptop")
+            await open_session(db, other.id, "other-1")
+            await db.commit()
+
+        pair = await refresh(sessions, "phone-1")
+        # Ротированный токен предъявлен повторно: его могли украсть
+        with pytest.raises(HTTPException) as exc_info:
+            await refresh(sessions, "phone-1")
+        assert exc_info.value.status_code == 401
+
+        assert await active_tokens(sessions, user.id) == set()
+        assert await active_tokens(sessions, other.id) == {"other-1"}
+        # Выданный до отзыва access-токен больше не принимается, и другие воркеры узнают об отзыве из журнала
+        with pytest.raises(jwt.InvalidTokenError):
+            verify_token(pair.access_token)
+        async with sessions() as db:
+            assert (await db.scalars(select(RevokedToken.user_id))).all() == [user.id]
+
+        for token in (pair.refresh_token, "laptop-1"):
+            with pytest.raises(HTTPException):
+                await refresh(sessions, token)
+
+    run_with_db(scenario)
+
+
+def test_unknown_refresh_token_revokes_nothing(run_with_db, add_users):
+    async def scenario(sessions):
+        async with sessions() as db:
+            [user] = await add_users(db, 1)
+            await open_session(db, user.id, "phone-1")
+            await db.commit()
+
+        with pytest.raises(HTTPException):
+            await refresh(sessions, "unknown")
+        assert await active_tokens(sessions, user.id) == {"phone-1"}
+
+    run_with_db(scenario)
@@ -0,0 +1,63 @@
+from sqlalchemy import select
+
+from config import SwipeSettings
+from database.models import Match, Swipe
+from utils.swipes import SwipeBuffer
+
+
+async def stored(sessions):
+    async with sessions() as db:
+        swipes = (await db.execute(select(Swipe.user_id, Swipe.target_id, Swipe.liked))).all()
+        matches = (await db.execute(select(Match.user_id, Match.matched_id))).all()
+    return set(swipes), set(matches)
+
+
+def test_buffered_swipes_are_written_in_one_flush(run_with_db, add_users):
+    async def scenario(sessions):
+        async with sessions() as db:
+            anna, boris, vera = [user.id for user in await add_users(db, 3)]
+        # Сброс по времени не наступит: пачку записывает stop()
+        buffer = SwipeBuffer(SwipeSettings(flush_interval=60), session_factory=sessions)
+        buffer.start()
+        try:
+            await buffer.add(anna, boris, True)
+            await buffer.add(anna, vera, False)
+            # Повторный свайп той же анкеты не заменяет первый
+            await buffer.add(anna, vera, True)
+            assert buffer.pending(anna, vera) is False
+            assert await stored(sessions) == (set(), set())
+        finally:
+            await buffer.stop()
+
+        assert buffer.pending(anna, vera) is None
+        assert buffer.flushes == 1
+        assert await stored(sessions) == ({(anna, boris, True), (anna, vera, False)}, set())
+
+    run_with_db(scenario)
+
+
+def test_mutual_like_creates_match_once(run_with_db, add_users):
+    async def scenario(sessions):
+        async with sessions() as db:
+            anna, boris, vera = [user.id for user in await add_users(db, 3)]
+        # Без фоновой задачи буфер сбрасывается при каждом add
+        buffer = SwipeBuffer(SwipeSettings(), session_factory=sessions)
+        await buffer.add(anna, boris, True)
+        await buffer.add(boris, anna, True)
+        await buffer.add(anna, vera, True)
+        await buffer.add(vera, anna, False)
+        assert buffer.matched == 1
+
+        # Встречные лайки в одной пачке — тоже одна пара
+        buffer.start()
+        try:
+            await buffer.add(boris, vera, True)
+            await buffer.add(vera, boris, True)
+        finally:
+            await buffer.stop()
+        assert buffer.matched == 2
+
+        _, matches = await stored(sessions)
+        assert matches == {(anna, boris), (boris, anna), (boris, vera), (vera, boris)}
+
+    run_with_db(scenario)
@@ -0,0 +1,125 @@
+import asyncio
+import json
+import logging
+import os
+from collections import Counter
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterable, List, Sequence
+
+from sqlalchemy import delete, func, select, update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from config import STORAGE_BLOBS
+from database.models import Blob
+
+
+logger = logging.getLogger(__name__)
+
+# Хранилище фото по хэшу содержимого. Одинаковые байты лежат на диске один раз,
+# сколько бы записей photos на них ни ссылалось; счётчик ссылок хранится в таблице blobs.
+#
+# Порядок действий, при котором файл не пропадает из-под новой ссылки:
+#   1. загрузка пишется во временный файл, хэш считается по ходу записи (StagedBlob);
+#   2. acquire() увеличивает счётчик в той же транзакции, что и вставка Photo;
+#   3. после commit publish() переименовывает временный файл в итоговый (повторно для дубликата — безвредно);
+#   4. release() уменьшает счётчик, collect_garbage() в отдельной транзакции удаляет записи с нулём
+#      и их файлы до commit, пока у SQLite взята блокировка записи.
+
+
+@dataclass
+class StagedBlob:
+    tmp_path: Path
+    digest: str
+    extension: str
+    size: int
+
+    @property
+    def path(self) -> Path:
+        return blob_path(self.digest, self.extension)
+
+
+def blob_path(digest: str, extension: str) -> Path:
+    # Подкаталог по первым символам хэша, чтобы в одном каталоге не было сотен тысяч файлов
+    return STORAGE_BLOBS / digest[:2] / f"{digest}{extension}"
+
+
+def is_blob_path(file_path: str) -> bool:
+    return Path(file_path).parent.parent == STORAGE_BLOBS
+
+
+def blob_files(file_path: Path) -> List[Path]:
+    # Сам файл и его уменьшенные копии: <hash>_<размер>.<hash копии>.webp
+    return [file_path, *file_path.parent.glob(f"{file_path.stem}_*")]
+
+
+def _acquire_statement(digest: str, file_path: str, size: int, count: int):
+    stmt = sqlite_insert(Blob).values(hash=digest, file_path=file_path, size=size, refcount=count)
+    return stmt.on_conflict_do_update(index_elements=[Blob.hash], set_={"refcount": Blob.refcount + count})
+
+
+async def acquire(db: AsyncSession, blobs: Sequence[StagedBlob]) -> None:
+    counts = Counter(blob.digest for blob in blobs)
+    for blob in {blob.digest: blob for blob in blobs}.values():
+        await db.execute(_acquire_statement(blob.digest, str(blob.path), blob.size, counts[blob.digest]))
+
+
+def acquire_sync(session, digest: str, file_path: str, size: int, count: int = 1) -> None:
+    session.execute(_acquire_statement(digest, file_path, size, count))
+
+
+def _publish(blobs: Sequence[StagedBlob]) -> None:
+    for blob in blobs:
+        blob.path.parent.mkdir(parents=True, exist_ok=True)
+        os.replace(blob.tmp_path, blob.path)
+
+
+async def publish(blobs: Sequence[StagedBlob]) -> None:
+    await asyncio.to_thread(_publish, blobs)
+
+
+async def discard(blobs: Sequence[StagedBlob]) -> None:
+    def remove():
+        for blob in blobs:
+            blob.tmp_path.unlink(missing_ok=True)
+
+    await asyncio.to_thread(remove)
+
+
+async def release(db: AsyncSession, file_paths: Iterable[str]) -> List[Path]:
+    # Возвращает файлы вне хранилища (загруженные до перехода на blobs): их удаляет вызывающий после commit
+    legacy = []
+    counts = Counter()
+    for file_path in file_paths:
+        if is_blob_path(file_path):
+            counts[Path(file_path).stem] += 1
+        else:
+            legacy.append(Path(file_path))
+
+    if counts:
+        # Один UPDATE на любое число файлов: счётчики передаются JSON-объектом {hash: сколько ссылок снять}
+        payload = json.dumps(counts)
+        keys = func.json_each(payload).table_valued("key")
+        decrement = func.json_extract(payload, '$."' + Blob.hash + '"')
+        stmt = update(Blob).where(Blob.hash.in_(select(keys.c.key))).values(refcount=Blob.refcount - decrement)
+        await db.execute(stmt.execution_options(synchronize_session=False))
+    return legacy
+
+
+async def collect_garbage(db: AsyncSession) -> int:
+    # Отдельная транзакция: файлы удаляются до commit, пока параллельный acquire ждёт блокировку записи
+    stmt = delete(Blob).where(Blob.refcount <= 0).returning(Blob.file_path)
+    file_paths = (await db.scalars(stmt)).all()
+    if file_paths:
+        await asyncio.to_thread(_unlink_blobs, file_paths)
+    await db.commit()
+    if file_paths:
+        logger.info(f"Удалено файлов без ссылок: {len(file_paths)}")
+    return len(file_paths)
+
+
+def _unlink_blobs(file_paths: Iterable[str]) -> None:
+    for file_path in file_paths:
+        for path in blob_files(Path(file_path)):
+            path.unlink(missing_ok=True)
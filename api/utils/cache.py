@@ -0,0 +1,79 @@
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional, Set
+
+from config import AuthCacheSettings
+
+
+# LRU-кеш с ограничением по размеру и времени жизни записей.
+# Записи можно помечать тегом (например, id пользователя), чтобы сбрасывать их группой.
+class TTLCache:
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data: OrderedDict[Hashable, tuple] = OrderedDict()
+        self._tags: Dict[Hashable, Set[Hashable]] = {}
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        item = self._data.get(key)
+        if item is None:
+            self.misses += 1
+            return None
+
+        expires_at, tag, value = item
+        if expires_at < time.monotonic():
+            self.invalidate(key)
+            self.misses += 1
+            return None
+
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: Hashable, value: Any, tag: Optional[Hashable] = None) -> None:
+        self.invalidate(key)
+        self._data[key] = (time.monotonic() + self.ttl, tag, value)
+        if tag is not None:
+            self._tags.setdefault(tag, set()).add(key)
+
+        while len(self._data) > self.maxsize:
+            oldest = next(iter(self._data))
+            self.invalidate(oldest)
+
+    def invalidate(self, key: Hashable) -> None:
+        item = self._data.pop(key, None)
+        if item is None:
+            return
+
+        tag = item[1]
+        keys = self._tags.get(tag)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._tags[tag]
+
+    def invalidate_tag(self, tag: Hashable) -> None:
+        for key in list(self._tags.get(tag, ())):
+            self.invalidate(key)
+
+    def clear(self) -> None:
+        self._data.clear()
+        self._tags.clear()
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+# Токен -> отсоединённый от сессии User (с городом и фото), тег — id пользователя
+token_cache = TTLCache(maxsize=AuthCacheSettings.maxsize, ttl=AuthCacheSettings.ttl)
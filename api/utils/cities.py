@@ -0,0 +1,302 @@
+import asyncio
+import bisect
+import gzip
+import hashlib
+import heapq
+import json
+import logging
+import re
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from fastapi import Request, Response, status
+from sqlalchemy import event, func, select
+
+from config import LIMIT_CITY_ENTITIES_FOR_SEARCH
+from database.connect import AsyncSessionLocal
+from database.models import City, DataVersion, User
+from utils.geo import city_geo_index
+
+try:
+    import brotli
+except ImportError:  # brotli необязателен, без него отдаём gzip
+    brotli = None
+
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class CataloguePayload:
+    body: bytes
+    gzip: bytes
+    br: Optional[bytes]
+    etag: str
+
+    @classmethod
+    def build(cls, items: List[dict]) -> "CataloguePayload":
+        body = json.dumps({"success": True, "items": items}, ensure_ascii=False, separators=(",", ":")).encode()
+        return cls(
+            body=body,
+            gzip=gzip.compress(body, compresslevel=9, mtime=0),
+            br=brotli.compress(body, quality=11) if brotli else None,
+            etag=f'"{hashlib.sha256(body).hexdigest()[:32]}"',
+        )
+
+    def response(self, request: Request) -> Response:
+        headers = {
+            "ETag": self.etag,
+            "Cache-Control": "no-cache",
+            "Vary": "Accept-Encoding",
+        }
+        if_none_match = request.headers.get("if-none-match", "")
+        if self.etag in [tag.strip() for tag in if_none_match.split(",")] or if_none_match.strip() == "*":
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+        accept_encoding = request.headers.get("accept-encoding", "")
+        if self.br is not None and "br" in accept_encoding:
+            body = self.br
+            headers["Content-Encoding"] = "br"
+        elif "gzip" in accept_encoding:
+            body = self.gzip
+            headers["Content-Encoding"] = "gzip"
+        else:
+            body = self.body
+        return Response(content=body, media_type="application/json", headers=headers)
+
+
+class CityCatalogue:
+    # Готовые (сериализованные и сжатые) ответы справочника городов.
+    # Пересобираются только после изменения таблицы cities.
+
+    def __init__(self):
+        self._payloads: Dict[Optional[str], CataloguePayload] = {}
+        self._empty = CataloguePayload.build([])
+        self._stale = True
+        self._lock = asyncio.Lock()
+
+    def invalidate(self) -> None:
+        self._stale = True
+
+    async def get(self, region: Optional[str] = None) -> CataloguePayload:
+        if self._stale:
+            await self.rebuild()
+        return self._payloads.get(region, self._empty)
+
+    async def rebuild(self) -> None:
+        async with self._lock:
+            if not self._stale:
+                return
+            # Флаг снимаем до чтения: изменение во время сборки снова пометит каталог устаревшим
+            self._stale = False
+            async with AsyncSessionLocal() as session:
+                stmt = select(City.id, City.name, City.region).order_by(City.name.asc())
+                rows = (await session.execute(stmt)).all()
+
+            self._payloads = await asyncio.to_thread(self._build_payloads, rows)
+            logger.info(f"Справочник городов собран: {len(rows)} записей")
+
+    @staticmethod
+    def _build_payloads(rows) -> Dict[Optional[str], CataloguePayload]:
+        by_region: Dict[Optional[str], List[dict]] = {None: []}
+        for city_id, name, region in rows:
+            item = {"id": city_id, "name": f"{name}, {region}"}
+            by_region[None].append(item)
+            by_region.setdefault(region, []).append(item)
+        return {region: CataloguePayload.build(items) for region, items in by_region.items()}
+
+
+def normalize_city_name(value: str) -> str:
+    # Регистр (включая кириллицу), ё/е, дефисы и прочие разделители
+    value = value.lower().replace('ё', 'е')
+    return ' '.join(re.split(r'[\W_]+', value)).strip()
+
+
+class CityAutocomplete:
+    # Отсортированный массив нормализованных ключей для поиска по префиксу.
+    # Для "Нижний Новгород" хранятся ключи "нижний новгород" и "новгород",
+    # поэтому находится по любому слову. Рейтинг — число пользователей в городе.
+
+    REFRESH_SECONDS = 3600  # как часто пересчитывать популярность
+    SHORT_PREFIX = 2
+    FUZZY_CACHE_SIZE = 1024
+
+    def __init__(self):
+        self._keys: List[str] = []
+        self._refs: List[int] = []  # индекс города в _cities для каждого ключа
+        self._cities: List[Tuple[int, str, str, int]] = []  # (id, нормализованное имя, полное имя, пользователей)
+        self._short_results: Dict[Tuple[str, int], List[dict]] = {}
+        self._fuzzy_results: Dict[Tuple[str, int], List[int]] = {}
+        self._stale = True
+        self._built_at = 0.0
+        self._lock = asyncio.Lock()
+
+    def invalidate(self) -> None:
+        self._stale = True
+
+    def load(self, rows: Sequence[Tuple[int, str, str, int]]) -> None:
+        cities = []
+        pairs = []
+        for city_id, name, region, users_count in rows:
+            normalized = normalize_city_name(name)
+            ref = len(cities)
+            cities.append((city_id, normalized, f"{name}, {region}", users_count))
+            words = normalized.split(' ')
+            for i in range(len(words)):
+                pairs.append((' '.join(words[i:]), ref))
+
+        pairs.sort()
+        self._keys = [key for key, _ in pairs]
+        self._refs = [ref for _, ref in pairs]
+        self._cities = cities
+        self._short_results = {}
+        self._fuzzy_results = {}
+        self._built_at = time.monotonic()
+
+    async def rebuild(self) -> None:
+        async with self._lock:
+            if not self._stale and time.monotonic() - self._built_at < self.REFRESH_SECONDS:
+                return
+            self._stale = False
+            async with AsyncSessionLocal() as session:
+                users_count = (
+                    select(User.city_id, func.count().label("total"))
+                    .group_by(User.city_id)
+                    .subquery()
+                )
+                stmt = (
+                    select(City.id, City.name, City.region, func.coalesce(users_count.c.total, 0))
+                    .outerjoin(users_count, users_count.c.city_id == City.id)
+                )
+                rows = (await session.execute(stmt)).all()
+            self.load(rows)
+            logger.info(f"Индекс поиска городов собран: {len(self._keys)} ключей")
+
+    async def search(self, query: Optional[str], limit: int = LIMIT_CITY_ENTITIES_FOR_SEARCH) -> List[dict]:
+        if self._stale or time.monotonic() - self._built_at >= self.REFRESH_SECONDS:
+            await self.rebuild()
+        return self.lookup(query, limit)
+
+    def lookup(self, query: Optional[str], limit: int = LIMIT_CITY_ENTITIES_FOR_SEARCH) -> List[dict]:
+        prefix = normalize_city_name(query or '')
+        if not prefix:
+            return []
+
+        # Короткие префиксы совпадают с сотнями ключей, их результат запоминаем
+        short = len(prefix) <= self.SHORT_PREFIX
+        if short and (prefix, limit) in self._short_results:
+            return self._short_results[prefix, limit]
+
+        refs = set()
+        i = bisect.bisect_left(self._keys, prefix)
+        while i < len(self._keys) and self._keys[i].startswith(prefix):
+            refs.add(self._refs[i])
+            i += 1
+
+        cities = self._cities
+        if refs:
+            best = heapq.nsmallest(
+                limit,
+                refs,
+                key=lambda ref: (cities[ref][1] != prefix, -cities[ref][3], cities[ref][2]),
+            )
+        else:
+            best = self._fuzzy(prefix, limit)
+
+        items = [{"id": cities[ref][0], "name": cities[ref][2]} for ref in best]
+        if short:
+            self._short_results[prefix, limit] = items
+        return items
+
+    def _fuzzy(self, prefix: str, limit: int) -> List[int]:
+        # Опечатки: расстояние от запроса до ближайшего начала ключа (1 правка, для длинных запросов 2).
+        # Первую букву считаем верной — это сужает перебор до одного участка массива.
+        if (prefix, limit) in self._fuzzy_results:
+            return self._fuzzy_results[prefix, limit]
+
+        max_distance = 1 if len(prefix) <= 4 else 2
+        lo = bisect.bisect_left(self._keys, prefix[0])
+        hi = bisect.bisect_left(self._keys, prefix[0] + '\uffff')
+
+        distances: Dict[int, int] = {}
+        for key, ref in zip(self._keys[lo:hi], self._refs[lo:hi]):
+            distance = prefix_distance(prefix, key[:len(prefix) + max_distance], max_distance)
+            if distance <= max_distance and distance < distances.get(ref, max_distance + 1):
+                distances[ref] = distance
+
+        cities = self._cities
+        result = heapq.nsmallest(
+            limit,
+            distances,
+            key=lambda ref: (distances[ref], -cities[ref][3], cities[ref][2]),
+        )
+        if len(self._fuzzy_results) >= self.FUZZY_CACHE_SIZE:
+            self._fuzzy_results.clear()
+        self._fuzzy_results[prefix, limit] = result
+        return result
+
+
+def prefix_distance(query: str, key: str, max_distance: int) -> int:
+    # Редакционное расстояние (с перестановкой соседних букв) от query до лучшего префикса key
+    previous2 = None
+    previous = list(range(len(key) + 1))
+    for i in range(1, len(query) + 1):
+        current = [i] + [0] * len(key)
+        for j in range(1, len(key) + 1):
+            cost = query[i - 1] != key[j - 1]
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if i > 1 and j > 1 and query[i - 1] == key[j - 2] and query[i - 2] == key[j - 1]:
+                current[j] = min(current[j], previous2[j - 2] + 1)
+        if min(current) > max_distance:
+            return max_distance + 1
+        previous2, previous = previous, current
+    return min(previous)
+
+
+class CityVersionWatcher:
+    # Справочник меняет и другой процесс (python -m utils.load_cities), события ORM этого воркера
+    # о том не узнают. Загрузчик увеличивает версию "cities" в data_versions; воркер сверяет её
+    # не чаще раза в CHECK_SECONDS (поиск по первичному ключу) и при расхождении сбрасывает
+    # каталог, автодополнение и гео-индекс.
+
+    NAME = "cities"
+    CHECK_SECONDS = 10
+
+    def __init__(self):
+        self._version: Optional[int] = None
+        self._next_check = 0.0
+
+    async def check(self) -> None:
+        now = time.monotonic()
+        if now < self._next_check:
+            return
+        self._next_check = now + self.CHECK_SECONDS
+
+        async with AsyncSessionLocal() as session:
+            version = await session.scalar(select(DataVersion.version).where(DataVersion.name == self.NAME))
+        version = version or 0
+        if self._version is not None and version != self._version:
+            logger.info(f"Справочник городов изменён (версия {version}), данные в памяти пересобираются")
+            invalidate_cities()
+        self._version = version
+
+
+def invalidate_cities() -> None:
+    city_catalogue.invalidate()
+    city_autocomplete.invalidate()
+    city_geo_index.invalidate()
+
+
+city_catalogue = CityCatalogue()
+city_autocomplete = CityAutocomplete()
+city_versions = CityVersionWatcher()
+
+
+@event.listens_for(City, "after_insert")
+@event.listens_for(City, "after_update")
+@event.listens_for(City, "after_delete")
+def _on_city_change(mapper, connection, target):
+    # Свой воркер — сразу, остальные — по версии в той же транзакции
+    invalidate_cities()
+    connection.execute(DataVersion.bump(CityVersionWatcher.NAME))
@@ -0,0 +1,205 @@
+"""
+Перенос фото из каталогов storage/uploads/user_{id}/ в хранилище по хэшу содержимого (utils.blobs).
+Одинаковые файлы остаются на диске в одном экземпляре, Photo.file_path и Photo.variants
+переписываются на новые пути. Повторный запуск безопасен: уже перенесённые записи пропускаются.
+
+    cd api && python -m utils.dedup_photos [--dry-run] [--delete-orphans] [--batch-size 500]
+"""
+import argparse
+import hashlib
+import os
+import shutil
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Set, Tuple
+
+from sqlalchemy import Engine, select
+from sqlalchemy.orm import Session
+
+from config import STORAGE_BLOBS, STORAGE_UPLOADS
+from constants import PHOTO_HASH_LENGTH
+from database.models import Photo
+from utils.blobs import acquire_sync, blob_path
+from utils.uploads import sniff_image_extension
+
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+@dataclass
+class DedupReport:
+    photos: int = 0
+    duplicates: int = 0
+    missing: int = 0
+    orphans: int = 0
+    reclaimed_bytes: int = 0
+
+    def __str__(self) -> str:
+        return (
+            f"перенесено фото: {self.photos}, дубликатов: {self.duplicates}, файлов без записи: {self.orphans}, "
+            f"отсутствуют на диске: {self.missing}, освобождено: {self.reclaimed_bytes / 1024 / 1024:.1f} МБ"
+        )
+
+
+def file_digest(path: Path) -> Tuple[str, int, bytes]:
+    # Хэш, размер и первые байты (по ним определяется формат) за одно чтение файла
+    hasher = hashlib.sha256()
+    size = 0
+    head = b''
+    with open(path, 'rb') as file:
+        while chunk := file.read(HASH_CHUNK_SIZE):
+            if not head:
+                head = chunk[:16]
+            hasher.update(chunk)
+            size += len(chunk)
+    return hasher.hexdigest(), size, head
+
+
+def place(source: Path, target: Path, dry_run: bool, seen: Set[Path]) -> bool:
+    # True, если такой файл уже есть в хранилище и источник — лишняя копия
+    if target in seen or target.exists():
+        return True
+    seen.add(target)
+    if not dry_run:
+        target.parent.mkdir(parents=True, exist_ok=True)
+        # Жёсткая ссылка вместо копирования: байты не дублируются даже до удаления источника
+        try:
+            os.link(source, target)
+        except OSError:
+            shutil.copy2(source, target)
+    return False
+
+
+class PhotoDeduplicator:
+    def __init__(self, dry_run: bool = False):
+        self.dry_run = dry_run
+        self.report = DedupReport()
+        self.seen: Set[Path] = set()
+        self.placed: Dict[Path, Tuple[str, Path]] = {}  # исходный файл -> (хэш, путь в хранилище)
+        self.to_unlink: List[Path] = []
+
+    def migrate_file(self, source: Path, target_for) -> Tuple[str, Path, int]:
+        if source in self.placed:
+            digest, target = self.placed[source]
+            return digest, target, 0
+
+        digest, size, head = file_digest(source)
+        target = target_for(digest, head, source)
+        if place(source, target, self.dry_run, self.seen):
+            self.report.duplicates += 1
+            self.report.reclaimed_bytes += size
+        self.placed[source] = (digest, target)
+        self.to_unlink.append(source)
+        return digest, target, size
+
+    def migrate_photo(self, session: Session, photo: Photo) -> None:
+        source = Path(photo.file_path)
+        # Файл, уже перенесённый для другой записи, в прошлой пачке удалён из источника: сначала кеш
+        if source not in self.placed and not source.is_file():
+            self.report.missing += 1
+            return
+
+        def original_target(digest: str, head: bytes, path: Path) -> Path:
+            return blob_path(digest, sniff_image_extension(head) or path.suffix.lower())
+
+        digest, target, size = self.migrate_file(source, original_target)
+
+        variants = {}
+        for size_name, variant in (photo.variants or {}).items():
+            variant_path = Path(variant)
+            if variant_path not in self.placed and not variant_path.is_file():
+                continue
+
+            def variant_target(variant_digest: str, head: bytes, path: Path) -> Path:
+                return target.with_name(f"{digest}_{size_name}.{variant_digest[:PHOTO_HASH_LENGTH]}{path.suffix}")
+
+            _, new_variant, _ = self.migrate_file(variant_path, variant_target)
+            variants[size_name] = str(new_variant)
+
+        self.report.photos += 1
+        if not self.dry_run:
+            acquire_sync(session, digest, str(target), size or target.stat().st_size)
+            photo.file_path = str(target)
+            photo.variants = variants or None
+
+    def unlink_sources(self) -> None:
+        if not self.dry_run:
+            for path in self.to_unlink:
+                path.unlink(missing_ok=True)
+        self.to_unlink = []
+
+    def remove_orphans(self, referenced: Set[Path], delete: bool) -> None:
+        # Файлы в каталогах пользователей, на которые не ссылается ни одна запись: недогруженные части и т.п.
+        for path in STORAGE_UPLOADS.rglob('*'):
+            if not path.is_file() or path in referenced or path in self.placed:
+                continue
+            self.report.orphans += 1
+            if delete:
+                self.report.reclaimed_bytes += path.stat().st_size
+                if not self.dry_run:
+                    path.unlink()
+
+
+def dedup_photos(
+    engine: Engine,
+    batch_size: int = 500,
+    dry_run: bool = False,
+    delete_orphans: bool = False,
+) -> DedupReport:
+    dedup = PhotoDeduplicator(dry_run)
+    blobs_prefix = f"{STORAGE_BLOBS}{os.sep}"
+    last_id = 0
+
+    with Session(engine) as session:
+        while True:
+            stmt = (
+                select(Photo)
+                .where(Photo.id > last_id, Photo.file_path.not_like(f"{blobs_prefix}%"))
+                .order_by(Photo.id)
+                .limit(batch_size)
+            )
+            photos = session.scalars(stmt).all()
+            if not photos:
+                break
+            for photo in photos:
+                dedup.migrate_photo(session, photo)
+            last_id = photos[-1].id
+
+            # Источники удаляются только после commit: до него записи указывают на старые пути
+            if not dry_run:
+                session.commit()
+            dedup.unlink_sources()
+
+        referenced = {
+            Path(path)
+            for path in session.scalars(select(Photo.file_path).where(Photo.file_path.not_like(f"{blobs_prefix}%")))
+        }
+
+    dedup.remove_orphans(referenced, delete_orphans)
+    if not dry_run:
+        for directory in sorted(STORAGE_UPLOADS.glob('user_*'), reverse=True):
+            if directory.is_dir() and not any(directory.iterdir()):
+                directory.rmdir()
+    return dedup.report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Перенос фото в хранилище по хэшу содержимого")
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--dry-run", action="store_true", help="только посчитать, ничего не менять")
+    parser.add_argument("--delete-orphans", action="store_true", help="удалить файлы, на которые нет записей")
+    args = parser.parse_args()
+
+    from database.connect import engine, init_db
+
+    init_db()
+
+    started = time.perf_counter()
+    report = dedup_photos(engine, args.batch_size, args.dry_run, args.delete_orphans)
+    prefix = "Пробный запуск" if args.dry_run else "Фото перенесены"
+    print(f"{prefix} за {time.perf_counter() - started:.2f} с — {report}")
+
+
+if __name__ == "__main__":
+    main()
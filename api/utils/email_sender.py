@@ -1,41 +1,330 @@
+import asyncio
+import hashlib
 import logging
+import random
+import time
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta, timezone
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
+from typing import Dict, List, Optional
 
 import aiosmtplib
+from sqlalchemy import event, select, update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
 
-from config import SMTP_SERVER, SMTP_PORT, SMTP_USERNAME, SMTP_PASSWORD
+from config import EMAIL_FROM, SMTP_SERVER, SMTP_PORT, SMTP_USERNAME, SMTP_PASSWORD, EmailSettings
+from constants import EmailStatus
+from database.models import OutboxEmail
+from utils.metrics import email_messages, email_send_duration
 
 
 logger = logging.getLogger(__name__)
 
+# Обработчики только кладут письмо в таблицу email_outbox в своей транзакции: письмо уходит,
+# только если транзакция зафиксирована, и не теряется при сбое SMTP. Отправляет EmailOutbox в фоне.
+OUTBOX_NOTIFY_KEY = "email_outbox_notify"
 
-async def send_password(to_email: str, password: str) -> bool:
-    subject = f"Ваш пароль"
-    body = f"Ваш пароль: {password} от UME Dating."
 
+def build_message(to_email: str, subject: str, body: str) -> MIMEMultipart:
     msg = MIMEMultipart()
-    msg['From'] = SMTP_USERNAME
+    msg['From'] = EMAIL_FROM
     msg['To'] = to_email
     msg['Subject'] = subject
-
     msg.attach(MIMEText(body, 'plain'))
+    return msg
+
+
+def email_dedup_key(to_email: str, purpose: str, ref) -> str:
+    # Только из постоянных полей: тело может содержать только что созданный пароль
+    return hashlib.sha256(f"{to_email.lower()}\n{purpose}\n{ref}".encode()).hexdigest()
+
+
+async def enqueue_email(
+    db: AsyncSession,
+    to_email: str,
+    subject: str,
+    body: str,
+    dedup_key: str,
+    replace: bool = False,
+) -> None:
+    # Письмо с тем же dedup_key не добавляется второй раз. replace — новое содержимое важнее прежнего
+    # (новый пароль): письмо заменяется и снова ставится в очередь, даже если прежнее уже ушло.
+    now = datetime.now(timezone.utc)
+    stmt = sqlite_insert(OutboxEmail).values(
+        dedup_key=dedup_key, to_email=to_email, subject=subject, body=body, status=EmailStatus.PENDING,
+        next_attempt_at=now,
+    )
+    if replace:
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[OutboxEmail.dedup_key],
+            set_={"to_email": to_email, "subject": subject, "body": body, "status": EmailStatus.PENDING,
+                  "attempts": 0, "next_attempt_at": now, "last_error": None, "sent_at": None},
+        )
+    else:
+        stmt = stmt.on_conflict_do_nothing(index_elements=[OutboxEmail.dedup_key])
+    await db.execute(stmt)
+    db.info[OUTBOX_NOTIFY_KEY] = True
+
+
+async def send_password(db: AsyncSession, user_id: int, to_email: str, password: str) -> None:
+    # Одно письмо с паролем на пользователя: действует только последний выданный пароль
+    await enqueue_email(
+        db, to_email, "Ваш пароль", f"Ваш пароль: {password} от UME Dating.",
+        dedup_key=email_dedup_key(to_email, "password", user_id), replace=True,
+    )
+
+
+@event.listens_for(Session, "after_commit")
+def _wake_outbox(session):
+    # Будим отправку сразу после commit, а не по таймеру
+    if session.info.pop(OUTBOX_NOTIFY_KEY, False):
+        email_outbox.notify()
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_outbox(session):
+    session.info.pop(OUTBOX_NOTIFY_KEY, None)
+
+
+class SMTPPool:
+    # Небольшой пул авторизованных соединений: TLS и AUTH проходят один раз на соединение, а не на письмо
+    def __init__(
+        self,
+        settings: EmailSettings = EmailSettings(),
+        hostname: Optional[str] = SMTP_SERVER,
+        port: Optional[str] = SMTP_PORT,
+        username: Optional[str] = SMTP_USERNAME,
+        password: Optional[str] = SMTP_PASSWORD,
+    ):
+        self.settings = settings
+        self.hostname = hostname
+        self.port = int(port) if port else None
+        self.username = username
+        self.password = password
+        self._idle: List[aiosmtplib.SMTP] = []
+        self._last_used: Dict[int, float] = {}
+        self._semaphore = asyncio.Semaphore(settings.pool_size)
+        self.connects = 0
+
+    async def _connect(self) -> aiosmtplib.SMTP:
+        smtp = aiosmtplib.SMTP(
+            hostname=self.hostname,
+            port=self.port,
+            use_tls=self.settings.use_tls,
+            timeout=self.settings.timeout,
+        )
+        await smtp.connect()
+        if self.username:
+            await smtp.login(self.username, self.password)
+        self.connects += 1
+        return smtp
+
+    async def _checkout(self) -> aiosmtplib.SMTP:
+        while self._idle:
+            smtp = self._idle.pop()
+            idle_for = time.monotonic() - self._last_used.pop(id(smtp), 0)
+            if not smtp.is_connected:
+                continue
+            if idle_for < self.settings.idle_check_seconds:
+                return smtp
+            # Сервер мог закрыть простоявшее соединение
+            try:
+                await smtp.noop()
+                return smtp
+            except aiosmtplib.SMTPException:
+                smtp.close()
+        return await self._connect()
+
+    @asynccontextmanager
+    async def connection(self):
+        async with self._semaphore:
+            smtp = await self._checkout()
+            try:
+                yield smtp
+            except BaseException:
+                smtp.close()
+                raise
+            self._last_used[id(smtp)] = time.monotonic()
+            self._idle.append(smtp)
+
+    async def close(self) -> None:
+        idle, self._idle = self._idle, []
+        self._last_used.clear()
+        for smtp in idle:
+            try:
+                await smtp.quit()
+            except aiosmtplib.SMTPException:
+                smtp.close()
 
-    try:
-        await aiosmtplib.send(
-            msg,
-            hostname=SMTP_SERVER,
-            port=SMTP_PORT,
-            username=SMTP_USERNAME,
-            password=SMTP_PASSWORD,
-            use_tls=True,
+
+class SMTPConnectionError(Exception):
+    # Сбой соединения, TLS или AUTH, а не отказ по конкретному письму: такие письма всегда
+    # повторяются, даже если сервер ответил 5xx (например, 535 на неверный пароль)
+    pass
+
+
+def is_permanent(error: Exception) -> bool:
+    # 5xx в ответ на само письмо (адрес не существует и т.п.) — повтор не поможет
+    if isinstance(error, SMTPConnectionError):
+        return False
+    if isinstance(error, aiosmtplib.SMTPRecipientsRefused):
+        return all(500 <= refused.code < 600 for refused in error.recipients)
+    return isinstance(error, aiosmtplib.SMTPResponseException) and 500 <= error.code < 600
+
+
+class EmailOutbox:
+    def __init__(self, settings: EmailSettings = EmailSettings(), session_factory=None, pool: Optional[SMTPPool] = None):
+        self.settings = settings
+        self.pool = pool or SMTPPool(settings)
+        self._session_factory = session_factory
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self.sent = 0
+        self.retried = 0
+        self.failed = 0
+
+    @property
+    def session_factory(self):
+        if self._session_factory is None:
+            from database.connect import AsyncSessionLocal
+            self._session_factory = AsyncSessionLocal
+        return self._session_factory
+
+    def notify(self) -> None:
+        self._wakeup.set()
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.pool.close()
+
+    async def _run(self) -> None:
+        while True:
+            self._wakeup.clear()
+            try:
+                delivered = await self.deliver_due()
+            except Exception as e:
+                logger.error(f"Ошибка очереди писем: {e}")
+                delivered = 0
+            # Полная пачка — в очереди, скорее всего, есть ещё письма
+            if delivered < self.settings.batch_size:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self.settings.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+
+    def backoff(self, attempts: int) -> float:
+        delay = min(self.settings.backoff_base * 2 ** (attempts - 1), self.settings.backoff_max)
+        return delay * random.uniform(0.5, 1.0)
+
+    async def claim(self, session: AsyncSession) -> List[OutboxEmail]:
+        # Письма берутся в аренду сдвигом next_attempt_at: другой процесс их не возьмёт,
+        # а после падения воркера они сами вернутся в очередь по истечении аренды.
+        # Возвращённый next_attempt_at — метка аренды для записи результата (deliver_due).
+        now = datetime.now(timezone.utc)
+        due = (
+            select(OutboxEmail.id)
+            .where(OutboxEmail.status == EmailStatus.PENDING, OutboxEmail.next_attempt_at <= now)
+            .order_by(OutboxEmail.next_attempt_at)
+            .limit(self.settings.batch_size)
+        )
+        stmt = (
+            update(OutboxEmail)
+            .where(OutboxEmail.id.in_(due.scalar_subquery()))
+            .values(
+                next_attempt_at=now + timedelta(seconds=self.settings.lease_seconds),
+                attempts=OutboxEmail.attempts + 1,
+            )
+            .returning(OutboxEmail)
         )
-        logger.info(f"Password sent to {to_email}")
-        return True
-    except Exception as e:
-        logger.error(f"Failed to send password to {to_email}: {e}")
-    return False
+        emails = (await session.scalars(stmt)).all()
+        await session.commit()
+        return emails
+
+    async def _send_chunk(self, emails: List[OutboxEmail], results: Dict[int, Optional[Exception]]) -> None:
+        pending = list(emails)
+        try:
+            async with self.pool.connection() as smtp:
+                while pending:
+                    email = pending[0]
+                    started = time.perf_counter()
+                    try:
+                        await smtp.send_message(build_message(email.to_email, email.subject, email.body))
+                        results[email.id] = None
+                        email_send_duration.observe(time.perf_counter() - started, "sent")
+                    except (aiosmtplib.SMTPResponseException, aiosmtplib.SMTPRecipientsRefused) as e:
+                        # Отказ по одному письму, соединение исправно
+                        results[email.id] = e
+                        email_send_duration.observe(time.perf_counter() - started, "refused")
+                    pending.pop(0)
+        except (aiosmtplib.SMTPException, OSError, asyncio.TimeoutError) as e:
+            # Нет соединения или оно потеряно: остаток пачки уйдёт в следующую попытку
+            error = SMTPConnectionError(str(e))
+            error.__cause__ = e
+            for email in pending:
+                results[email.id] = error
+
+    async def deliver_due(self) -> int:
+        async with self.session_factory() as session:
+            emails = await self.claim(session)
+        if not emails:
+            return 0
+
+        results: Dict[int, Optional[Exception]] = {}
+        chunks = [emails[i::self.settings.pool_size] for i in range(self.settings.pool_size)]
+        await asyncio.gather(*(self._send_chunk(chunk, results) for chunk in chunks if chunk))
+
+        now = datetime.now(timezone.utc)
+        updates = []
+        for email in emails:
+            error = results.get(email.id)
+            if error is None:
+                self.sent += 1
+                email_messages.inc("sent")
+                # Тело с паролем не хранится дольше, чем нужно (и после отказа тоже)
+                updates.append({"id": email.id, "status": EmailStatus.SENT, "sent_at": now, "body": "", "last_error": None})
+            elif is_permanent(error) or (
+                email.attempts >= self.settings.max_attempts and not isinstance(error, SMTPConnectionError)
+            ):
+                self.failed += 1
+                email_messages.inc("failed")
+                logger.error(f"Письмо {email.id} для {email.to_email} не отправлено: {error}")
+                updates.append({"id": email.id, "status": EmailStatus.FAILED, "body": "", "last_error": str(error)})
+            else:
+                self.retried += 1
+                email_messages.inc("retried")
+                # Сбой соединения не исчерпывает попытки: письмо ждёт сервер с паузой до backoff_max
+                logger.warning(f"Письмо {email.id} будет отправлено повторно: {error}")
+                retry_at = now + timedelta(seconds=self.backoff(email.attempts))
+                updates.append({"id": email.id, "next_attempt_at": retry_at, "last_error": str(error)})
+
+        leases = {email.id: email.next_attempt_at for email in emails}
+        async with self.session_factory() as session:
+            for values in updates:
+                email_id = values.pop("id")
+                # Письмо, заменённое за время отправки (enqueue_email с replace), ждёт своей очереди
+                await session.execute(
+                    update(OutboxEmail)
+                    .where(OutboxEmail.id == email_id, OutboxEmail.next_attempt_at == leases[email_id])
+                    .values(**values)
+                )
+            await session.commit()
+        return len(emails)
+
+    def stats(self) -> dict:
+        return {"sent": self.sent, "retried": self.retried, "failed": self.failed, "connects": self.pool.connects}
 
 
-# import asyncio
-# print(asyncio.run(send_password('impuls64g@gmail.com', 'qweqwe1234')))
+email_outbox = EmailOutbox()
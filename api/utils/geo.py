@@ -0,0 +1,136 @@
+import asyncio
+import bisect
+import logging
+import math
+from collections import defaultdict
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import select
+
+from database.connect import AsyncSessionLocal
+from database.models import City
+
+
+logger = logging.getLogger(__name__)
+
+EARTH_RADIUS_KM = 6371.0
+CELL_DEGREES = 1.0  # ~111 км по широте
+GRID_COLUMNS = int(360 / CELL_DEGREES)  # столбцы сетки замкнуты: за 180° восточной долготы идёт -180°
+
+
+def haversine_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+
+class CityGeoIndex:
+    # Сетка по градусам для поиска городов в радиусе и списки соседей в пределах MAX_PRECOMPUTED_KM.
+    # Списки всех городов считаются при сборке индекса (rebuild, в потоке), и запрос с любым
+    # радиусом до MAX_PRECOMPUTED_KM — это bisect по готовому списку, без вычисления расстояний.
+    # Радиус больше — обход сетки на запрос.
+
+    MAX_PRECOMPUTED_KM = 200
+
+    def __init__(self):
+        self._names: Dict[int, str] = {}
+        self._coords: Dict[int, Tuple[float, float]] = {}
+        self._grid: Dict[Tuple[int, int], List[int]] = defaultdict(list)
+        # id -> (расстояния, id, расстояния для ответа с округлением до 100 м), по возрастанию
+        self._neighbours: Dict[int, Tuple[List[float], List[int], List[float]]] = {}
+        self._stale = True
+        self._lock = asyncio.Lock()
+
+    def invalidate(self) -> None:
+        self._stale = True
+
+    def load(self, rows: Sequence[Tuple[int, str, str, Optional[float], Optional[float]]]) -> None:
+        # Выполняется в потоке, пока запросы читают прежний индекс: новый собирается целиком
+        # и подменяет прежний в конце
+        names = {city_id: f"{name}, {region}" for city_id, name, region, _, _ in rows}
+        coords = {
+            city_id: (lat, lon)
+            for city_id, _, _, lat, lon in rows
+            if lat is not None and lon is not None
+        }
+        grid = defaultdict(list)
+        for city_id, (lat, lon) in coords.items():
+            grid[self._cell(lat, lon)].append(city_id)
+        neighbours = {}
+        for city_id in coords:
+            found = sorted(self._scan(city_id, self.MAX_PRECOMPUTED_KM, coords, grid))
+            neighbours[city_id] = (
+                [distance for distance, _ in found],
+                [other for _, other in found],
+                [round(distance, 1) for distance, _ in found],
+            )
+        self._names, self._coords, self._grid, self._neighbours = names, coords, grid, neighbours
+
+    async def rebuild(self) -> None:
+        async with self._lock:
+            if not self._stale:
+                return
+            self._stale = False
+            async with AsyncSessionLocal() as session:
+                stmt = select(City.id, City.name, City.region, City.latitude, City.longitude)
+                rows = (await session.execute(stmt)).all()
+            await asyncio.to_thread(self.load, rows)
+            logger.info(
+                f"Геоиндекс городов собран: {len(self._coords)} городов с координатами, "
+                f"соседей в {self.MAX_PRECOMPUTED_KM} км: {sum(len(ids) for _, ids, _ in self._neighbours.values())}"
+            )
+
+    async def nearby(self, city_id: int, radius_km: float) -> List[Tuple[int, float]]:
+        if self._stale:
+            await self.rebuild()
+        return self.within(city_id, radius_km)
+
+    def name(self, city_id: int) -> Optional[str]:
+        return self._names.get(city_id)
+
+    def within(self, city_id: int, radius_km: float) -> List[Tuple[int, float]]:
+        # (id, расстояние в км) по возрастанию расстояния, включая сам город.
+        # Город без координат находит только сам себя.
+        coords, neighbours = self._coords, self._neighbours
+        if city_id not in coords or city_id not in neighbours:
+            return [(city_id, 0.0)]
+
+        if radius_km <= self.MAX_PRECOMPUTED_KM:
+            distances, ids, rounded = neighbours[city_id]
+            end = bisect.bisect_right(distances, radius_km)
+            return list(zip(ids[:end], rounded[:end]))
+
+        found = sorted(self._scan(city_id, radius_km, coords, self._grid))
+        return [(other, round(distance, 1)) for distance, other in found]
+
+    def _cell(self, lat: float, lon: float) -> Tuple[int, int]:
+        return int(math.floor(lat / CELL_DEGREES)), int(math.floor(lon / CELL_DEGREES)) % GRID_COLUMNS
+
+    def _scan(self, city_id: int, radius_km: float, coords: Dict, grid: Dict) -> List[Tuple[float, int]]:
+        lat, lon = coords[city_id]
+        lat_span = radius_km / 111.0
+        min_row = int(math.floor(max(lat - lat_span, -90.0) / CELL_DEGREES))
+        max_row = int(math.floor(min(lat + lat_span, 90.0) / CELL_DEGREES))
+        # Ширина по долготе — по самой близкой к полюсу широте круга; у полюса круг охватывает все столбцы
+        edge_lat = min(abs(lat) + lat_span, 90.0)
+        cos_edge = math.cos(math.radians(edge_lat))
+        lon_span = radius_km / (111.0 * cos_edge) if cos_edge > 0.01 else 180.0
+        if lon_span >= 180.0:
+            columns = range(GRID_COLUMNS)
+        else:
+            # Столбцы берутся по модулю: круг у 180° захватывает и край с -180°
+            first = int(math.floor((lon - lon_span) / CELL_DEGREES))
+            last = int(math.floor((lon + lon_span) / CELL_DEGREES))
+            columns = {col % GRID_COLUMNS for col in range(first, last + 1)}
+
+        found = []
+        for row in range(min_row, max_row + 1):
+            for col in columns:
+                for other in grid.get((row, col), ()):
+                    distance = haversine_km(lat, lon, *coords[other])
+                    if distance <= radius_km:
+                        found.append((distance, other))
+        return found
+
+
+city_geo_index = CityGeoIndex()
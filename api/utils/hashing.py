@@ -0,0 +1,78 @@
+import asyncio
+import logging
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from typing import Optional, Tuple
+
+from config import HashingSettings
+from utils.metrics import password_hash_duration, password_hash_wait
+
+
+logger = logging.getLogger(__name__)
+
+@lru_cache(maxsize=None)
+def get_context():
+    # passlib загружается только там, где хешируют: в процессах пула, а не в каждом воркере при импорте
+    from passlib.context import CryptContext
+
+    # Хеши с другим числом раундов считаются устаревшими и пересчитываются при входе
+    return CryptContext(
+        schemes=["pbkdf2_sha256"],
+        pbkdf2_sha256__default_rounds=HashingSettings.rounds,
+        pbkdf2_sha256__min_rounds=HashingSettings.rounds,
+        pbkdf2_sha256__max_rounds=HashingSettings.rounds,
+    )
+
+_executor: Optional[ProcessPoolExecutor] = None
+_semaphore: Optional[asyncio.Semaphore] = None
+
+
+def _hash(password: str) -> str:
+    return get_context().hash(password)
+
+
+def _verify_and_update(password: str, password_hash: str) -> Tuple[bool, Optional[str]]:
+    return get_context().verify_and_update(password, password_hash)
+
+
+def get_executor() -> ProcessPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=HashingSettings.workers)
+        logger.info(f"Пул хеширования паролей запущен, процессов: {HashingSettings.workers}")
+    return _executor
+
+
+async def _run(operation: str, func, *args):
+    global _semaphore
+    if _semaphore is None:
+        _semaphore = asyncio.Semaphore(HashingSettings.max_pending)
+
+    # Лишние запросы ждут в цикле событий, очередь пула остаётся ограниченной
+    queued = time.perf_counter()
+    async with _semaphore:
+        started = time.perf_counter()
+        password_hash_wait.observe(started - queued, operation)
+        loop = asyncio.get_running_loop()
+        try:
+            return await loop.run_in_executor(get_executor(), func, *args)
+        finally:
+            password_hash_duration.observe(time.perf_counter() - started, operation)
+
+
+async def hash_password(password: str) -> str:
+    return await _run("hash", _hash, password)
+
+
+# Возвращает (пароль верен, новый хеш или None, если пересчёт не нужен)
+async def verify_password(password: str, password_hash: str) -> Tuple[bool, Optional[str]]:
+    return await _run("verify", _verify_and_update, password, password_hash)
+
+
+def shutdown():
+    global _executor, _semaphore
+    if _executor is not None:
+        _executor.shutdown(wait=True, cancel_futures=True)
+        _executor = None
+    _semaphore = None
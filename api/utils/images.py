@@ -0,0 +1,97 @@
+import asyncio
+import hashlib
+import io
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import select
+
+from config import ImageSettings
+from constants import PHOTO_HASH_LENGTH, PHOTO_VARIANT_FORMAT, PHOTO_VARIANT_QUALITY, PHOTO_VARIANT_SIZES
+from database.connect import AsyncSessionLocal
+from database.models import Photo
+from utils.cache import token_cache
+from utils.jwt_manager import revocation_list
+
+
+logger = logging.getLogger(__name__)
+
+_executor: Optional[ProcessPoolExecutor] = None
+
+
+def render_variants(source: str) -> Dict[str, str]:
+    # Выполняется в отдельном процессе: Pillow держит GIL на время декодирования и сжатия
+    from PIL import Image, ImageOps
+
+    source_path = Path(source)
+    # Хэш оригинала в имени копий не нужен: у каждой копии свой
+    stem = source_path.stem.rsplit(".", 1)[0]
+    variants = {}
+    with Image.open(source_path) as image:
+        image = ImageOps.exif_transpose(image)
+        if image.mode not in ("RGB", "RGBA"):
+            image = image.convert("RGBA" if "A" in image.getbands() else "RGB")
+
+        # От большего к меньшему: каждая копия уменьшается из предыдущей, а не из оригинала
+        for size, max_side in sorted(PHOTO_VARIANT_SIZES.items(), key=lambda item: -item[1]):
+            image.thumbnail((max_side, max_side), Image.Resampling.LANCZOS)
+            buffer = io.BytesIO()
+            image.save(buffer, format=PHOTO_VARIANT_FORMAT, quality=PHOTO_VARIANT_QUALITY, method=4)
+            data = buffer.getvalue()
+            digest = hashlib.sha256(data).hexdigest()[:PHOTO_HASH_LENGTH]
+            target = source_path.with_name(f"{stem}_{size.value}.{digest}.{PHOTO_VARIANT_FORMAT}")
+            target.write_bytes(data)
+            variants[size.value] = str(target)
+    return variants
+
+
+def get_executor() -> ProcessPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=ImageSettings.workers)
+        logger.info(f"Пул обработки фото запущен, процессов: {ImageSettings.workers}")
+    return _executor
+
+
+async def generate_variants(photos: List[Tuple[int, str]]) -> None:
+    # photos — пары (id фото, путь к оригиналу). Запускается фоновой задачей после ответа клиенту.
+    # Одинаковые файлы хранятся один раз (utils.blobs), поэтому готовые копии берутся у другой записи с тем же путём.
+    paths = {path for _, path in photos}
+    async with AsyncSessionLocal() as session:
+        stmt = select(Photo.file_path, Photo.variants).where(Photo.file_path.in_(paths), Photo.variants.is_not(None))
+        variants_by_path = dict((await session.execute(stmt)).all())
+
+    missing = sorted(paths - variants_by_path.keys())
+    loop = asyncio.get_running_loop()
+    results = await asyncio.gather(
+        *(loop.run_in_executor(get_executor(), render_variants, path) for path in missing),
+        return_exceptions=True,
+    )
+    for path, result in zip(missing, results):
+        if isinstance(result, BaseException):
+            logger.error(f"Не удалось подготовить копии фото {path}: {result}")
+        else:
+            variants_by_path[path] = result
+
+    variants_by_id = {photo_id: variants_by_path[path] for photo_id, path in photos if path in variants_by_path}
+    if not variants_by_id:
+        return
+
+    async with AsyncSessionLocal() as session:
+        stmt = select(Photo).where(Photo.id.in_(variants_by_id))
+        updated = (await session.scalars(stmt)).all()
+        for photo in updated:
+            photo.variants = variants_by_id[photo.id]
+        revocation_list.profile_changed(session, [photo.user_id for photo in updated])
+        await session.commit()
+    for photo in updated:
+        token_cache.invalidate_tag(photo.user_id)
+
+
+def shutdown():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=True, cancel_futures=True)
+        _executor = None
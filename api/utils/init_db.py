@@ -0,0 +1,22 @@
+"""
+Создание таблиц и применение миграций. Приложение делает то же при запуске (lifespan);
+при нескольких воркерах базу можно подготовить заранее и запускать с DATABASE_INIT_ON_STARTUP=false.
+
+    cd api && python -m utils.init_db
+"""
+import time
+
+from config import DATABASE_NAME
+
+
+def main():
+    from database.connect import engine, init_db
+
+    started = time.perf_counter()
+    version = init_db()
+    engine.dispose()
+    print(f"База {DATABASE_NAME}: схема версии {version} за {time.perf_counter() - started:.2f} с")
+
+
+if __name__ == "__main__":
+    main()
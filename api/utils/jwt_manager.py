@@ -1,31 +1,158 @@
-# from datetime import datetime, timedelta, timezone
+import logging
+import secrets
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable
 
-# import jwt
+import jwt
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 
-# from config import JWTSettings
+from config import AuthCacheSettings, JWTSettings
+from database.models import ProfileChange, RevokedToken
+from utils.cache import token_cache
 
 
-# TYPE_ACCESS_TOKEN = 'access'
-# TYPE_REFRESH_TOKEN = 'refresh'  # Не используется 
+logger = logging.getLogger(__name__)
 
+TYPE_ACCESS_TOKEN = 'access'
 
-# def create_access_token(payload: dict) -> str:
-#     to_encode = payload.copy()
-#     now = datetime.now(timezone.utc)
-#     expire = now + timedelta(minutes=JWTSettings.access_token_expire_minutes)
-#     to_encode.update({"exp": expire, 'iat': now})
-#     encoded_jwt = jwt.encode(to_encode, JWTSettings.secret_key, algorithm=JWTSettings.algorithm)
-#     return encoded_jwt
+if not JWTSettings.secret_key:
+    # Без SECRET_KEY токены не переживут перезапуск и не совпадут между воркерами
+    logger.warning('SECRET_KEY не задан, используется случайный ключ')
+    JWTSettings.secret_key = secrets.token_urlsafe(32)
 
 
-# def verify_token(token: str) -> dict | str:
-#     decoded_token = jwt.decode(token, JWTSettings.secret_key, algorithms=[JWTSettings.algorithm])
-#     return decoded_token
+def _token_lifetime() -> float:
+    return JWTSettings.access_token_expire_minutes * 60 + JWTSettings.leeway_seconds
 
 
+def create_access_token(payload: dict) -> str:
+    to_encode = payload.copy()
+    now = datetime.now(timezone.utc)
+    expire = now + timedelta(minutes=JWTSettings.access_token_expire_minutes)
+    # iat с долями секунды, чтобы revoke_user не задевал токены, выданные сразу после отзыва
+    to_encode.update({"exp": expire, 'iat': now.timestamp(), 'jti': secrets.token_urlsafe(8), 'type': TYPE_ACCESS_TOKEN})
+    encoded_jwt = jwt.encode(to_encode, JWTSettings.secret_key, algorithm=JWTSettings.algorithm)
+    return encoded_jwt
 
-# a_payload = {'sub': 1, 'name': 'oleg'}
-# access_token = create_access_token(a_payload)
-# print(access_token)
 
-# print(verify_token(access_token))
+def verify_token(token: str) -> dict:
+    # Бросает jwt.InvalidTokenError, если подпись неверна, срок истёк или токен отозван
+    decoded_token = jwt.decode(
+        token,
+        JWTSettings.secret_key,
+        algorithms=[JWTSettings.algorithm],
+        leeway=JWTSettings.leeway_seconds,
+        options={"require": ["exp", "iat", "jti", "sub"]},
+    )
+    if decoded_token.get('type') != TYPE_ACCESS_TOKEN:
+        raise jwt.InvalidTokenError('Неверный тип токена')
+    if revocation_list.is_revoked(decoded_token):
+        raise jwt.InvalidTokenError('Токен отозван')
+    return decoded_token
+
+
+class RevocationList:
+    # Отзыв записывается в таблицу revoked_tokens в транзакции обработчика и сразу применяется в своём
+    # воркере. Остальные воркеры раз в revocation_sync_interval дочитывают строки с id больше последнего
+    # прочитанного — поиск по первичному ключу. В памяти отзыв хранится только до истечения срока
+    # токенов, поэтому размер ограничен числом выходов за access_token_expire_minutes.
+    #
+    # Тем же путём расходятся изменения анкет (profile_changes): воркер, дочитавший строку,
+    # сбрасывает снимки пользователя в token_cache, и чужой воркер отдаёт устаревшую анкету
+    # не дольше revocation_sync_interval, а не весь AuthCacheSettings.ttl.
+
+    def __init__(self, session_factory=None):
+        self._session_factory = session_factory
+        self._tokens: Dict[str, float] = {}  # jti -> exp
+        self._users: Dict[str, float] = {}  # sub -> токены, выданные раньше, недействительны
+        self._next_purge = 0.0
+        self._next_sync = 0.0
+        self._last_id = 0
+        self._last_change_id = 0
+
+    @property
+    def session_factory(self):
+        if self._session_factory is None:
+            from database.connect import AsyncSessionLocal
+            self._session_factory = AsyncSessionLocal
+        return self._session_factory
+
+    def revoke(self, db: AsyncSession, payload: dict) -> None:
+        # Строка попадает в базу с коммитом сессии обработчика
+        self._purge()
+        self._tokens[payload['jti']] = float(payload['exp'])
+        db.add(RevokedToken(
+            jti=payload['jti'],
+            revoked_at=time.time(),
+            expires_at=float(payload['exp']) + JWTSettings.leeway_seconds,
+        ))
+
+    def revoke_user(self, db: AsyncSession, user_id: int) -> None:
+        self._purge()
+        now = time.time()
+        self._users[str(user_id)] = now
+        db.add(RevokedToken(user_id=user_id, revoked_at=now, expires_at=now + _token_lifetime()))
+
+    def profile_changed(self, db: AsyncSession, user_ids: Iterable[int]) -> None:
+        # Вызывается до коммита изменения анкеты; свой кеш обработчик сбрасывает сам после коммита
+        expires_at = time.time() + AuthCacheSettings.ttl
+        db.add_all(ProfileChange(user_id=user_id, expires_at=expires_at) for user_id in set(user_ids))
+
+    def is_revoked(self, payload: dict) -> bool:
+        if payload['jti'] in self._tokens:
+            return True
+        revoked_at = self._users.get(str(payload['sub']))
+        return revoked_at is not None and payload['iat'] <= revoked_at
+
+    async def sync(self) -> None:
+        # Вызывается перед проверкой токена; чаще revocation_sync_interval базу не читает
+        now = time.monotonic()
+        if now < self._next_sync:
+            return
+        self._next_sync = now + JWTSettings.revocation_sync_interval
+
+        stmt = (
+            select(RevokedToken)
+            .where(RevokedToken.id > self._last_id, RevokedToken.expires_at > time.time())
+            .order_by(RevokedToken.id)
+        )
+        changes_stmt = (
+            select(ProfileChange.id, ProfileChange.user_id)
+            .where(ProfileChange.id > self._last_change_id, ProfileChange.expires_at > time.time())
+            .order_by(ProfileChange.id)
+        )
+        async with self.session_factory() as session:
+            rows = (await session.scalars(stmt)).all()
+            changes = (await session.execute(changes_stmt)).all()
+        for change in changes:
+            token_cache.invalidate_tag(change.user_id)
+            self._last_change_id = change.id
+        if rows:
+            self._purge()
+        for row in rows:
+            if row.jti is not None:
+                self._tokens[row.jti] = row.expires_at - JWTSettings.leeway_seconds
+            else:
+                sub = str(row.user_id)
+                self._users[sub] = max(self._users.get(sub, 0.0), row.revoked_at)
+                # Снимки пользователя в кеше этого воркера тоже устарели
+                token_cache.invalidate_tag(row.user_id)
+            self._last_id = row.id
+
+    def _purge(self) -> None:
+        now = time.time()
+        if now < self._next_purge:
+            return
+
+        lifetime = _token_lifetime()
+        self._tokens = {jti: exp for jti, exp in self._tokens.items() if exp + JWTSettings.leeway_seconds > now}
+        self._users = {sub: at for sub, at in self._users.items() if at + lifetime > now}
+        self._next_purge = now + 60
+
+    def __len__(self) -> int:
+        return len(self._tokens) + len(self._users)
+
+
+revocation_list = RevocationList()
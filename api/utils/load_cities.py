@@ -0,0 +1,181 @@
+"""
+Загрузка справочника городов из JSON. Безопасна для повторного запуска при каждом деплое.
+Координаты (lat, lon) в cities.json взяты из GeoNames (geonames.org, CC BY 4.0) по названию и региону;
+у городов, не найденных там однозначно, координат нет — поиск в радиусе находит только их самих.
+
+    cd api && python -m utils.load_cities cities.json [--delete-missing] [--batch-size 1000]
+"""
+import argparse
+import json
+import logging
+import re
+import time
+from dataclasses import dataclass
+from typing import Dict, Iterator, List, Set, Tuple
+
+from sqlalchemy import Engine, delete, exists, func, select, tuple_
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from database.models import City, DataVersion, User
+
+
+logger = logging.getLogger(__name__)
+
+# Поля города помимо ключа (name, region), которые обновляются при повторной загрузке: колонка -> ключ в JSON.
+# Отсутствующее в файле значение не затирает уже загруженное.
+CITY_DATA_FIELDS: Dict[str, str] = {
+    'latitude': 'lat',
+    'longitude': 'lon',
+}
+
+
+@dataclass
+class LoadReport:
+    inserted: int = 0
+    updated: int = 0
+    unchanged: int = 0
+    deleted: int = 0
+    kept_in_use: int = 0  # отсутствуют в файле, но на них ссылаются пользователи
+
+    def __str__(self) -> str:
+        return (
+            f"добавлено: {self.inserted}, обновлено: {self.updated}, без изменений: {self.unchanged}, "
+            f"удалено: {self.deleted}, оставлено (используются): {self.kept_in_use}"
+        )
+
+
+def iter_json_array(path: str, chunk_size: int = 64 * 1024) -> Iterator[dict]:
+    # Потоковый разбор массива верхнего уровня: в памяти только текущий фрагмент файла
+    decoder = json.JSONDecoder()
+    separators = re.compile(r'[\s,]*')
+    with open(path, 'r', encoding='utf-8') as file:
+        buffer = file.read(chunk_size).lstrip()
+        if not buffer.startswith('['):
+            raise ValueError(f'{path}: ожидается JSON-массив')
+        pos = 1
+        eof = False
+
+        while True:
+            pos = separators.match(buffer, pos).end()
+            if pos < len(buffer) and buffer[pos] == ']':
+                return
+
+            try:
+                item, pos = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                chunk = file.read(chunk_size)
+                eof = not chunk
+                buffer = buffer[pos:] + chunk
+                pos = 0
+                continue
+
+            yield item
+
+
+def city_row(item: dict) -> dict:
+    row = {"name": item['city'].strip(), "region": item['region'].strip()}
+    for field, key in CITY_DATA_FIELDS.items():
+        value = item.get(key)
+        row[field] = float(value) if value is not None else None
+    return row
+
+
+def upsert_batch(conn, rows: List[dict], report: LoadReport) -> None:
+    # Дубликаты внутри пачки: побеждает последняя запись
+    by_key: Dict[Tuple[str, str], dict] = {(row['name'], row['region']): row for row in rows}
+
+    columns = [City.name, City.region] + [getattr(City, field) for field in CITY_DATA_FIELDS]
+    stmt = select(*columns).where(tuple_(City.name, City.region).in_(list(by_key)))
+    existing = {(row[0], row[1]): row[2:] for row in conn.execute(stmt)}
+
+    changed = []
+    for key, row in by_key.items():
+        if key not in existing:
+            report.inserted += 1
+            changed.append(row)
+        elif any(
+            row[field] is not None and row[field] != current
+            for field, current in zip(CITY_DATA_FIELDS, existing[key])
+        ):
+            report.updated += 1
+            changed.append(row)
+        else:
+            report.unchanged += 1
+
+    if not changed:
+        return
+
+    stmt = sqlite_insert(City)
+    if CITY_DATA_FIELDS:
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[City.name, City.region],
+            set_={field: func.coalesce(stmt.excluded[field], City.__table__.c[field]) for field in CITY_DATA_FIELDS},
+        )
+    else:
+        stmt = stmt.on_conflict_do_nothing(index_elements=[City.name, City.region])
+    conn.execute(stmt, changed)
+
+
+def delete_missing(conn, seen: Set[Tuple[str, str]], report: LoadReport, batch_size: int) -> None:
+    missing = [
+        city_id
+        for city_id, name, region in conn.execute(select(City.id, City.name, City.region))
+        if (name, region) not in seen
+    ]
+    for i in range(0, len(missing), batch_size):
+        ids = missing[i:i + batch_size]
+        stmt = delete(City).where(City.id.in_(ids), ~exists().where(User.city_id == City.id))
+        deleted = conn.execute(stmt).rowcount
+        report.deleted += deleted
+        report.kept_in_use += len(ids) - deleted
+
+
+def load_cities(path: str, engine: Engine, batch_size: int = 1000, with_delete: bool = False) -> LoadReport:
+    report = LoadReport()
+    seen: Set[Tuple[str, str]] = set()
+    batch: List[dict] = []
+
+    # Одна транзакция: при ошибке справочник остаётся в прежнем состоянии
+    with engine.begin() as conn:
+        for item in iter_json_array(path):
+            row = city_row(item)
+            batch.append(row)
+            if with_delete:
+                seen.add((row['name'], row['region']))
+            if len(batch) >= batch_size:
+                upsert_batch(conn, batch, report)
+                batch = []
+
+        if batch:
+            upsert_batch(conn, batch, report)
+
+        if with_delete:
+            delete_missing(conn, seen, report, batch_size)
+
+        # Запущенные воркеры сверяют эту версию и пересобирают справочник в памяти (utils.cities)
+        if report.inserted or report.updated or report.deleted:
+            conn.execute(DataVersion.bump("cities"))
+
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Загрузка справочника городов")
+    parser.add_argument("path", nargs="?", default="cities.json")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--delete-missing", action="store_true", help="удалить города, которых нет в файле")
+    args = parser.parse_args()
+
+    from database.connect import engine, init_db
+
+    init_db()
+
+    started = time.perf_counter()
+    report = load_cities(args.path, engine, args.batch_size, args.delete_missing)
+    print(f"Справочник городов загружен за {time.perf_counter() - started:.2f} с — {report}")
+
+
+if __name__ == "__main__":
+    main()
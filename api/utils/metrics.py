@@ -0,0 +1,323 @@
+import bisect
+import logging
+import math
+import time
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Sequence
+
+from config import MetricsSettings
+
+
+# Метрики в текстовом формате Prometheus без внешних зависимостей.
+# Запись — несколько операций со словарём и списком: значения меняются только из цикла событий,
+# блокировки не нужны (пул хеширования и генерация копий фото работают в других процессах,
+# а замеряются здесь, вокруг ожидания результата).
+
+slow_query_logger = logging.getLogger("database.slow_queries")
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55)
+SLOW_QUERY_PREVIEW = 500  # символов запроса в журнале
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+class Metric:
+    type = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[tuple, object] = {}
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def labels(self, *values: str):
+        # Ряд метрики для набора меток; горячий код может сохранить его и обновлять без поиска
+        child = self._children.get(values)
+        if child is None:
+            child = self._children[values] = self._new_child()
+        return child
+
+    def samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}", *self.samples()]
+
+
+class Value:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount: float = 1) -> None:
+        self.value += amount
+
+    def dec(self, amount: float = 1) -> None:
+        self.value -= amount
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def _new_child(self) -> Value:
+        return Value()
+
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        self.labels(*labels).value += amount
+
+    def value(self, *labels: str) -> float:
+        child = self._children.get(labels)
+        return child.value if child else 0
+
+    def samples(self) -> List[str]:
+        return [
+            f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(child.value)}"
+            for labels, child in sorted(self._children.items())
+        ]
+
+
+class Gauge(Counter):
+    type = "gauge"
+
+    def dec(self, *labels: str, amount: float = 1) -> None:
+        self.labels(*labels).value -= amount
+
+    def set(self, value: float, *labels: str) -> None:
+        self.labels(*labels).value = value
+
+
+class Buckets:
+    __slots__ = ("bounds", "counts", "sum")
+
+    def __init__(self, bounds: tuple):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)  # последняя корзина — +Inf
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS,
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self) -> Buckets:
+        return Buckets(self.buckets)
+
+    def observe(self, value: float, *labels: str) -> None:
+        self.labels(*labels).observe(value)
+
+    def count(self, *labels: str) -> int:
+        child = self._children.get(labels)
+        return sum(child.counts) if child else 0
+
+    def samples(self) -> List[str]:
+        lines = []
+        for labels, child in sorted(self._children.items()):
+            cumulative = 0
+            for bound, count in zip((*self.buckets, math.inf), child.counts):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {cumulative}")
+            suffix = _format_labels(self.labelnames, labels)
+            lines.append(f"{self.name}_sum{suffix} {_format_value(child.sum)}")
+            lines.append(f"{self.name}_count{suffix} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Metric:
+        self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+http_requests = registry.register(Counter(
+    "http_requests_total", "Обработанные HTTP-запросы", ("method", "route", "status"),
+))
+http_request_duration = registry.register(Histogram(
+    "http_request_duration_seconds", "Время обработки HTTP-запроса", ("method", "route"),
+))
+http_requests_in_flight = registry.register(Gauge(
+    "http_requests_in_flight", "HTTP-запросы в обработке",
+))
+http_request_db_queries = registry.register(Histogram(
+    "http_request_db_queries", "SQL-запросов на один HTTP-запрос", ("method", "route"), QUERY_COUNT_BUCKETS,
+))
+http_request_db_duration = registry.register(Histogram(
+    "http_request_db_duration_seconds", "Суммарное время SQL-запросов одного HTTP-запроса", ("method", "route"),
+))
+db_queries = registry.register(Counter(
+    "db_queries_total", "Выполненные SQL-запросы",
+))
+db_query_duration = registry.register(Histogram(
+    "db_query_duration_seconds", "Время выполнения SQL-запроса",
+))
+db_slow_queries = registry.register(Counter(
+    "db_slow_queries_total", "SQL-запросы дольше порога MetricsSettings.slow_query_ms",
+))
+password_hash_duration = registry.register(Histogram(
+    "password_hash_duration_seconds", "Хеширование и проверка пароля в пуле процессов", ("operation",),
+))
+password_hash_wait = registry.register(Histogram(
+    "password_hash_wait_seconds", "Ожидание свободного места в очереди пула хеширования", ("operation",),
+))
+email_send_duration = registry.register(Histogram(
+    "email_send_duration_seconds", "Отправка одного письма по SMTP", ("result",),
+))
+email_messages = registry.register(Counter(
+    "email_messages_total", "Результаты доставки писем из email_outbox", ("result",),
+))
+auth_tokens_purged = registry.register(Counter(
+    "auth_tokens_purged_total", "Удалённые истёкшие и отозванные refresh-токены",
+))
+auth_cache_lookups = registry.register(Counter(
+    "auth_cache_lookups_total", "Поиск снимка пользователя по токену в кеше авторизации", ("result",),
+))
+rate_limit_rejected = registry.register(Counter(
+    "rate_limit_rejected_total", "Запросы, отклонённые ограничением частоты", ("action", "scope"),
+))
+rate_limit_checks = registry.register(Counter(
+    "rate_limit_checks_total", "Проверки ограничения частоты", ("action",),
+))
+swipes_total = registry.register(Counter(
+    "swipes_total", "Принятые свайпы", ("result",),
+))
+matches_total = registry.register(Counter(
+    "matches_total", "Новые взаимные лайки",
+))
+swipe_flush_duration = registry.register(Histogram(
+    "swipe_flush_duration_seconds", "Запись одной пачки свайпов из буфера",
+))
+swipe_flush_size = registry.register(Histogram(
+    "swipe_flush_size", "Свайпов в одной пачке", buckets=(1, 10, 50, 100, 250, 500, 1000, 2500, 5000),
+))
+
+
+# Счётчики SQL текущего HTTP-запроса: [число запросов, секунды]
+request_db_stats: ContextVar[Optional[list]] = ContextVar("request_db_stats", default=None)
+
+
+_db_queries = db_queries.labels()
+_db_query_duration = db_query_duration.labels()
+
+
+def observe_query(statement: str, elapsed: float, settings: MetricsSettings = MetricsSettings()) -> None:
+    _db_queries.value += 1
+    _db_query_duration.observe(elapsed)
+    stats = request_db_stats.get()
+    if stats is not None:
+        stats[0] += 1
+        stats[1] += elapsed
+    if elapsed * 1000 >= settings.slow_query_ms:
+        db_slow_queries.inc()
+        preview = " ".join(statement.split())[:SLOW_QUERY_PREVIEW]
+        slow_query_logger.warning(f"Медленный запрос {elapsed * 1000:.1f} мс: {preview}")
+
+
+def route_label(scope) -> str:
+    # Шаблон маршрута (/users/photos/{photo_id}), а не путь: число рядов метрик не растёт с числом id
+    route = scope.get("route")
+    if route is not None:
+        return route.path
+    if "endpoint" in scope:
+        # Смонтированное приложение (статика): его префикс
+        return scope.get("root_path") or "/"
+    return "unmatched"
+
+
+class MetricsMiddleware:
+    def __init__(self, app):
+        self.app = app
+        self.in_flight = http_requests_in_flight.labels()
+        # (метод, маршрут) -> ряды гистограмм: метки собираются один раз, а не на каждый запрос
+        self._series: Dict[tuple, tuple] = {}
+
+    def series(self, method: str, route: str) -> tuple:
+        key = (method, route)
+        series = self._series.get(key)
+        if series is None:
+            series = self._series[key] = (
+                http_request_duration.labels(method, route),
+                http_request_db_queries.labels(method, route),
+                http_request_db_duration.labels(method, route),
+                {},  # код ответа -> счётчик http_requests_total
+            )
+        return series
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+        db_stats = [0, 0.0]
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        token = request_db_stats.set(db_stats)
+        self.in_flight.value += 1
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - started
+            self.in_flight.value -= 1
+            request_db_stats.reset(token)
+            method, route = scope["method"], route_label(scope)
+            duration, queries, db_duration, responses = self.series(method, route)
+            duration.observe(elapsed)
+            queries.observe(db_stats[0])
+            db_duration.observe(db_stats[1])
+            counter = responses.get(status_code)
+            if counter is None:
+                counter = responses[status_code] = http_requests.labels(method, route, str(status_code))
+            counter.value += 1
@@ -0,0 +1,287 @@
+"""
+Профилирование отдельных запросов. Для запроса с подписанным заголовком X-Profile (или случайной
+доли запросов, ProfilerSettings.sample_rate) поток-сэмплер снимает стек цикла событий, пока выполняется
+задача этого запроса, а хуки движка в database.connect записывают SQL-запросы по порядку.
+Результат — JSON в ProfilerSettings.directory, старые файлы удаляются. Сводка — GET /api/v1/profiles/.
+
+    cd api && python -m utils.profiler sign [--ttl 3600]
+    curl -H "X-Profile: <подпись>" -H "Authorization: Bearer ..." http://127.0.0.1:8000/api/v1/users/me/
+"""
+import argparse
+import asyncio
+import hashlib
+import hmac
+import json
+import logging
+import os
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from config import JWTSettings, ProfilerSettings
+from utils.metrics import route_label
+
+
+logger = logging.getLogger(__name__)
+
+PROFILE_HEADER = b"x-profile"
+PROFILE_NAME = re.compile(r"^\d+_[A-Z]+_\w+\.json$")
+SQL_PREVIEW = 1000
+_API_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__))) + os.sep
+_LIBRARY_PATH = re.compile(r".*[/\\](?:site-packages|python\d+\.\d+)[/\\]")
+
+
+def _secret(settings: ProfilerSettings) -> bytes:
+    if settings.secret:
+        return settings.secret.encode()
+    # Тот же ключ, что у JWT; без SECRET_KEY он случайный и подпись действует только в этом процессе
+    from utils.jwt_manager import JWTSettings
+    return JWTSettings.secret_key.encode()
+
+
+def sign(expires: int, settings: ProfilerSettings = ProfilerSettings()) -> str:
+    signature = hmac.new(_secret(settings), f"profile:{expires}".encode(), hashlib.sha256).hexdigest()
+    return f"{expires}.{signature}"
+
+
+def verify_signature(value: str, settings: ProfilerSettings = ProfilerSettings()) -> bool:
+    expires = value.partition(".")[0]
+    if not expires.isdigit() or int(expires) < time.time():
+        return False
+    return hmac.compare_digest(sign(int(expires), settings), value)
+
+
+def frame_label(code) -> str:
+    # Путь относительно api/ или пакета библиотеки: метки короче и одинаковы на разных машинах
+    filename = code.co_filename
+    if filename.startswith(_API_ROOT):
+        filename = filename[len(_API_ROOT):]
+    else:
+        filename = _LIBRARY_PATH.sub("", filename)
+    return f"{filename}:{code.co_name}"
+
+
+@dataclass
+class Capture:
+    task: asyncio.Task
+    loop: asyncio.AbstractEventLoop
+    thread_id: int
+    started: float = field(default_factory=time.perf_counter)
+    stacks: Counter = field(default_factory=Counter)
+    waiting: int = 0  # выборки, когда задача запроса ждала (SQL, пул хеширования, сеть)
+    queries: List[Tuple[float, float, str]] = field(default_factory=list)
+
+    def report(self, scope, route: str, status_code: int, elapsed: float, interval: float) -> dict:
+        return {
+            "method": scope["method"],
+            "path": scope["path"],
+            "route": route,
+            "status": status_code,
+            "started_at": datetime.now(timezone.utc).isoformat(timespec="milliseconds"),
+            "duration_ms": round(elapsed * 1000, 3),
+            "interval_ms": round(interval * 1000, 3),
+            "samples": sum(self.stacks.values()),
+            "waiting_samples": self.waiting,
+            # Свёрнутые стеки (корень;...;лист) — формат flamegraph.pl и speedscope
+            "stacks": [[";".join(stack), count] for stack, count in self.stacks.most_common()],
+            "sql": [
+                {"offset_ms": round(offset * 1000, 3), "duration_ms": round(duration * 1000, 3), "statement": statement}
+                for offset, duration, statement in self.queries
+            ],
+            "sql_ms": round(sum(duration for _, duration, _ in self.queries) * 1000, 3),
+        }
+
+
+class Sampler:
+    # Один поток на процесс, работает только пока есть профилируемые запросы
+    def __init__(self, settings: ProfilerSettings = ProfilerSettings()):
+        self.interval = settings.interval_ms / 1000
+        self.max_depth = settings.max_depth
+        self._captures: Dict[int, Capture] = {}
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    def add(self, capture: Capture) -> None:
+        with self._lock:
+            self._captures[id(capture)] = capture
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="request-profiler", daemon=True)
+                self._thread.start()
+
+    def remove(self, capture: Capture) -> None:
+        with self._lock:
+            self._captures.pop(id(capture), None)
+
+    def _run(self) -> None:
+        while True:
+            time.sleep(self.interval)
+            with self._lock:
+                captures = list(self._captures.values())
+                if not captures:
+                    self._thread = None
+                    return
+            frames = sys._current_frames()
+            for capture in captures:
+                # Стек цикла событий относится к запросу, только пока выполняется именно его задача
+                if asyncio.current_task(capture.loop) is not capture.task:
+                    capture.waiting += 1
+                    continue
+                frame = frames.get(capture.thread_id)
+                stack = []
+                while frame is not None and len(stack) < self.max_depth:
+                    stack.append(frame_label(frame.f_code))
+                    frame = frame.f_back
+                stack.reverse()
+                capture.stacks[tuple(stack)] += 1
+
+
+# Профиль текущего запроса; SQL-запросы пишутся в него из хуков движка
+current_capture: ContextVar[Optional[Capture]] = ContextVar("current_capture", default=None)
+
+
+def record_query(statement: str, started: float, elapsed: float) -> None:
+    capture = current_capture.get()
+    if capture is not None:
+        capture.queries.append((started - capture.started, elapsed, " ".join(statement.split())[:SQL_PREVIEW]))
+
+
+class ProfileStore:
+    def __init__(self, settings: ProfilerSettings = ProfilerSettings()):
+        self.directory = settings.directory
+        self.max_files = settings.max_files
+
+    def path(self, name: str) -> Optional[Path]:
+        # Только имена, которые создаёт write: без выхода за пределы каталога
+        if not PROFILE_NAME.match(name):
+            return None
+        path = self.directory / name
+        return path if path.exists() else None
+
+    def write(self, report: dict) -> None:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        slug = re.sub(r"[^A-Za-z0-9]+", "_", report["route"]).strip("_") or "root"
+        name = f"{time.time_ns()}_{report['method']}_{slug}.json"
+        tmp_path = self.directory / f".{name}.tmp"
+        tmp_path.write_text(json.dumps(report, ensure_ascii=False), encoding="utf-8")
+        os.replace(tmp_path, self.directory / name)
+        self.rotate()
+
+    def files(self) -> list:
+        if not self.directory.exists():
+            return []
+        # Имя начинается со времени в наносекундах: сортировка по имени — по времени записи
+        return sorted(path for path in self.directory.iterdir() if path.suffix == ".json")
+
+    def rotate(self) -> None:
+        files = self.files()
+        for path in files[:max(len(files) - self.max_files, 0)]:
+            path.unlink(missing_ok=True)
+
+    def read(self, path: Path) -> Optional[dict]:
+        try:
+            return json.loads(path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return None  # удалён ротацией между листингом и чтением
+
+    def load(self, route: Optional[str] = None, limit: Optional[int] = None) -> List[dict]:
+        reports = []
+        for path in reversed(self.files()):
+            report = self.read(path)
+            if report is None:
+                continue
+            if route is None or report["route"] == route:
+                report["name"] = path.name
+                reports.append(report)
+                if limit is not None and len(reports) >= limit:
+                    break
+        return reports
+
+
+def hottest_frames(reports: List[dict], limit: int) -> dict:
+    # self — выборки, где кадр был вершиной стека; total — где он встречался хотя бы раз
+    own, total = Counter(), Counter()
+    samples = 0
+    for report in reports:
+        for stack, count in report["stacks"]:
+            frames = stack.split(";")
+            samples += count
+            own[frames[-1]] += count
+            for frame in set(frames):
+                total[frame] += count
+
+    def rows(counter: Counter):
+        return [
+            {"frame": frame, "samples": count, "percent": round(count / samples * 100, 1)}
+            for frame, count in counter.most_common(limit)
+        ]
+
+    return {"samples": samples, "self": rows(own), "total": rows(total)}
+
+
+class ProfilerMiddleware:
+    def __init__(self, app, exclude_paths: Tuple[str, ...] = (), settings: ProfilerSettings = ProfilerSettings()):
+        self.app = app
+        self.exclude_paths = exclude_paths  # сам просмотр профилей и /metrics не профилируются
+        self.settings = settings
+        self.sampler = Sampler(settings)
+        self.store = ProfileStore(settings)
+
+    def should_profile(self, scope) -> bool:
+        for name, value in scope["headers"]:
+            if name == PROFILE_HEADER:
+                return verify_signature(value.decode("latin-1"), self.settings)
+        return self.settings.sample_rate > 0 and random.random() < self.settings.sample_rate
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"].startswith(self.exclude_paths) or not self.should_profile(scope):
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        capture = Capture(asyncio.current_task(), asyncio.get_running_loop(), threading.get_ident())
+        token = current_capture.set(capture)
+        self.sampler.add(capture)
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            self.sampler.remove(capture)
+            current_capture.reset(token)
+            elapsed = time.perf_counter() - capture.started
+            report = capture.report(scope, route_label(scope), status_code, elapsed, self.sampler.interval)
+            # Ответ уже отправлен, запись на диск его не задерживает
+            try:
+                await asyncio.to_thread(self.store.write, report)
+            except OSError as e:
+                logger.error(f"Не удалось сохранить профиль запроса: {e}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Подпись для заголовка X-Profile")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    sign_parser = subparsers.add_parser("sign")
+    sign_parser.add_argument("--ttl", type=int, default=3600, help="срок действия подписи, секунд")
+    args = parser.parse_args()
+
+    settings = ProfilerSettings()
+    if not settings.secret and not JWTSettings.secret_key:
+        sys.exit("Нужен PROFILE_SECRET или SECRET_KEY: со случайным ключом сервер подпись не примет")
+    print(sign(int(time.time()) + args.ttl, settings))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,285 @@
+"""
+Аудит планов запросов. На временной базе с синтетическими данными прогоняются все обработчики API,
+каждый выполненный запрос записывается и проверяется через EXPLAIN QUERY PLAN.
+Код выхода 1, если хотя бы один запрос просматривает таблицу целиком.
+
+    cd api && python -m utils.query_audit [--users 5000] [--verbose]
+"""
+import argparse
+import io
+import os
+import random
+import re
+import sqlite3
+import sys
+import tempfile
+from dataclasses import dataclass, field
+from datetime import date, timedelta
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+
+# Таблицы, которые читаются целиком намеренно: таблица -> причина
+ALLOWED_SCANS: Dict[str, str] = {
+    'cities': "справочник городов целиком загружается в память (каталог, автодополнение, гео-индекс)",
+    'json_each': "список id из одного параметра запроса",
+}
+
+AUDIT_PASSWORD = "audit-password-1"
+SKIPPED_STATEMENTS = re.compile(r"^\s*(PRAGMA|BEGIN|COMMIT|ROLLBACK|SAVEPOINT|RELEASE|CREATE|ALTER|ANALYZE)", re.I)
+# "SCAN 2 CONSTANT ROWS" — строки VALUES многострочного INSERT, а не таблица
+FULL_SCAN = re.compile(r"^SCAN (\w+)\b(?! USING| CONSTANT ROWS)")
+# Подзапросы, которые SQLite сам материализует: их просмотр — чтение уже отобранных строк
+DERIVED_TABLE = re.compile(r"^(?:MATERIALIZE|CO-ROUTINE) (\w+)")
+
+
+@dataclass
+class QueryPlan:
+    statement: str
+    parameters: tuple
+    plan: List[str] = field(default_factory=list)
+    full_scans: List[str] = field(default_factory=list)
+
+
+class QueryRecorder:
+    # Первое выполнение каждого уникального текста запроса вместе с параметрами
+    def __init__(self):
+        self.queries: Dict[str, tuple] = {}
+
+    def __call__(self, conn, cursor, statement, parameters, context, executemany):
+        if SKIPPED_STATEMENTS.match(statement):
+            return
+        if executemany and parameters and isinstance(parameters[0], (list, tuple)):
+            parameters = parameters[0]
+        self.queries.setdefault(statement, tuple(parameters or ()))
+
+
+def explain(db_path: Path, queries: Dict[str, tuple]) -> List[QueryPlan]:
+    conn = sqlite3.connect(db_path)
+    plans = []
+    try:
+        for statement, parameters in queries.items():
+            item = QueryPlan(statement, parameters)
+            derived = set()
+            for row in conn.execute(f"EXPLAIN QUERY PLAN {statement}", parameters):
+                detail = row[-1]
+                item.plan.append(detail)
+                if match := DERIVED_TABLE.match(detail):
+                    derived.add(match.group(1))
+                match = FULL_SCAN.match(detail)
+                if match and match.group(1) not in {*ALLOWED_SCANS, *derived} and 'VIRTUAL TABLE' not in detail:
+                    item.full_scans.append(detail)
+            plans.append(item)
+    finally:
+        conn.close()
+    return plans
+
+
+def seed(db_path: Path, users: int) -> None:
+    # Объём достаточный, чтобы планировщик после ANALYZE выбирал индексы так же, как на рабочей базе
+    rnd = random.Random(1)
+    conn = sqlite3.connect(db_path)
+    conn.executemany(
+        "INSERT INTO cities (id, name, region, latitude, longitude) VALUES (?, ?, ?, ?, ?)",
+        [(i, f"Город {i}", "Регион", 50 + rnd.random() * 10, 30 + rnd.random() * 20) for i in range(1, 201)],
+    )
+    conn.executemany(
+        "INSERT INTO users (id, email, name, birth_date, height, body_type, gender, city_id, status, created_at) "
+        "VALUES (?, ?, ?, ?, ?, 'SLIM', ?, ?, ?, '2024-01-01 00:00:00')",
+        (
+            (i, f"seed{i}@example.com", "Анна", (date(1960, 1, 1) + timedelta(days=rnd.randint(0, 16000))).isoformat(),
+             rnd.randint(150, 200), rnd.choice(('MALE', 'FEMALE')), rnd.randint(1, 200),
+             rnd.choice(('ACTIVE',) * 8 + ('PENDING', 'INACTIVE')))
+            for i in range(1, users + 1)
+        ),
+    )
+    conn.executemany(
+        "INSERT INTO photos (user_id, file_path, photo_type, created_at) VALUES (?, ?, 'AVATAR', '2024-01-01 00:00:00')",
+        ((i, f"storage/uploads/user_{i}/avatar.jpg") for i in range(1, users + 1)),
+    )
+    conn.executemany(
+        "INSERT INTO auth_tokens (user_id, token, is_active, created_at, expires_at) "
+        "VALUES (?, ?, 1, '2024-01-01 00:00:00', '2099-01-01 00:00:00')",
+        ((i, f"seed-token-{i}") for i in range(1, users + 1)),
+    )
+    conn.executemany(
+        "INSERT OR IGNORE INTO swipes (user_id, target_id, liked, created_at) VALUES (?, ?, ?, '2024-01-01 00:00:00')",
+        ((rnd.randint(1, users), rnd.randint(1, users), rnd.random() < 0.5) for _ in range(users * 5)),
+    )
+    conn.executemany(
+        "INSERT OR IGNORE INTO matches (user_id, matched_id, created_at) VALUES (?, ?, '2024-01-01 00:00:00')",
+        ((rnd.randint(1, users), rnd.randint(1, users)) for _ in range(users)),
+    )
+    conn.commit()
+    conn.execute("ANALYZE")
+    conn.close()
+
+
+def image_bytes(color: Tuple[int, int, int]) -> bytes:
+    from PIL import Image
+
+    buffer = io.BytesIO()
+    Image.new("RGB", (64, 48), color).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def replay(client, moderation_user_ids: List[int]) -> None:
+    # Сценарий обходит все обработчики; ответы проверяются, чтобы аудит не молчал о сломанном шаге
+    def check(response, expected=200):
+        assert response.status_code == expected, f"{response.request.method} {response.request.url}: {response.text}"
+        return response
+
+    api = "/api/v1"
+    check(client.get(f"{api}/cities/"))
+    check(client.get(f"{api}/cities/", params={"region": "Регион"}))
+    check(client.get(f"{api}/cities/search", params={"q": "Гор"}))
+    check(client.get(f"{api}/cities/1/nearby/", params={"radius_km": 300}))
+
+    user_id = check(client.post(f"{api}/registration/", json={
+        "email": "audit@example.com", "name": "Аудит", "birth_date": "1990-01-01", "height": 170,
+        "body_type": "slim", "gender": "female", "city_id": 1, "device_info": {"os": "audit"},
+    }), 201).json()["user_id"]
+    check(client.post(f"{api}/verification/", data={"user_id": user_id}, files={
+        "avatar": ("a.png", image_bytes((200, 10, 10)), "image/png"),
+        "verification_photo": ("v.png", image_bytes((10, 200, 10)), "image/png"),
+    }))
+    check(client.get(f"{api}/verification/status/{user_id}"))
+
+    tokens = check(client.post(f"{api}/login/", data={"username": "audit@example.com", "password": AUDIT_PASSWORD})).json()
+    headers = {"Authorization": f"Bearer {tokens['access_token']}"}
+    tokens = check(client.post(f"{api}/token/refresh/", json={"refresh_token": tokens["refresh_token"]})).json()
+    headers = {"Authorization": f"Bearer {tokens['access_token']}"}
+
+    check(client.get(f"{api}/users/me/", headers=headers, params={"size": "thumb"}))
+    check(client.post(f"{api}/users/edit/", headers=headers, json={
+        "name": "Аудит", "height": 171, "body_type": "athletic", "city_id": 2, "bio": None, "desires": None,
+    }))
+    page = check(client.get(f"{api}/users/feed/", headers=headers, params={"gender": "female"})).json()
+    check(client.get(f"{api}/users/feed/", headers=headers, params={"gender": "female", "cursor": page["next_cursor"]}))
+    check(client.get(f"{api}/users/feed/", headers=headers, params={
+        "gender": "male", "city_id": 1, "radius_km": 200, "age_min": 25, "age_max": 40,
+        "height_min": 160, "height_max": 190, "body_type": "slim",
+    }))
+
+    uploaded = check(client.post(f"{api}/users/photos/upload/", headers=headers, files=[
+        ("photos", ("p1.png", image_bytes((10, 10, 200)), "image/png")),
+        ("photos", ("p2.png", image_bytes((10, 10, 200)), "image/png")),
+    ]))
+    assert uploaded.json()["success"]
+
+    # Модерация: сам аудитор становится модератором через отдельное соединение
+    from database.connect import engine
+    from sqlalchemy import text
+    with engine.begin() as conn:
+        conn.execute(text("UPDATE users SET is_moderator = 1 WHERE id = :id"), {"id": user_id})
+    from utils.cache import token_cache
+    token_cache.clear()
+
+    queue = check(client.get(f"{api}/moderation/queue/", headers=headers, params={"limit": 20})).json()
+    check(client.get(f"{api}/moderation/queue/", headers=headers, params={"limit": 20, "cursor": queue["next_cursor"]}))
+    own = check(client.get(f"{api}/moderation/queue/", headers=headers, params={"limit": 1, "cursor": user_id - 1})).json()
+    pending_photo_ids = [photo["id"] for photo in own["items"][0]["photos"] if photo["photo_type"] == "pending"]
+    check(client.post(f"{api}/moderation/reject/", headers=headers, json={
+        "user_ids": moderation_user_ids[:10], "photo_ids": pending_photo_ids[:1],
+    }))
+    check(client.post(f"{api}/moderation/approve/", headers=headers, json={
+        "user_ids": [user_id, *moderation_user_ids[10:20]], "photo_ids": pending_photo_ids[1:],
+    }))
+    check(client.get(f"{api}/users/me/", headers=headers))
+    check(client.delete(f"{api}/users/photos/{pending_photo_ids[-1]}", headers=headers))
+
+    # Свайпы: встречный лайк уже в базе — взаимность сразу в ответе, пара в списке совпадений после сброса буфера
+    liker, passed = moderation_user_ids[10:12]
+    with engine.begin() as conn:
+        conn.execute(text(
+            "INSERT INTO swipes (user_id, target_id, liked, created_at) VALUES (:liker, :id, 1, '2024-01-01 00:00:00')"
+        ), {"liker": liker, "id": user_id})
+    assert check(client.post(f"{api}/swipes/", headers=headers, json={"target_id": liker, "liked": True})).json()["matched"]
+    check(client.post(f"{api}/swipes/", headers=headers, json={"target_id": passed, "liked": False}))
+    check(client.post(f"{api}/swipes/", headers=headers, json={"target_id": liker, "liked": False}), 409)
+    from utils.swipes import swipe_buffer
+    client.portal.call(swipe_buffer.flush)
+    matches = check(client.get(f"{api}/matches/", headers=headers)).json()
+    assert [item["id"] for item in matches["items"]] == [liker]
+    check(client.get(f"{api}/matches/", headers=headers, params={"limit": 1, "cursor": 2 ** 31}))
+
+    check(client.post(f"{api}/users/logout/", headers=headers, json={"refresh_token": tokens["refresh_token"]}))
+    check(client.post(f"{api}/users/change_password/", json={
+        "email": "audit@example.com", "old_password": AUDIT_PASSWORD,
+        "new_password": "audit-password-2", "confirm_password": "audit-password-2",
+    }))
+    check(client.post(f"{api}/users/reset_password/", json={"email": "audit@example.com"}))
+
+
+async def replay_background() -> None:
+    # Фоновые задачи, которые не запускаются без SMTP-сервера
+    from database.connect import AsyncSessionLocal
+    from utils import blobs
+    from utils.email_sender import email_outbox
+
+    async with AsyncSessionLocal() as session:
+        await email_outbox.claim(session)
+    async with AsyncSessionLocal() as session:
+        await blobs.collect_garbage(session)
+
+
+def run_audit(users: int, verbose: bool) -> int:
+    os.environ["DATABASE_NAME"] = "query_audit"
+    os.makedirs("database", exist_ok=True)
+
+    from database.connect import async_engine, init_db, DATABASE_URL
+    db_path = Path(DATABASE_URL.removeprefix("sqlite:///"))
+    init_db()
+    seed(db_path, users)
+
+    recorder = QueryRecorder()
+    from sqlalchemy import event
+    event.listen(async_engine.sync_engine, "before_cursor_execute", recorder)
+
+    import views.auth
+    views.auth.generate_password = lambda *args: AUDIT_PASSWORD
+    from fastapi.testclient import TestClient
+    from main import app
+
+    moderation_user_ids = [
+        row[0] for row in sqlite3.connect(db_path).execute("SELECT id FROM users WHERE status = 'PENDING' LIMIT 20")
+    ]
+    with TestClient(app) as client:
+        replay(client, moderation_user_ids)
+        client.portal.call(replay_background)
+    event.remove(async_engine.sync_engine, "before_cursor_execute", recorder)
+
+    plans = explain(db_path, recorder.queries)
+    failed = [plan for plan in plans if plan.full_scans]
+    for plan in plans:
+        if plan.full_scans or verbose:
+            marker = "ПОЛНЫЙ ПРОСМОТР" if plan.full_scans else "ok"
+            print(f"[{marker}] {' '.join(plan.statement.split())}")
+            for line in plan.plan:
+                print(f"    {line}")
+
+    print(f"Проверено запросов: {len(plans)}, с полным просмотром таблицы: {len(failed)}")
+    for table, reason in ALLOWED_SCANS.items():
+        print(f"  допускается просмотр {table}: {reason}")
+    return 1 if failed else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Проверка планов запросов обработчиков API")
+    parser.add_argument("--users", type=int, default=5000, help="анкет во временной базе")
+    parser.add_argument("--verbose", action="store_true", help="печатать планы всех запросов")
+    args = parser.parse_args()
+
+    # Временный каталог вместо api/: база и загруженные файлы не попадают в рабочие database/ и storage/
+    with tempfile.TemporaryDirectory() as tmp:
+        cwd = os.getcwd()
+        os.chdir(tmp)
+        try:
+            code = run_audit(args.users, args.verbose)
+        finally:
+            os.chdir(cwd)
+    sys.exit(code)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,193 @@
+import asyncio
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, Tuple
+
+from fastapi import Request
+
+from config import RateLimitSettings
+from utils.metrics import rate_limit_checks, rate_limit_rejected
+
+
+# Скользящее окно по двум соседним фиксированным окнам: на ключ хранятся только начало текущего окна
+# и два счётчика. Число попыток за последние window секунд оценивается как
+# previous * (доля предыдущего окна, ещё попадающая в скользящее) + current.
+# Отклонённые попытки не считаются: после паузы клиент снова проходит, а не ждёт бесконечно.
+
+PERIODS = {"second": 1, "minute": 60, "hour": 3600, "day": 86400}
+
+
+@dataclass(frozen=True)
+class Rule:
+    scope: str  # ip, email или user
+    limit: int
+    window: float
+
+    @classmethod
+    def parse(cls, scope: str, value: str) -> "Rule":
+        limit, _, period = value.partition("/")
+        return cls(scope, int(limit), PERIODS[period.strip()])
+
+
+class RateLimitExceeded(Exception):
+    def __init__(self, action: str, scope: str, retry_after: float):
+        super().__init__(f"Превышена частота {action} по {scope}")
+        self.action = action
+        self.scope = scope
+        self.retry_after = retry_after
+
+
+def slide(state: list, rule: Rule, now: float) -> float:
+    # state — [начало текущего окна, current, previous], меняется на месте.
+    # Возвращает 0, если попытка разрешена (и учтена), иначе — через сколько секунд повторить.
+    window = rule.window
+    start = now // window * window  # целое число окон: одно и то же значение для всех моментов окна
+    if state[0] != start:
+        state[2] = state[1] if state[0] == start - window else 0
+        state[1] = 0
+        state[0] = start
+    elapsed = (now - start) / window
+    if state[2] * (1 - elapsed) + state[1] < rule.limit:
+        state[1] += 1
+        return 0.0
+
+    # Когда оценка опустится ниже лимита: вес предыдущего окна убывает линейно
+    if state[1] >= rule.limit:
+        return start + window - now + window * (1 - rule.limit / state[1])
+    return max(window * (1 - (rule.limit - state[1]) / state[2]) - (now - start), 0.001)
+
+
+class MemoryBackend:
+    # Свой у каждого воркера. Ключ — хеш строки (целое), значение — список из трёх чисел: около 150 байт
+    # на ключ. Сверх max_keys вытесняются давно не встречавшиеся ключи; чтобы вытеснить чужой счётчик,
+    # нужно max_keys разных ключей, а их с одного IP не даст лимит по IP.
+    blocking = False
+
+    def __init__(self, max_keys: int):
+        self.max_keys = max_keys
+        self._states: OrderedDict[int, list] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._states)
+
+    def hit(self, key: str, rule: Rule, now: float) -> float:
+        key_hash = hash(key)
+        state = self._states.get(key_hash)
+        if state is None:
+            state = self._states[key_hash] = [0.0, 0, 0]
+            if len(self._states) > self.max_keys:
+                self._states.popitem(last=False)
+        else:
+            self._states.move_to_end(key_hash)
+        return slide(state, rule, now)
+
+
+class SQLiteBackend:
+    # Общие счётчики для нескольких воркеров uvicorn: отдельный файл, чтобы короткие транзакции
+    # ограничителя не ждали блокировку записи основной базы. Вызывается из пула потоков.
+    blocking = True
+    CLEANUP_EVERY = 1000  # попыток между удалениями устаревших ключей
+
+    def __init__(self, path: str, busy_timeout: float = 1.0):
+        self.path = path
+        self.busy_timeout = busy_timeout
+        self._local = threading.local()
+        self._hits = 0
+
+    def connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=self.busy_timeout, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            # Счётчики не жалко потерять при сбое питания
+            conn.execute("PRAGMA synchronous=OFF")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS rate_limits (key TEXT PRIMARY KEY, window_start REAL NOT NULL, "
+                "current INTEGER NOT NULL, previous INTEGER NOT NULL, expires_at REAL NOT NULL) WITHOUT ROWID"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_rate_limits_expires_at ON rate_limits (expires_at)")
+            self._local.conn = conn
+        return conn
+
+    def hit(self, key: str, rule: Rule, now: float) -> float:
+        conn = self.connection()
+        # IMMEDIATE: чтение и запись счётчика — одна операция для всех воркеров
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT window_start, current, previous FROM rate_limits WHERE key = ?", (key,)).fetchone()
+            state = list(row) if row else [0.0, 0, 0]
+            retry_after = slide(state, rule, now)
+            conn.execute(
+                "INSERT INTO rate_limits VALUES (?, ?, ?, ?, ?) ON CONFLICT (key) DO UPDATE SET "
+                "window_start = excluded.window_start, current = excluded.current, "
+                "previous = excluded.previous, expires_at = excluded.expires_at",
+                (key, *state, state[0] + 2 * rule.window),
+            )
+            self._hits += 1
+            if self._hits % self.CLEANUP_EVERY == 0:
+                conn.execute("DELETE FROM rate_limits WHERE expires_at < ?", (now,))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return retry_after
+
+
+class RateLimiter:
+    def __init__(self, settings: RateLimitSettings = RateLimitSettings()):
+        self.settings = settings
+        self.rules: Dict[str, Tuple[Rule, ...]] = {
+            "login": (Rule.parse("ip", settings.login_per_ip), Rule.parse("email", settings.login_per_email)),
+            "change_password": (
+                Rule.parse("ip", settings.change_password_per_ip),
+                Rule.parse("email", settings.change_password_per_email),
+            ),
+            "reset_password": (
+                Rule.parse("ip", settings.reset_password_per_ip),
+                Rule.parse("email", settings.reset_password_per_email),
+            ),
+            "verification": (
+                Rule.parse("ip", settings.verification_per_ip),
+                Rule.parse("user", settings.verification_per_user),
+            ),
+        }
+        if settings.backend == "sqlite":
+            self.backend = SQLiteBackend(settings.sqlite_path)
+        else:
+            self.backend = MemoryBackend(settings.max_keys)
+
+    def client_ip(self, request: Request) -> str:
+        # Каждый прокси дописывает в конец адрес, с которого к нему пришли: запись, добавленная
+        # самым внешним из trusted_proxies, — настоящий клиент, всё левее неё мог подставить он сам
+        hops = self.settings.trusted_proxies
+        if hops > 0:
+            forwarded = [entry.strip() for entry in request.headers.get("x-forwarded-for", "").split(",")]
+            if len(forwarded) >= hops and forwarded[-hops]:
+                return forwarded[-hops]
+        return request.client.host if request.client else "unknown"
+
+    async def check(self, request: Request, action: str, **subjects) -> None:
+        # Вызывается первым в обработчике: лишняя попытка отклоняется до хеширования пароля и SQL.
+        # Сначала IP: перебор адресов с одного IP упирается в лимит по IP, не засоряя счётчики адресов.
+        if not self.settings.enabled:
+            return
+        rate_limit_checks.inc(action)
+        now = time.time()
+        for rule in self.rules[action]:
+            value = self.client_ip(request) if rule.scope == "ip" else subjects.get(rule.scope)
+            if value is None:
+                continue
+            key = f"{action}:{rule.scope}:{str(value).strip().lower()}"
+            if self.backend.blocking:
+                retry_after = await asyncio.to_thread(self.backend.hit, key, rule, now)
+            else:
+                retry_after = self.backend.hit(key, rule, now)
+            if retry_after:
+                rate_limit_rejected.inc(action, rule.scope)
+                raise RateLimitExceeded(action, rule.scope, retry_after)
+
+
+rate_limiter = RateLimiter()
@@ -0,0 +1,82 @@
+from datetime import date
+from typing import List, Optional, Sequence, Tuple
+
+import orjson
+from fastapi import Request, Response
+
+from constants import PhotoSize, PhotoType
+from database.models import User
+from utils.common import calculate_age
+
+
+# Анкеты сериализуются прямо из объектов ORM в bytes: данные уже проверены при записи,
+# поэтому модели UserData и FeedItem остаются только описанием ответа в OpenAPI
+
+
+class RawJSONResponse(Response):
+    # Тело уже сериализовано, render ничего не делает
+    media_type = "application/json"
+
+
+def photo_urls(base_url: str, user: User, size: PhotoSize) -> Tuple[str, List[str]]:
+    avatar = ''
+    photos = []
+    for img in user.photos:
+        if img.photo_type == PhotoType.VERIFICATION:
+            continue
+        # Пока копии не готовы, отдаём оригинал
+        file_path = img.file_path
+        if size != PhotoSize.ORIGINAL and img.variants:
+            file_path = img.variants.get(size.value, file_path)
+        # Пути в photos относительные (storage/...), urljoin для них сводится к склейке
+        url = base_url + file_path
+        if img.photo_type == PhotoType.AVATAR:
+            avatar = url
+        photos.append(url)
+    return avatar, photos
+
+
+def user_payload(
+    base_url: str,
+    user: User,
+    size: PhotoSize = PhotoSize.ORIGINAL,
+    with_email: bool = True,
+    today: Optional[date] = None,
+) -> dict:
+    avatar, photos = photo_urls(base_url, user, size)
+    # Порядок полей как в схеме UserData (FeedItem — то же без email)
+    payload = {"id": user.id}
+    if with_email:
+        payload["email"] = user.email
+    payload.update(
+        name=user.name,
+        age=calculate_age(user.birth_date, today),
+        status=user.status,
+        height=user.height,
+        body_type=user.body_type,
+        gender=user.gender,
+        city=user.city.full_name,
+        city_id=user.city_id,
+        avatar=avatar,
+        photos=photos,
+        bio=user.bio,
+        desires=user.desires,
+    )
+    return payload
+
+
+def user_response(request: Request, user: User, size: PhotoSize = PhotoSize.ORIGINAL) -> RawJSONResponse:
+    return RawJSONResponse(orjson.dumps(user_payload(str(request.base_url), user, size)))
+
+
+def feed_response(
+    request: Request,
+    users: Sequence[User],
+    next_cursor: Optional[int],
+    size: PhotoSize,
+) -> RawJSONResponse:
+    # base_url и текущая дата вычисляются один раз на страницу; email других пользователей не отдаём
+    base_url = str(request.base_url)
+    today = date.today()
+    items = [user_payload(base_url, user, size, with_email=False, today=today) for user in users]
+    return RawJSONResponse(orjson.dumps({"items": items, "next_cursor": next_cursor}))
@@ -0,0 +1,208 @@
+"""
+Генерация тестовых анкет с фото и сессиями для нагрузочных тестов и бенчмарков.
+Распределения пола, возраста, роста, телосложения и городов близки к реальным; у всех анкет один
+пароль (--password), поэтому под любой из них можно войти. Повторный запуск добавляет новые анкеты.
+
+    cd api && python -m utils.seed_users --users 250000 [--batch-size 20000] [--password seed-password]
+"""
+import argparse
+import itertools
+import random
+import time
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta, timezone
+from typing import List, Tuple
+
+from sqlalchemy import Engine
+
+from config import SessionSettings
+from constants import BodyType, Gender, PhotoType, Status
+
+
+SEED_EMAIL_DOMAIN = "seed.example.com"
+SEED_PASSWORD = "seed-password"
+
+MALE_NAMES = ("Александр", "Дмитрий", "Максим", "Сергей", "Андрей", "Алексей", "Артём", "Илья", "Кирилл", "Михаил",
+              "Никита", "Иван", "Егор", "Роман", "Павел", "Владимир", "Денис", "Евгений", "Антон", "Олег")
+FEMALE_NAMES = ("Анастасия", "Мария", "Дарья", "Анна", "Елизавета", "Полина", "Екатерина", "Виктория", "Ксения",
+                "Алина", "Софья", "Наталья", "Ольга", "Юлия", "Татьяна", "Елена", "Ирина", "Светлана", "Вера", "Алёна")
+
+# В приложениях знакомств мужчин заметно больше
+GENDER_WEIGHTS = {Gender.MALE: 56, Gender.FEMALE: 44}
+BODY_TYPE_WEIGHTS = {
+    Gender.MALE: {BodyType.AVERAGE: 40, BodyType.SLIM: 20, BodyType.ATHLETIC: 25, BodyType.MUSCULAR: 8, BodyType.FULL: 7},
+    Gender.FEMALE: {BodyType.AVERAGE: 38, BodyType.SLIM: 35, BodyType.ATHLETIC: 15, BodyType.MUSCULAR: 2, BodyType.FULL: 10},
+}
+HEIGHT_CM = {Gender.MALE: (178, 7), Gender.FEMALE: (165, 6)}  # среднее и стандартное отклонение
+STATUS_WEIGHTS = {Status.ACTIVE: 85, Status.PENDING: 7, Status.INACTIVE: 5, Status.REJECTED: 2, Status.BANNED: 1}
+# Возраст: основная масса 20–35 лет, хвост до 70
+AGE_MIN, AGE_MAX, AGE_MODE = 18, 70, 27
+GALLERY_PHOTOS = (0, 1, 2, 3, 4)
+GALLERY_WEIGHTS = (25, 25, 25, 15, 10)
+SESSIONS = (0, 1, 2, 3)  # refresh-токенов на анкету: по одному на устройство
+SESSION_WEIGHTS = (20, 50, 20, 10)
+CITY_ZIPF_EXPONENT = 1.1  # первые города справочника (столицы) заметно популярнее остальных
+REGISTRATION_DAYS = 730
+
+
+@dataclass
+class SeedReport:
+    users: int = 0
+    photos: int = 0
+    blobs: int = 0
+    tokens: int = 0
+
+    @property
+    def rows(self) -> int:
+        return self.users + self.photos + self.blobs + self.tokens
+
+    def __str__(self) -> str:
+        return (
+            f"анкет: {self.users}, фото: {self.photos}, файлов: {self.blobs}, сессий: {self.tokens}, "
+            f"всего строк: {self.rows}"
+        )
+
+
+class UserGenerator:
+    # Строки для executemany; все случайные величины берутся из одного генератора, результат воспроизводим по --seed
+    def __init__(self, city_ids: List[int], password_hash: str, seed: int):
+        self.rnd = random.Random(seed)
+        self.password_hash = password_hash
+        self.city_ids = city_ids
+        self.city_weights = list(itertools.accumulate(1 / rank ** CITY_ZIPF_EXPONENT for rank in range(1, len(city_ids) + 1)))
+        self.today = date.today()
+        self.now = datetime.now(timezone.utc).replace(tzinfo=None)
+        self.session_lifetime = timedelta(days=SessionSettings.refresh_token_expire_days)
+        self.session_seconds = int(self.session_lifetime.total_seconds() * 1.2)
+
+    def choose(self, weights: dict, count: int) -> list:
+        return self.rnd.choices(list(weights), list(weights.values()), k=count)
+
+    def users(self, first_id: int, count: int) -> Tuple[list, list, list, list]:
+        rnd = self.rnd
+        genders = self.choose(GENDER_WEIGHTS, count)
+        statuses = self.choose(STATUS_WEIGHTS, count)
+        cities = rnd.choices(self.city_ids, cum_weights=self.city_weights, k=count)
+        galleries = rnd.choices(GALLERY_PHOTOS, GALLERY_WEIGHTS, k=count)
+        sessions = rnd.choices(SESSIONS, SESSION_WEIGHTS, k=count)
+
+        users, photos, blobs, tokens = [], [], [], []
+        for offset in range(count):
+            user_id = first_id + offset
+            gender = genders[offset]
+            mean, deviation = HEIGHT_CM[gender]
+            age = rnd.triangular(AGE_MIN, AGE_MAX, AGE_MODE)
+            birth_date = self.today - timedelta(days=int(age * 365.25) + 1)
+            created_at = self.now - timedelta(seconds=rnd.randrange(REGISTRATION_DAYS * 86400))
+            body_type = rnd.choices(*zip(*BODY_TYPE_WEIGHTS[gender].items()))[0]
+            status = statuses[offset]
+            names = MALE_NAMES if gender == Gender.MALE else FEMALE_NAMES
+            users.append((
+                user_id, f"user{user_id}@{SEED_EMAIL_DOMAIN}", rnd.choice(names), self.password_hash,
+                birth_date.isoformat(), min(max(int(rnd.gauss(mean, deviation)), 140), 220), body_type.name,
+                gender.name, cities[offset], status.name, created_at.isoformat(sep=' '),
+            ))
+
+            # Анкета на модерации ещё не прошла верификацию полностью, но фото уже загружены
+            kinds = [PhotoType.AVATAR, PhotoType.VERIFICATION]
+            kinds += [PhotoType.PENDING if status == Status.PENDING else PhotoType.GALLERY] * galleries[offset]
+            for kind in kinds:
+                digest = f"{rnd.getrandbits(256):064x}"
+                file_path = f"storage/blobs/{digest[:2]}/{digest}.jpg"
+                photos.append((user_id, file_path, kind.name, created_at.isoformat(sep=' ')))
+                blobs.append((digest, file_path, rnd.randint(80_000, 600_000)))
+
+            for device in range(sessions[offset]):
+                # Вход в случайный момент последнего срока сессии: часть токенов уже истекла и ждёт очистки
+                logged_in = max(created_at, self.now - timedelta(seconds=rnd.randrange(self.session_seconds)))
+                tokens.append((
+                    user_id, f"seed-{rnd.getrandbits(192):048x}", f"seed-device-{device}",
+                    logged_in.isoformat(sep=' '), (logged_in + self.session_lifetime).isoformat(sep=' '),
+                ))
+        return users, photos, blobs, tokens
+
+
+def seed_users(
+    engine: Engine,
+    users: int,
+    batch_size: int = 20000,
+    password: str = SEED_PASSWORD,
+    seed: int = 1,
+) -> SeedReport:
+    from utils.hashing import get_context
+
+    report = SeedReport()
+    # Вставка напрямую через DB-API: ORM и insertmanyvalues на миллионах строк в разы медленнее
+    raw = engine.raw_connection()
+    try:
+        conn = raw.driver_connection
+        city_ids = [row[0] for row in conn.execute("SELECT id FROM cities ORDER BY id")]
+        if not city_ids:
+            raise RuntimeError("Справочник городов пуст: сначала python -m utils.load_cities")
+        first_id = conn.execute("SELECT coalesce(max(id), 0) + 1 FROM users").fetchone()[0]
+        generator = UserGenerator(city_ids, get_context().hash(password), seed + first_id)
+
+        # Потеря данных при сбое питания тестовой базе не страшна; восстанавливается после генерации
+        synchronous = conn.execute("PRAGMA synchronous").fetchone()[0]
+        conn.execute("PRAGMA synchronous=OFF")
+        try:
+            for start in range(first_id, first_id + users, batch_size):
+                count = min(batch_size, first_id + users - start)
+                user_rows, photo_rows, blob_rows, token_rows = generator.users(start, count)
+                conn.executemany(
+                    "INSERT INTO users (id, email, name, password, birth_date, height, body_type, gender, city_id, "
+                    "status, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    user_rows,
+                )
+                conn.executemany(
+                    "INSERT INTO photos (user_id, file_path, photo_type, created_at) VALUES (?, ?, ?, ?)",
+                    photo_rows,
+                )
+                conn.executemany("INSERT INTO blobs (hash, file_path, size, refcount) VALUES (?, ?, ?, 1)", blob_rows)
+                conn.executemany(
+                    "INSERT INTO auth_tokens (user_id, token, device_id, is_active, created_at, expires_at) "
+                    "VALUES (?, ?, ?, 1, ?, ?)",
+                    token_rows,
+                )
+                conn.commit()
+                report.users += len(user_rows)
+                report.photos += len(photo_rows)
+                report.blobs += len(blob_rows)
+                report.tokens += len(token_rows)
+        finally:
+            conn.execute(f"PRAGMA synchronous={synchronous}")
+        # Статистика для планировщика на новом объёме данных
+        conn.execute("ANALYZE")
+        conn.commit()
+    finally:
+        raw.close()
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Генерация тестовых анкет")
+    parser.add_argument("--users", type=int, default=100_000)
+    parser.add_argument("--batch-size", type=int, default=20000)
+    parser.add_argument("--password", default=SEED_PASSWORD, help="пароль всех сгенерированных анкет")
+    parser.add_argument("--seed", type=int, default=1, help="начальное значение генератора случайных чисел")
+    parser.add_argument("--cities", default="cities.json", help="справочник городов, если в базе он пуст")
+    args = parser.parse_args()
+
+    from database.connect import engine, init_db
+    from utils.load_cities import load_cities
+
+    init_db()
+
+    with engine.connect() as conn:
+        has_cities = conn.exec_driver_sql("SELECT 1 FROM cities LIMIT 1").first() is not None
+    if not has_cities:
+        print(f"Справочник городов пуст, загружается {args.cities}: {load_cities(args.cities, engine)}")
+
+    started = time.perf_counter()
+    report = seed_users(engine, args.users, args.batch_size, args.password, args.seed)
+    elapsed = time.perf_counter() - started
+    print(f"Анкеты сгенерированы за {elapsed:.1f} с ({report.rows / elapsed:,.0f} строк/с) — {report}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+import asyncio
+import logging
+import time
+from datetime import datetime, timedelta
+from typing import Optional
+
+from sqlalchemy import delete, func, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from config import SessionSettings
+from database.models import AuthToken, ProfileChange, RevokedToken, utc_now
+from utils.metrics import auth_tokens_purged
+
+
+logger = logging.getLogger(__name__)
+
+# Сессия — строка auth_tokens с refresh-токеном. Живёт refresh_token_expire_days, каждая ротация
+# продлевает её новым токеном. Отозванный или ротированный токен не удаляется сразу: ещё
+# revoked_retention_hours по нему распознаётся повторное использование. Затем SessionPurger удаляет строку.
+
+
+def revoked_values(now: Optional[datetime] = None, settings: SessionSettings = SessionSettings()) -> dict:
+    # Значения для UPDATE при отзыве: срок сокращается до срока хранения, но не продлевается
+    now = now or utc_now()
+    retain_until = now + timedelta(hours=settings.revoked_retention_hours)
+    return {"is_active": False, "expires_at": func.min(AuthToken.expires_at, retain_until)}
+
+
+async def open_session(db: AsyncSession, user_id: int, token: str, device_id: Optional[str] = None) -> None:
+    # Новый вход с того же устройства закрывает его прежнюю сессию: у устройства одна строка,
+    # и таблица не растёт от повторных входов
+    if device_id is not None:
+        await db.execute(
+            update(AuthToken)
+            .where(AuthToken.user_id == user_id, AuthToken.device_id == device_id, AuthToken.is_active.is_(True))
+            .values(**revoked_values())
+        )
+    db.add(AuthToken(token=token, user_id=user_id, device_id=device_id))
+
+
+class SessionPurger:
+    def __init__(self, settings: SessionSettings = SessionSettings(), session_factory=None):
+        self.settings = settings
+        self._session_factory = session_factory
+        self._task: Optional[asyncio.Task] = None
+        self.purged = 0
+
+    @property
+    def session_factory(self):
+        if self._session_factory is None:
+            from database.connect import AsyncSessionLocal
+            self._session_factory = AsyncSessionLocal
+        return self._session_factory
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                purged = await self.purge()
+                if purged:
+                    logger.info(f"Удалено истёкших и отозванных сессий: {purged}")
+            except Exception as e:
+                logger.error(f"Ошибка очистки сессий: {e}")
+            await asyncio.sleep(self.settings.purge_interval)
+
+    async def purge(self) -> int:
+        # Пачками по индексу idx_auth_tokens_expires_at: каждая транзакция короткая и не держит
+        # блокировку записи SQLite, пока удаляются накопившиеся за долгое время строки
+        now = utc_now()
+        total = 0
+        while True:
+            expired = (
+                select(AuthToken.token)
+                .where(AuthToken.expires_at <= now)
+                .limit(self.settings.purge_batch_size)
+            )
+            async with self.session_factory() as session:
+                result = await session.execute(delete(AuthToken).where(AuthToken.token.in_(expired)))
+                await session.commit()
+            total += result.rowcount
+            self.purged += result.rowcount
+            auth_tokens_purged.inc(amount=result.rowcount)
+            if result.rowcount < self.settings.purge_batch_size:
+                break
+            # Между пачками запросы успевают получить блокировку записи
+            await asyncio.sleep(0)
+
+        # Журналы отзыва и изменений анкет маленькие: строки живут не дольше срока access-токена
+        # и времени жизни кеша снимков
+        async with self.session_factory() as session:
+            await session.execute(delete(RevokedToken).where(RevokedToken.expires_at <= time.time()))
+            await session.execute(delete(ProfileChange).where(ProfileChange.expires_at <= time.time()))
+            await session.commit()
+        return total
+
+    def stats(self) -> dict:
+        return {"purged": self.purged}
+
+
+session_purger = SessionPurger()
@@ -0,0 +1,49 @@
+import os
+import re
+
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse, Response
+from starlette.staticfiles import NotModifiedResponse, StaticFiles
+from starlette.types import Scope
+
+from constants import IMMUTABLE_CACHE_CONTROL, PHOTO_HASH_LENGTH, REVALIDATE_CACHE_CONTROL
+
+
+# name.<hash>.ext — уменьшенные копии; blobs/ab/<sha256>.ext — оригиналы в хранилище utils.blobs
+HASHED_NAME = re.compile(rf"[./]([0-9a-f]{{{PHOTO_HASH_LENGTH}}}|[0-9a-f]{{64}})\.[A-Za-z0-9]+$")
+
+
+def content_hash(path) -> str:
+    # Хэш содержимого из имени файла, пустая строка для старых файлов без хэша
+    match = HASHED_NAME.search(os.fspath(path))
+    return match.group(1) if match else ''
+
+
+class PhotoStaticFiles(StaticFiles):
+    # Файлы с хэшем в имени отдаются как immutable с сильным ETag из этого хэша.
+    # Старые файлы без хэша клиент обязан перепроверять по ETag от mtime и размера.
+    # Range, If-Range и отдачу через http.response.pathsend (sendfile на стороне сервера)
+    # обеспечивает FileResponse. Файлы и каталоги с точкой в начале имени (недописанные загрузки
+    # в storage/.staging) не отдаются.
+    def lookup_path(self, path: str):
+        if any(part.startswith(".") for part in path.replace("\\", "/").split("/")):
+            return "", None
+        return super().lookup_path(path)
+
+    def file_response(
+        self,
+        full_path: os.PathLike,
+        stat_result: os.stat_result,
+        scope: Scope,
+        status_code: int = 200,
+    ) -> Response:
+        digest = content_hash(full_path)
+        if digest:
+            headers = {"cache-control": IMMUTABLE_CACHE_CONTROL, "etag": f'"{digest}"'}
+        else:
+            headers = {"cache-control": REVALIDATE_CACHE_CONTROL}
+
+        response = FileResponse(full_path, status_code=status_code, headers=headers, stat_result=stat_result)
+        if self.is_not_modified(response.headers, Headers(scope=scope)):
+            return NotModifiedResponse(response.headers)
+        return response
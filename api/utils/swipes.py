@@ -0,0 +1,204 @@
+import asyncio
+import json
+import logging
+import time
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import and_, func, select
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.orm import aliased
+
+from config import SwipeSettings
+from constants import Status
+from database.models import Match, Swipe, User, utc_now
+from utils.metrics import matches_total, swipe_flush_duration, swipe_flush_size
+
+
+logger = logging.getLogger(__name__)
+
+# Свайп не пишется в базу в обработчике: он попадает в буфер воркера, а SwipeBuffer сбрасывает буфер
+# одной транзакцией на пачку — по batch_size свайпов или раз в flush_interval. Одна блокировка записи
+# SQLite и один fsync на сотни свайпов вместо одного на каждый. Цена — при падении процесса теряются
+# свайпы последних flush_interval; при обычной остановке буфер записывается в lifespan.
+#
+# Взаимность проверяется поиском встречного свайпа (target_id, user_id) по первичному ключу swipes:
+# в обработчике — чтобы сразу ответить matched, при сбросе — чтобы записать matches. Второе
+# окончательное: встречный свайп, лежащий в буфере другого воркера, находится при сбросе.
+
+SwipeKey = Tuple[int, int]  # (user_id, target_id)
+
+# Псевдонимы создаются один раз: построение aliased дороже самого запроса, а с постоянными
+# псевдонимами запрос берётся из кеша компиляции SQLAlchemy
+mine = aliased(Swipe, name="mine")
+theirs = aliased(Swipe, name="theirs")
+forward = aliased(Swipe, name="forward")
+backward = aliased(Swipe, name="backward")
+
+
+def swipe_state_query(user_id: int, target_id: int):
+    # Одна строка, если анкета target_id активна: свой прежний свайп и встречный — два поиска
+    # по первичному ключу swipes. Нет строки — анкеты нет или она скрыта.
+    return (
+        select(mine.liked.label("mine"), theirs.liked.label("theirs"))
+        .select_from(User)
+        .outerjoin(mine, and_(mine.user_id == user_id, mine.target_id == User.id))
+        .outerjoin(theirs, and_(theirs.user_id == User.id, theirs.target_id == user_id))
+        .where(User.id == target_id, User.status == Status.ACTIVE)
+    )
+
+
+def mutual_likes_query(likes: Iterable[SwipeKey]):
+    # Лайки пачки одним параметром (json_each, как id_list в модерации). На каждый — два поиска
+    # по первичному ключу: сам лайк (пара могла быть оценена раньше, и тогда в базе прежнее решение)
+    # и встречный лайк.
+    edges = func.json_each(json.dumps([list(key) for key in likes])).table_valued("value")
+    return (
+        select(forward.user_id, forward.target_id)
+        .select_from(edges)
+        .join(forward, and_(
+            forward.user_id == func.json_extract(edges.c.value, "$[0]"),
+            forward.target_id == func.json_extract(edges.c.value, "$[1]"),
+            forward.liked.is_(True),
+        ))
+        .join(backward, and_(
+            backward.user_id == forward.target_id,
+            backward.target_id == forward.user_id,
+            backward.liked.is_(True),
+        ))
+    )
+
+
+class SwipeBuffer:
+    def __init__(self, settings: SwipeSettings = SwipeSettings(), session_factory=None):
+        self.settings = settings
+        self._session_factory = session_factory
+        self._pending: Dict[SwipeKey, Tuple[bool, datetime]] = {}
+        self._flushing: Dict[SwipeKey, Tuple[bool, datetime]] = {}
+        self._lock = asyncio.Lock()  # пачки пишутся по одной и по порядку
+        self._ready = asyncio.Event()  # в буфере появился свайп
+        self._full = asyncio.Event()  # набралась пачка
+        self._task: Optional[asyncio.Task] = None
+        self.written = 0
+        self.matched = 0
+        self.flushes = 0
+
+    @property
+    def session_factory(self):
+        if self._session_factory is None:
+            from database.connect import AsyncSessionLocal
+            self._session_factory = AsyncSessionLocal
+        return self._session_factory
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def start(self) -> None:
+        if self._task is None:
+            # Примитивы asyncio привязываются к циклу событий при первом ожидании: свои на каждый запуск
+            self._lock = asyncio.Lock()
+            self._ready = asyncio.Event()
+            self._full = asyncio.Event()
+            if self._pending:
+                self._ready.set()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        # Остаток буфера — до остановки процесса
+        await self.flush()
+
+    def pending(self, user_id: int, target_id: int) -> Optional[bool]:
+        # Свайп, ещё не записанный в базу этим воркером
+        entry = self._pending.get((user_id, target_id)) or self._flushing.get((user_id, target_id))
+        return entry[0] if entry else None
+
+    async def add(self, user_id: int, target_id: int, liked: bool) -> None:
+        # Решение по паре окончательное: повторный свайп не заменяет первый ни в буфере, ни в базе
+        self._pending.setdefault((user_id, target_id), (liked, utc_now()))
+        self._ready.set()
+        if self._task is None or len(self._pending) >= self.settings.max_pending:
+            # Без фоновой задачи (CLI, скрипты) или если запись отстаёт — сбрасываем сами
+            await self.flush()
+        elif len(self._pending) >= self.settings.batch_size:
+            self._full.set()
+
+    async def _run(self) -> None:
+        while True:
+            await self._ready.wait()
+            try:
+                await asyncio.wait_for(self._full.wait(), self.settings.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Ошибка записи свайпов: {e}")
+                await asyncio.sleep(self.settings.flush_interval)
+
+    async def flush(self) -> int:
+        async with self._lock:
+            self._ready.clear()
+            self._full.clear()
+            if not self._pending:
+                return 0
+            batch = self._flushing = self._pending
+            self._pending = {}
+            started = time.perf_counter()
+            try:
+                matched = await self.write(batch)
+            except BaseException:
+                # Пачка возвращается в буфер и уйдёт со следующим сбросом
+                for key, value in batch.items():
+                    self._pending.setdefault(key, value)
+                self._ready.set()
+                raise
+            finally:
+                self._flushing = {}
+            swipe_flush_duration.observe(time.perf_counter() - started)
+            swipe_flush_size.observe(len(batch))
+            matches_total.inc(amount=matched)
+            self.written += len(batch)
+            self.matched += matched
+            self.flushes += 1
+            return len(batch)
+
+    async def write(self, batch: Dict[SwipeKey, Tuple[bool, datetime]]) -> int:
+        # Свайпы, поиск взаимных лайков и matches — одна транзакция. Возвращает число новых пар.
+        rows = [
+            {"user_id": user_id, "target_id": target_id, "liked": liked, "created_at": created_at}
+            for (user_id, target_id), (liked, created_at) in batch.items()
+        ]
+        likes = [key for key, (liked, _) in batch.items() if liked]
+        async with self.session_factory() as session:
+            await session.execute(insert(Swipe).on_conflict_do_nothing(), rows)
+            pairs = set()
+            if likes:
+                for user_id, target_id in await session.execute(mutual_likes_query(likes)):
+                    pairs.add((min(user_id, target_id), max(user_id, target_id)))
+            created = 0
+            if pairs:
+                now = utc_now()
+                matches: List[dict] = []
+                for first, second in sorted(pairs):
+                    matches.append({"user_id": first, "matched_id": second, "created_at": now})
+                    matches.append({"user_id": second, "matched_id": first, "created_at": now})
+                # Пара, уже записанная прежней пачкой, пропускается уникальным ключом
+                result = await session.execute(
+                    insert(Match).on_conflict_do_nothing().returning(Match.user_id), matches
+                )
+                created = len(result.all()) // 2
+            await session.commit()
+        return created
+
+    def stats(self) -> dict:
+        return {"pending": len(self._pending), "written": self.written, "matched": self.matched, "flushes": self.flushes}
+
+
+swipe_buffer = SwipeBuffer()
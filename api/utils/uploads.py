@@ -0,0 +1,143 @@
+import asyncio
+import hashlib
+import logging
+import secrets
+from pathlib import Path
+from typing import List, Optional, Sequence
+
+from fastapi import UploadFile, status
+from fastapi.responses import ORJSONResponse
+
+from config import STORAGE_STAGING
+from constants import (
+    ALLOWED_PHOTO_EXTENSIONS, MAX_PHOTO_BYTES, MAX_UPLOAD_BYTES, UPLOAD_CHUNK_SIZE, UPLOAD_SNIFF_BYTES,
+)
+from utils.blobs import StagedBlob, discard
+
+
+logger = logging.getLogger(__name__)
+
+
+class UploadError(Exception):
+    def __init__(self, message: str, status_code: int = status.HTTP_400_BAD_REQUEST):
+        super().__init__(message)
+        self.message = message
+        self.status_code = status_code
+
+
+class ByteBudget:
+    # Общий лимит байт на все файлы запроса, которые пишутся параллельно
+    def __init__(self, limit: int):
+        self.remaining = limit
+
+    def take(self, size: int) -> None:
+        self.remaining -= size
+        if self.remaining < 0:
+            raise UploadError(
+                f"Суммарный размер файлов превышает {MAX_UPLOAD_BYTES // (1024 * 1024)} МБ",
+                status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            )
+
+
+def sniff_image_extension(head: bytes) -> Optional[str]:
+    if head.startswith(b'\xff\xd8\xff'):
+        return '.jpg'
+    if head.startswith(b'\x89PNG\r\n\x1a\n'):
+        return '.png'
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return '.webp'
+    return None
+
+
+def _write(file, hasher, chunk: bytes) -> None:
+    # hashlib отпускает GIL на больших блоках, поэтому хэш считается в том же потоке, что и запись
+    hasher.update(chunk)
+    file.write(chunk)
+
+
+def _discard(file, path: Path) -> None:
+    file.close()
+    path.unlink(missing_ok=True)
+
+
+async def save_photo(upload: UploadFile, budget: ByteBudget) -> StagedBlob:
+    # Формат определяется по сигнатуре в первых байтах, а не по имени файла
+    head = await upload.read(UPLOAD_SNIFF_BYTES)
+    extension = sniff_image_extension(head)
+    if extension is None or extension not in ALLOWED_PHOTO_EXTENSIONS:
+        raise UploadError(f"Не допустимый формат файла: {upload.filename}")
+
+    # Итоговое имя — хэш содержимого, он известен только после записи. До commit в БД файл
+    # лежит во временном, в хранилище его переносит blobs.publish().
+    hasher = hashlib.sha256()
+    tmp_path = STORAGE_STAGING / f"{secrets.token_hex(8)}.part"
+    file = await asyncio.to_thread(open, tmp_path, 'wb')
+    try:
+        size = 0
+        chunk = head
+        while chunk:
+            size += len(chunk)
+            if size > MAX_PHOTO_BYTES:
+                raise UploadError(
+                    f"Файл {upload.filename} больше {MAX_PHOTO_BYTES // (1024 * 1024)} МБ",
+                    status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                )
+            budget.take(len(chunk))
+            await asyncio.to_thread(_write, file, hasher, chunk)
+            chunk = await upload.read(UPLOAD_CHUNK_SIZE)
+
+        await asyncio.to_thread(file.close)
+    except BaseException:
+        await asyncio.to_thread(_discard, file, tmp_path)
+        raise
+
+    return StagedBlob(tmp_path=tmp_path, digest=hasher.hexdigest(), extension=extension, size=size)
+
+
+async def remove_files(paths: Sequence[Path]) -> None:
+    def remove():
+        for path in paths:
+            Path(path).unlink(missing_ok=True)
+
+    await asyncio.to_thread(remove)
+
+
+async def save_photos(uploads: Sequence[UploadFile], max_bytes: int = MAX_UPLOAD_BYTES) -> List[StagedBlob]:
+    # Файлы пишутся параллельно. При любой ошибке уже записанные временные файлы удаляются.
+    budget = ByteBudget(max_bytes)
+    await asyncio.to_thread(STORAGE_STAGING.mkdir, parents=True, exist_ok=True)
+    results = await asyncio.gather(
+        *(save_photo(upload, budget) for upload in uploads),
+        return_exceptions=True,
+    )
+
+    errors = [result for result in results if isinstance(result, BaseException)]
+    if errors:
+        await discard([result for result in results if isinstance(result, StagedBlob)])
+        raise errors[0]
+    return results
+
+
+class RequestSizeLimitMiddleware:
+    # Отклоняет запрос по заголовку Content-Length до чтения тела
+    def __init__(self, app, max_bytes: int):
+        self.app = app
+        self.max_bytes = max_bytes
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http":
+            headers = dict(scope["headers"])
+            content_length = headers.get(b"content-length")
+            if content_length and content_length.isdigit() and int(content_length) > self.max_bytes:
+                response = ORJSONResponse(
+                    status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                    content={
+                        "success": False,
+                        "code": "HTTP_ERROR",
+                        "message": "Слишком большой запрос",
+                    },
+                )
+                await response(scope, receive, send)
+                return
+
+        await self.app(scope, receive, send)
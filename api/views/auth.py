@@ -1,21 +1,26 @@
 import logging
-import shutil
-from pathlib import Path
-from typing import Annotated
+from typing import Annotated, Optional
 
 from fastapi.security import OAuth2PasswordRequestForm
-from fastapi import APIRouter, HTTPException, status, UploadFile, File, Form, Depends
-from sqlalchemy import select
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, BackgroundTasks, HTTPException, status, UploadFile, File, Form, Depends, Request
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.exc import IntegrityError
 
 from database.connect import get_db
-from database.models import User, Photo, AuthToken
+from database.models import User, Photo, AuthToken, utc_now
+from utils.cache import token_cache
 from utils.common import generate_password, generate_auth_token
 from utils.email_sender import send_password
-from constants import ALLOWED_PHOTO_EXTENSIONS, PhotoType
-from config import STORAGE_UPLOADS
-from schemas import RegistrationForm, LoginForm, Token
+from utils.rate_limit import rate_limiter
+from utils.sessions import open_session, revoked_values
+from constants import PhotoType
+from utils.jwt_manager import create_access_token, revocation_list
+from utils import blobs
+from utils.uploads import UploadError, save_photos
+from utils.images import generate_variants
+from config import JWTSettings
+from schemas import RegistrationForm, LoginForm, Token, TokenPair, RefreshTokenRequest
 
 
 
@@ -24,10 +29,10 @@ router = APIRouter()
 
 
 @router.post("/registration/", status_code=status.HTTP_201_CREATED)
-async def registration(form: RegistrationForm, db: Session = Depends(get_db)):
+async def registration(form: RegistrationForm, db: AsyncSession = Depends(get_db)):
     try:
         stmt = select(User).where(User.email == form.email)
-        existing_user = db.scalars(stmt).one_or_none()
+        existing_user = (await db.scalars(stmt)).one_or_none()
         if existing_user:
             logger.warning(f'Пользователь с email <{form.email}> уже существует')
             raise HTTPException(
@@ -39,8 +44,8 @@ async def registration(form: RegistrationForm, db: Session = Depends(get_db)):
         user_dict = form.model_dump()
         user = User(**user_dict)
         db.add(user)
-        db.commit()
-        db.refresh(user)
+        await db.commit()
+        await db.refresh(user)
 
     except IntegrityError as e:
         raise HTTPException(
@@ -66,59 +71,45 @@ async def registration(form: RegistrationForm, db: Session = Depends(get_db)):
 
 @router.post("/verification/")
 async def verification(
+    request: Request,
+    background_tasks: BackgroundTasks,
     user_id: int = Form(..., description="ID Пользователя"),
     avatar: UploadFile = File(..., description="Основное фото профиля"),
     verification_photo: UploadFile = File(..., description="Фото для верификации"),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
-    user_dir = STORAGE_UPLOADS / f'user_{user_id}'
-    user_dir.mkdir(parents=True, exist_ok=True)
-
-    avatar_ext = Path(avatar.filename).suffix.lower()
-    verification_photo_ext = Path(verification_photo.filename).suffix.lower()
-
-    if not avatar_ext or not verification_photo_ext:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Не удалось определить формат файлов."
-        )
-
-    if avatar_ext not in ALLOWED_PHOTO_EXTENSIONS or verification_photo_ext not in ALLOWED_PHOTO_EXTENSIONS:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Не допустимый формат файлов."
-        )
-
-    avatar_filename = f"avatar_user_id_{user_id}{avatar_ext}"
-    verification_filename = f"verification_user_id_{user_id}{verification_photo_ext}"
-
-    avatar_path = user_dir / avatar_filename
-    verification_path = user_dir / verification_filename
-
-    with open(avatar_path, "wb") as buffer:
-        shutil.copyfileobj(avatar.file, buffer)
-
-    with open(verification_path, "wb") as buffer:
-        shutil.copyfileobj(verification_photo.file, buffer)
-
+    await rate_limiter.check(request, "verification", user=user_id)
     stmt = select(User).where(User.id == user_id)
-    user = db.scalars(stmt).one_or_none()
+    user = (await db.scalars(stmt)).one_or_none()
     if not user:
-        shutil.rmtree(user_dir)
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"Пользователь с ID = {user_id} отсутсвует."
         )
 
+    try:
+        staged = await save_photos([avatar, verification_photo])
+    except UploadError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.message)
+    avatar_blob, verification_blob = staged
+
     password = generate_password()
-    print(f'PASSWORD: {password}')  # Удалить
-    user.set_password(password)
-    await send_password(user.email, password)
+    await user.set_password(password)
+    await send_password(db, user.id, user.email, password)
 
-    a_photo = Photo(user_id=user_id, file_path=str(avatar_path), photo_type=PhotoType.AVATAR)
-    v_photo = Photo(user_id=user_id, file_path=str(verification_path), photo_type=PhotoType.VERIFICATION)
+    a_photo = Photo(user_id=user_id, file_path=str(avatar_blob.path), photo_type=PhotoType.AVATAR)
+    v_photo = Photo(user_id=user_id, file_path=str(verification_blob.path), photo_type=PhotoType.VERIFICATION)
     db.add_all([a_photo, v_photo])
-    db.commit()
+    revocation_list.profile_changed(db, [user_id])
+    try:
+        await blobs.acquire(db, staged)
+        await db.commit()
+    except BaseException:
+        await blobs.discard(staged)
+        raise
+    await blobs.publish(staged)
+    token_cache.invalidate_tag(user_id)
+    background_tasks.add_task(generate_variants, [(a_photo.id, a_photo.file_path)])
 
     return {
         "status": "success",
@@ -128,9 +119,9 @@ async def verification(
 
 
 @router.get("/verification/status/{user_id}")
-async def get_verification_status(user_id: int, db: Session = Depends(get_db)):
+async def get_verification_status(user_id: int, db: AsyncSession = Depends(get_db)):
     stmt = select(User).where(User.id == user_id)
-    user = db.scalars(stmt).one_or_none()
+    user = (await db.scalars(stmt)).one_or_none()
     if user:
         return {"user_id": user_id, "status": user.status}
 
@@ -140,31 +131,84 @@ async def get_verification_status(user_id: int, db: Session = Depends(get_db)):
     )
 
 
-@router.post("/login/")
+@router.post("/login/", response_model=TokenPair)
 async def login(
+    request: Request,
     form_data: Annotated[OAuth2PasswordRequestForm, Depends()],
     # username: str = Form(...), password: str = Form(...), 
-    db: Session = Depends(get_db)):
+    device_id: Optional[str] = Form(None, max_length=64, description="Постоянный идентификатор устройства"),
+    db: AsyncSession = Depends(get_db)):
+    await rate_limiter.check(request, "login", email=form_data.username)
     stmt = select(User).where(User.email == form_data.username)
-    user = db.scalars(stmt).one_or_none()
-    if not user or not user.verify_password(form_data.password):
+    user = (await db.scalars(stmt)).one_or_none()
+    if not user or not await user.verify_password(form_data.password):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Неверный email или пароль",
         )
 
-    stmt = select(AuthToken).where(AuthToken.user_id == user.id, AuthToken.is_active.is_(True))
-    auth_token = db.scalars(stmt).one_or_none()
-    if auth_token:
-        token = auth_token.token
-    else:
-        token = generate_auth_token()
-        auth_token = AuthToken(
-            token=token,
-            user_id=user.id
+    # В auth_tokens хранятся только refresh-токены: по одному на устройство, без device_id — на каждый вход
+    refresh_token = generate_auth_token()
+    await open_session(db, user.id, refresh_token, device_id)
+
+    # Фиксирует и новый токен, и пересчитанный хеш пароля
+    await db.commit()
+
+    return issue_tokens(user.id, refresh_token)
+
+
+@router.post("/token/refresh/", response_model=TokenPair)
+async def refresh_tokens(data: RefreshTokenRequest, db: AsyncSession = Depends(get_db)):
+    # Условный UPDATE: из двух параллельных запросов с одним токеном ротацию получит только один
+    now = utc_now()
+    stmt = (
+        update(AuthToken)
+        .where(
+            AuthToken.token == data.refresh_token,
+            AuthToken.is_active.is_(True),
+            AuthToken.expires_at > now,
         )
-        db.add(auth_token)
-        db.commit()
+        .values(**revoked_values(now))
+        .returning(AuthToken.user_id, AuthToken.device_id)
+    )
+    session = (await db.execute(stmt)).one_or_none()
+    if session is None:
+        stmt = select(AuthToken.user_id).where(AuthToken.token == data.refresh_token, AuthToken.is_active.is_(False))
+        reused_by = (await db.execute(stmt)).scalar_one_or_none()
+        # Истёкший, но не отозванный токен — обычный конец сессии, а не повторное использование
+        if reused_by is not None:
+            # Повторное использование уже ротированного токена — закрываем все сессии пользователя
+            logger.warning(f'Повторное использование refresh-токена пользователем {reused_by}')
+            await revoke_user_sessions(db, reused_by)
+            await db.commit()
 
-    # return Token(user_id=user.id, token=token)
-    return {"access_token": token, "token_type": "bearer"}
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Неверный refresh-токен",
+        )
+
+    # Ротация продлевает сессию того же устройства
+    user_id, device_id = session
+    refresh_token = generate_auth_token()
+    db.add(AuthToken(token=refresh_token, user_id=user_id, device_id=device_id))
+    await db.commit()
+
+    return issue_tokens(user_id, refresh_token)
+
+
+def issue_tokens(user_id: int, refresh_token: str) -> TokenPair:
+    return TokenPair(
+        access_token=create_access_token({'sub': str(user_id)}),
+        refresh_token=refresh_token,
+        expires_in=JWTSettings.access_token_expire_minutes * 60,
+    )
+
+
+async def revoke_user_sessions(db: AsyncSession, user_id: int) -> None:
+    await db.execute(
+        update(AuthToken)
+        .where(AuthToken.user_id == user_id, AuthToken.is_active.is_(True))
+        .values(**revoked_values())
+    )
+    revocation_list.revoke_user(db, user_id)
+    token_cache.invalidate_tag(user_id)
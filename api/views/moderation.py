@@ -0,0 +1,169 @@
+import json
+import logging
+from typing import Annotated, Iterable, List, Optional
+from urllib.parse import urljoin
+
+from fastapi import APIRouter, HTTPException, status, Depends, Request, Query
+from sqlalchemy import and_, delete, func, or_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from constants import PhotoType, Status, MODERATION_PAGE_SIZE, MAX_MODERATION_PAGE_SIZE
+from database.connect import get_db
+from database.models import Photo, User
+from schemas import ModerationDecision, ModerationItem, ModerationPage, ModerationPhoto, ModerationResult
+from utils import blobs
+from utils.cache import token_cache
+from utils.common import calculate_age
+from utils.jwt_manager import revocation_list
+from utils.uploads import remove_files
+from views.users import get_current_user
+
+
+logger = logging.getLogger(__name__)
+router = APIRouter()
+
+MODERATED_PHOTO_TYPES = (PhotoType.VERIFICATION, PhotoType.PENDING)
+
+
+async def get_current_moderator(user: Annotated[User, Depends(get_current_user)]) -> User:
+    if not user.is_moderator:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Недостаточно прав для модерации",
+        )
+    return user
+
+
+def id_list(ids: Iterable[int]):
+    # Весь список id — один параметр запроса: json_each разворачивает его в таблицу,
+    # лимит SQLite на число параметров не мешает, план остаётся поиском по первичному ключу
+    values = func.json_each(json.dumps(sorted(set(ids)))).table_valued("value")
+    return select(values.c.value)
+
+
+def build_queue_query(cursor: Optional[int], limit: int):
+    page = select(User.id).where(User.status == Status.PENDING)
+    if cursor is not None:
+        page = page.where(User.id > cursor)
+    page = page.order_by(User.id).limit(limit).subquery()
+
+    # Одна выборка: страница анкет и их фото на проверке через LEFT JOIN
+    return (
+        select(
+            User.id, User.email, User.name, User.birth_date, User.gender, User.city_id,
+            Photo.id.label("photo_id"), Photo.file_path, Photo.photo_type,
+        )
+        .join(page, page.c.id == User.id)
+        .outerjoin(Photo, and_(Photo.user_id == User.id, Photo.photo_type.in_(MODERATED_PHOTO_TYPES)))
+        .order_by(User.id, Photo.id)
+    )
+
+
+@router.get("/moderation/queue/", response_model=ModerationPage)
+async def moderation_queue(
+    request: Request,
+    moderator: Annotated[User, Depends(get_current_moderator)],
+    cursor: Optional[int] = Query(None, description="id последней анкеты предыдущей страницы"),
+    limit: int = Query(MODERATION_PAGE_SIZE, ge=1, le=MAX_MODERATION_PAGE_SIZE),
+    db: AsyncSession = Depends(get_db)
+):
+    base_url = str(request.base_url)
+    items: List[ModerationItem] = []
+    rows = (await db.execute(build_queue_query(cursor, limit + 1))).all()
+    for row in rows:
+        if not items or items[-1].id != row.id:
+            items.append(ModerationItem(
+                id=row.id,
+                email=row.email,
+                name=row.name,
+                age=calculate_age(row.birth_date),
+                gender=row.gender,
+                city_id=row.city_id,
+                photos=[],
+            ))
+        if row.photo_id is not None:
+            items[-1].photos.append(
+                ModerationPhoto(id=row.photo_id, url=urljoin(base_url, row.file_path), photo_type=row.photo_type)
+            )
+
+    # Запрошена одна лишняя анкета: по ней видно, есть ли следующая страница
+    has_more = len(items) > limit
+    items = items[:limit]
+    return ModerationPage(items=items, next_cursor=items[-1].id if has_more else None)
+
+
+@router.post("/moderation/approve/", response_model=ModerationResult)
+async def approve(
+    decision: ModerationDecision,
+    moderator: Annotated[User, Depends(get_current_moderator)],
+    db: AsyncSession = Depends(get_db)
+):
+    # Анкеты активируются вместе с их фото на проверке; отдельно перечисленные фото — независимо от анкеты.
+    # Каждое изменение — один UPDATE по множеству строк, объекты ORM не загружаются.
+    users_stmt = (
+        update(User)
+        .where(User.id.in_(id_list(decision.user_ids)), User.status == Status.PENDING)
+        .values(status=Status.ACTIVE)
+        .returning(User.id)
+        .execution_options(synchronize_session=False)
+    )
+    approved = (await db.scalars(users_stmt)).all()
+
+    photos_stmt = (
+        update(Photo)
+        .where(
+            Photo.photo_type == PhotoType.PENDING,
+            or_(Photo.user_id.in_(id_list(approved)), Photo.id.in_(id_list(decision.photo_ids))),
+        )
+        .values(photo_type=PhotoType.GALLERY)
+        .returning(Photo.user_id)
+        .execution_options(synchronize_session=False)
+    )
+    photo_owners = (await db.scalars(photos_stmt)).all()
+    revocation_list.profile_changed(db, [*approved, *photo_owners])
+    await db.commit()
+
+    for user_id in {*approved, *photo_owners}:
+        token_cache.invalidate_tag(user_id)
+    logger.info(f"Модератор {moderator.id} одобрил анкет: {len(approved)}, фото: {len(photo_owners)}")
+    return ModerationResult(users=len(approved), photos=len(photo_owners))
+
+
+@router.post("/moderation/reject/", response_model=ModerationResult)
+async def reject(
+    decision: ModerationDecision,
+    moderator: Annotated[User, Depends(get_current_moderator)],
+    db: AsyncSession = Depends(get_db)
+):
+    # Отклонённая анкета сохраняет фото до повторной подачи, отклонённые фото удаляются
+    users_stmt = (
+        update(User)
+        .where(User.id.in_(id_list(decision.user_ids)), User.status == Status.PENDING)
+        .values(status=Status.REJECTED)
+        .returning(User.id)
+        .execution_options(synchronize_session=False)
+    )
+    rejected = (await db.scalars(users_stmt)).all()
+
+    photos_stmt = (
+        delete(Photo)
+        .where(Photo.id.in_(id_list(decision.photo_ids)), Photo.photo_type == PhotoType.PENDING)
+        .returning(Photo.user_id, Photo.file_path, Photo.variants)
+        .execution_options(synchronize_session=False)
+    )
+    removed = (await db.execute(photos_stmt)).all()
+    legacy_files = await blobs.release(db, [row.file_path for row in removed])
+    revocation_list.profile_changed(db, [*rejected, *(row.user_id for row in removed)])
+    await db.commit()
+
+    if removed:
+        await blobs.collect_garbage(db)
+        legacy_variants = [
+            path for row in removed for path in (row.variants or {}).values() if not blobs.is_blob_path(path)
+        ]
+        await remove_files([*legacy_files, *legacy_variants])
+
+    for user_id in {*rejected, *(row.user_id for row in removed)}:
+        token_cache.invalidate_tag(user_id)
+    logger.info(f"Модератор {moderator.id} отклонил анкет: {len(rejected)}, фото: {len(removed)}")
+    return ModerationResult(users=len(rejected), photos=len(removed))
@@ -0,0 +1,59 @@
+import asyncio
+from typing import Annotated, Optional
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, status
+
+from utils.profiler import ProfileStore, hottest_frames, verify_signature
+
+
+router = APIRouter()
+store = ProfileStore()
+
+
+async def require_profile_signature(x_profile: Annotated[Optional[str], Header()] = None) -> None:
+    # Тот же подписанный заголовок, что включает профилирование запроса
+    if not x_profile or not verify_signature(x_profile):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Нужна действующая подпись в заголовке X-Profile",
+        )
+
+
+@router.get("/profiles/", dependencies=[Depends(require_profile_signature)])
+async def profiles_summary(
+    route: Optional[str] = Query(None, description="Шаблон маршрута, например /api/v1/users/me/"),
+    captures: int = Query(200, ge=1, le=1000, description="Сколько последних профилей учитывать"),
+    frames: int = Query(30, ge=1, le=200, description="Сколько самых горячих кадров вернуть"),
+):
+    reports = await asyncio.to_thread(store.load, route, captures)
+    return {
+        "success": True,
+        "captures": len(reports),
+        "frames": hottest_frames(reports, frames),
+        "requests": [
+            {
+                "name": report["name"],
+                "method": report["method"],
+                "route": report["route"],
+                "status": report["status"],
+                "started_at": report["started_at"],
+                "duration_ms": report["duration_ms"],
+                "sql_queries": len(report["sql"]),
+                "sql_ms": report["sql_ms"],
+                "samples": report["samples"],
+                "waiting_samples": report["waiting_samples"],
+            }
+            for report in reports
+        ],
+    }
+
+
+@router.get("/profiles/{name}", dependencies=[Depends(require_profile_signature)])
+async def profile_detail(name: str):
+    path = store.path(name)
+    if path is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Профиль не найден")
+    report = await asyncio.to_thread(store.read, path)
+    if report is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Профиль не найден")
+    return {"success": True, "name": name, **report}
@@ -1,13 +1,10 @@
 import logging
 from typing import Union
 
-from fastapi import APIRouter, status, Depends
-from sqlalchemy import select
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, HTTPException, status, Request, Query
 
-from database.connect import get_db
-from database.models import City
-from config import LIMIT_CITY_ENTITIES_FOR_SEARCH
+from utils.cities import city_catalogue, city_autocomplete, city_versions
+from utils.geo import city_geo_index
 
 
 router = APIRouter()
@@ -15,29 +12,36 @@ logger = logging.getLogger(__name__)
 
 
 @router.get("/cities/", status_code=status.HTTP_200_OK)
-def cities_list(db: Session = Depends(get_db)):
-    items = []
-    stmt = select(City).order_by(City.name.asc())
-    cities = db.scalars(stmt).all()
-    for city in cities:
-        items.append({"id": city.id, "name": city.full_name})
+async def cities_list(request: Request, region: Union[str, None] = None):
+    # Готовый ответ из памяти: ORM не используется, клиент получает 304 по ETag
+    await city_versions.check()
+    payload = await city_catalogue.get(region)
+    return payload.response(request)
 
+
+@router.get("/cities/search", status_code=status.HTTP_200_OK)
+async def search_for_cities(q: Union[str, None] = None):
+    await city_versions.check()
     return {
         "success": True,
-        "items": items,
+        "items": await city_autocomplete.search(q),
     }
 
 
-@router.get("/cities/search", status_code=status.HTTP_200_OK)
-def search_for_cities(q: Union[str, None] = None, db: Session = Depends(get_db)):
-    items = []
-    word = q.strip().capitalize()
-    stmt = select(City).where(City.name.ilike((f'{word}%'))).order_by(City.name.asc()).limit(LIMIT_CITY_ENTITIES_FOR_SEARCH)
-    cities = db.scalars(stmt).all()
-    for city in cities:
-        items.append({"id": city.id, "name": city.full_name})
+@router.get("/cities/{city_id}/nearby/", status_code=status.HTTP_200_OK)
+async def nearby_cities(city_id: int, radius_km: float = Query(50, gt=0, le=1000)):
+    await city_versions.check()
+    neighbours = await city_geo_index.nearby(city_id, radius_km)
+    if city_geo_index.name(city_id) is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Город с ID = {city_id} отсутствует."
+        )
 
     return {
         "success": True,
-        "items": items,
+        "items": [
+            {"id": other, "name": city_geo_index.name(other), "distance_km": distance}
+            for other, distance in neighbours
+        ],
     }
@@ -0,0 +1,86 @@
+import logging
+from typing import Annotated, Optional
+
+from fastapi import APIRouter, HTTPException, status, Depends, Request, Query
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import joinedload, selectinload
+
+from constants import PhotoSize, Status, MATCHES_PAGE_SIZE, MAX_MATCHES_PAGE_SIZE
+from database.connect import get_db
+from database.models import Match, User
+from schemas import MatchPage, SwipeRequest, SwipeResult
+from utils.metrics import swipes_total
+from utils.responses import feed_response
+from utils.swipes import swipe_buffer, swipe_state_query
+from views.users import get_current_user
+
+
+logger = logging.getLogger(__name__)
+router = APIRouter()
+
+
+@router.post("/swipes/", response_model=SwipeResult)
+async def swipe(form: SwipeRequest, user: Annotated[User, Depends(get_current_user)], db: AsyncSession = Depends(get_db)):
+    if form.target_id == user.id:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Нельзя оценить собственную анкету",
+        )
+    # Анкета на модерации, отклонённая или заблокированная не участвует в знакомствах
+    if user.status != Status.ACTIVE:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Оценивать анкеты можно только с одобренной анкетой",
+        )
+
+    # Только чтение: сам свайп уходит в буфер и записывается пачкой (utils.swipes)
+    state = (await db.execute(swipe_state_query(user.id, form.target_id))).first()
+    if state is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Анкета не найдена",
+        )
+    if state.mine is not None or swipe_buffer.pending(user.id, form.target_id) is not None:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Анкета уже оценена",
+        )
+
+    theirs = state.theirs if state.theirs is not None else swipe_buffer.pending(form.target_id, user.id)
+    await swipe_buffer.add(user.id, form.target_id, form.liked)
+    swipes_total.inc("like" if form.liked else "pass")
+    return {"success": True, "matched": bool(form.liked and theirs)}
+
+
+def build_matches_query(user_id: int, cursor: Optional[int] = None, limit: int = MATCHES_PAGE_SIZE):
+    # Новые совпадения первыми: keyset по id в индексе idx_matches_user_id, анкета — по первичному ключу
+    stmt = (
+        select(Match.id, User)
+        .join(User, User.id == Match.matched_id)
+        .options(joinedload(User.city), selectinload(User.photos))
+        .where(Match.user_id == user_id, User.status == Status.ACTIVE)
+        .order_by(Match.id.desc())
+        .limit(limit)
+    )
+    if cursor is not None:
+        stmt = stmt.where(Match.id < cursor)
+    return stmt
+
+
+# email других пользователей не отдаём, как и в ленте
+@router.get("/matches/", response_model=MatchPage)
+async def list_matches(
+    request: Request,
+    user: Annotated[User, Depends(get_current_user)],
+    cursor: Optional[int] = Query(None, description="next_cursor предыдущей страницы"),
+    limit: int = Query(MATCHES_PAGE_SIZE, ge=1, le=MAX_MATCHES_PAGE_SIZE),
+    size: PhotoSize = PhotoSize.CARD,
+    db: AsyncSession = Depends(get_db)
+):
+    # Лишняя запись показывает, есть ли следующая страница
+    rows = (await db.execute(build_matches_query(user.id, cursor, limit + 1))).unique().all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    return feed_response(request, [row.User for row in rows], rows[-1].id if has_more else None, size)
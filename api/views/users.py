@@ -1,25 +1,34 @@
 import logging
-import secrets
-import shutil
-import string
-from typing import Annotated, List
-from urllib.parse import urljoin
+from datetime import date
 from pathlib import Path
+from typing import Annotated, List, Optional
 
+import jwt
 from fastapi.security import OAuth2PasswordBearer
-from fastapi import APIRouter, HTTPException, status, Depends, Request, UploadFile, File
-from sqlalchemy import select
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, BackgroundTasks, HTTPException, status, Depends, Request, UploadFile, File, Query
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import joinedload, selectinload
 
 
-from constants import ALLOWED_PHOTO_EXTENSIONS, PhotoType, MAX_PHOTOS
-from database.connect import get_db
+from constants import PhotoType, PhotoSize, MAX_PHOTOS, BodyType, Gender, Status, FEED_PAGE_SIZE, MAX_FEED_PAGE_SIZE
+from database.connect import AsyncSessionLocal, get_db
 from database.models import Photo, User, AuthToken
-from utils.common import calculate_age, generate_password
+from utils.cache import token_cache
+from utils.common import generate_password
 from utils.email_sender import send_password
-from schemas import UserData, ChangePasswordRequest, UserEditForm, ResetPasswordRequest
-from config import STORAGE_UPLOADS
+from utils.jwt_manager import verify_token, revocation_list
+from utils.metrics import auth_cache_lookups
+from utils.rate_limit import rate_limiter
+from utils.responses import feed_response, user_response
+from utils.sessions import revoked_values
+from utils.cities import city_versions
+from utils.geo import city_geo_index
+from utils.images import generate_variants
+from utils import blobs
+from utils.uploads import UploadError, remove_files, save_photos
+from views.auth import revoke_user_sessions
+from schemas import UserData, ChangePasswordRequest, UserEditForm, ResetPasswordRequest, RefreshTokenRequest, FeedPage
 
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/v1/login/")
@@ -27,99 +36,187 @@ logger = logging.getLogger(__name__)
 router = APIRouter()
 
 
-async def get_current_user(token: Annotated[str, Depends(oauth2_scheme)], db: Session = Depends(get_db)) -> User:
-    print('Token', token)
-    stmt = select(AuthToken).where(AuthToken.token == token, AuthToken.is_active.is_(True))
-    auth_token = db.scalars(stmt).one_or_none()
-    if not auth_token:
+async def get_current_user(token: Annotated[str, Depends(oauth2_scheme)], db: AsyncSession = Depends(get_db)) -> User:
+    # Подпись, срок и отзыв проверяются без обращения к БД; журнал отзыва других воркеров
+    # дочитывается не чаще раза в JWTSettings.revocation_sync_interval
+    await revocation_list.sync()
+    try:
+        payload = verify_token(token)
+    except jwt.InvalidTokenError:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Неверный токен авторизации",
             headers={"WWW-Authenticate": "Bearer"},
         )
 
-    # Получаем пользователя
-    user_stmt = (
-        select(User)
-        .options(
-            joinedload(User.city),
-            selectinload(User.photos)
-        )
-        .where(User.id == auth_token.user_id)
-    )
+    user = token_cache.get(token)
+    auth_cache_lookups.inc("miss" if user is None else "hit")
+    if user is None:
+        # Отдельная сессия: после её закрытия объекты отсоединены и их можно держать в кеше
+        async with AsyncSessionLocal() as session:
+            user_stmt = (
+                select(User)
+                .options(
+                    joinedload(User.city),
+                    selectinload(User.photos)
+                )
+                .where(User.id == int(payload['sub']))
+            )
 
-    user = db.scalars(user_stmt).unique().one_or_none()
-    
-    if not user:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Пользователь не найден",
-        )
+            user = (await session.scalars(user_stmt)).unique().one_or_none()
 
-    return user
-
-
-def get_user_data(request: Request, user: User) -> UserData:
-    avatar = ''
-    photos = []
-    base_url = str(request.base_url)
-    for img in user.photos:
-        full_path = urljoin(base_url, img.file_path)
-        if img.photo_type == PhotoType.AVATAR:
-            avatar = full_path
-        elif img.photo_type == PhotoType.VERIFICATION:
-            continue
-        photos.append(full_path)
-
-    return UserData(
-        id = user.id,
-        email = user.email,
-        name = user.name,
-        age = calculate_age(user.birth_date),
-        status = user.status,
-        height = user.height,
-        body_type = user.body_type,
-        gender = user.gender,
-        city = user.city.full_name,
-        city_id = user.city_id,
-        avatar = avatar,
-        photos = photos,
-        bio = user.bio,
-        desires = user.desires,
-    )
+        if not user:
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Пользователь не найден",
+            )
+
+        token_cache.set(token, user, tag=user.id)
+
+    # Копия снимка в сессии запроса, без обращения к БД
+    return await db.merge(user, load=False)
 
 
 @router.get("/users/me/", response_model=UserData)
-async def read_users_me(request: Request, user: Annotated[User, Depends(get_current_user)]):
-    return get_user_data(request, user)
+async def read_users_me(
+    request: Request,
+    user: Annotated[User, Depends(get_current_user)],
+    size: PhotoSize = PhotoSize.ORIGINAL,
+):
+    return user_response(request, user, size)
+
+
+def years_ago(today: date, years: int) -> date:
+    try:
+        return today.replace(year=today.year - years)
+    except ValueError:  # 29 февраля
+        return today.replace(year=today.year - years, day=28)
+
+
+def build_feed_query(
+    gender: Gender,
+    cursor: Optional[int] = None,
+    age_min: Optional[int] = None,
+    age_max: Optional[int] = None,
+    city_ids: Optional[List[int]] = None,
+    height_min: Optional[int] = None,
+    height_max: Optional[int] = None,
+    body_type: Optional[BodyType] = None,
+    limit: int = FEED_PAGE_SIZE,
+):
+    # Возраст переводим в границы birth_date, чтобы условие оставалось индексируемым
+    today = date.today()
+    stmt = (
+        select(User)
+        .options(joinedload(User.city), selectinload(User.photos))
+        .where(User.status == Status.ACTIVE, User.gender == gender)
+        .order_by(User.id.desc())
+        .limit(limit)
+    )
+    if cursor is not None:
+        stmt = stmt.where(User.id < cursor)
+    if city_ids is not None:
+        stmt = stmt.where(User.city_id.in_(city_ids))
+    if age_min is not None:
+        stmt = stmt.where(User.birth_date <= years_ago(today, age_min))
+    if age_max is not None:
+        stmt = stmt.where(User.birth_date > years_ago(today, age_max + 1))
+    if height_min is not None:
+        stmt = stmt.where(User.height >= height_min)
+    if height_max is not None:
+        stmt = stmt.where(User.height <= height_max)
+    if body_type is not None:
+        stmt = stmt.where(User.body_type == body_type)
+    return stmt
+
+
+# email других пользователей в ленту не отдаём (feed_response, схема FeedItem)
+@router.get("/users/feed/", response_model=FeedPage)
+async def users_feed(
+    request: Request,
+    user: Annotated[User, Depends(get_current_user)],
+    cursor: Optional[int] = Query(None, description="next_cursor предыдущей страницы"),
+    age_min: Optional[int] = Query(None, ge=18, le=100),
+    age_max: Optional[int] = Query(None, ge=18, le=100),
+    city_id: Optional[int] = None,
+    radius_km: Optional[float] = Query(None, gt=0, le=1000, description="Города в радиусе от city_id (по умолчанию — от своего)"),
+    height_min: Optional[int] = Query(None, ge=100, le=250),
+    height_max: Optional[int] = Query(None, ge=100, le=250),
+    body_type: Optional[BodyType] = None,
+    limit: int = Query(FEED_PAGE_SIZE, ge=1, le=MAX_FEED_PAGE_SIZE),
+    size: PhotoSize = PhotoSize.CARD,
+    db: AsyncSession = Depends(get_db)
+):
+    gender = Gender.FEMALE if user.gender == Gender.MALE else Gender.MALE
+    city_ids = None
+    if radius_km is not None:
+        center = city_id if city_id is not None else user.city_id
+        await city_versions.check()
+        city_ids = [other for other, _ in await city_geo_index.nearby(center, radius_km)]
+    elif city_id is not None:
+        city_ids = [city_id]
+
+    # Лишняя запись показывает, есть ли следующая страница
+    stmt = build_feed_query(gender, cursor, age_min, age_max, city_ids, height_min, height_max, body_type, limit + 1)
+    users = (await db.scalars(stmt)).unique().all()
+    has_more = len(users) > limit
+    users = users[:limit]
+
+    return feed_response(request, users, users[-1].id if has_more else None, size)
 
 
 @router.post("/users/edit/", response_model=UserData)
-async def edit_user(request: Request, form: UserEditForm, user: Annotated[User, Depends(get_current_user)], db: Session = Depends(get_db)):  
+async def edit_user(request: Request, form: UserEditForm, user: Annotated[User, Depends(get_current_user)], db: AsyncSession = Depends(get_db)):  
     user.name = form.name
     user.city_id = form.city_id
     user.height = form.height
     user.body_type = form.body_type
     user.bio = form.bio
     user.desires = form.desires
-    db.commit()
-    db.refresh(user)
-    return get_user_data(request, user)
+    revocation_list.profile_changed(db, [user.id])
+    await db.commit()
+    token_cache.invalidate_tag(user.id)
+    await db.refresh(user, ["city"])
+    return user_response(request, user)
+
+
+@router.post("/users/logout/")
+async def logout(
+    token: Annotated[str, Depends(oauth2_scheme)],
+    data: RefreshTokenRequest,
+    user: Annotated[User, Depends(get_current_user)],
+    db: AsyncSession = Depends(get_db)
+):
+    await db.execute(
+        update(AuthToken)
+        .where(AuthToken.token == data.refresh_token, AuthToken.user_id == user.id, AuthToken.is_active.is_(True))
+        .values(**revoked_values())
+    )
+    revocation_list.revoke(db, verify_token(token))
+    await db.commit()
+    token_cache.invalidate(token)
+
+    return {
+        "success": True,
+        "message": "Сессия завершена",
+    }
 
 
 @router.post("/users/change_password/")
-async def change_password(password_data: ChangePasswordRequest, db: Session = Depends(get_db)):
+async def change_password(request: Request, password_data: ChangePasswordRequest, db: AsyncSession = Depends(get_db)):
+    await rate_limiter.check(request, "change_password", email=password_data.email)
     stmt = select(User).where(User.email == password_data.email)
-    user = db.scalars(stmt).one_or_none()
+    user = (await db.scalars(stmt)).one_or_none()
 
-    if not user or not user.verify_password(password_data.old_password):
+    if not user or not await user.verify_password(password_data.old_password):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Incorrect username or password"
         )
 
-    user.set_password(password_data.new_password)
-    db.commit()
+    await user.set_password(password_data.new_password)
+    await revoke_user_sessions(db, user.id)
+    await db.commit()
 
     return {
         "success": True,
@@ -128,9 +225,10 @@ async def change_password(password_data: ChangePasswordRequest, db: Session = De
 
 
 @router.post("/users/reset_password/")
-async def reset_password(data: ResetPasswordRequest, db: Session = Depends(get_db)):
+async def reset_password(request: Request, data: ResetPasswordRequest, db: AsyncSession = Depends(get_db)):
+    await rate_limiter.check(request, "reset_password", email=data.email)
     stmt = select(User).where(User.email == data.email)
-    user = db.scalars(stmt).one_or_none()
+    user = (await db.scalars(stmt)).one_or_none()
 
     if not user:
         raise HTTPException(
@@ -139,11 +237,10 @@ async def reset_password(data: ResetPasswordRequest, db: Session = Depends(get_d
         )
 
     new_password = generate_password()
-    print("NEW PWD", new_password) # Удалить
-    user.set_password(new_password)
-    db.commit()
-
-    await send_password(user.email, new_password)
+    await user.set_password(new_password)
+    await revoke_user_sessions(db, user.id)
+    await send_password(db, user.id, user.email, new_password)
+    await db.commit()
 
     return {
         "success": True,
@@ -154,8 +251,9 @@ async def reset_password(data: ResetPasswordRequest, db: Session = Depends(get_d
 @router.post("/users/photos/upload/")
 async def upload_profile_photos(
     current_user: Annotated[User, Depends(get_current_user)],
+    background_tasks: BackgroundTasks,
     photos: List[UploadFile] = File(..., description="Фотографии профиля"),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     if len(photos) + len(current_user.photos) > MAX_PHOTOS:
         raise HTTPException(
@@ -164,54 +262,69 @@ async def upload_profile_photos(
         )
 
     user_id = current_user.id
-    user_dir = STORAGE_UPLOADS / f'user_{user_id}'
-    user_dir.mkdir(parents=True, exist_ok=True)
-
-    uploaded_photos = []
-
     try:
-        for i, photo in enumerate(photos):
-            photo_ext = Path(photo.filename).suffix.lower()
-            if not photo_ext or photo_ext not in ALLOWED_PHOTO_EXTENSIONS:
-                raise HTTPException(
-                    status_code=status.HTTP_400_BAD_REQUEST,
-                    detail=f"Не допустимый формат файла: {photo.filename}"
-                )
-
-            random_suffix = ''.join(secrets.choice(string.ascii_letters + string.digits) for _ in range(8))
-            photo_filename = f"profile_photo_{user_id}_{i}_{random_suffix}{photo_ext}"
-            photo_path = user_dir / photo_filename
-
-            with open(photo_path, "wb") as buffer:
-                shutil.copyfileobj(photo.file, buffer)
-
-            db_photo = Photo(
-                user_id=user_id,
-                file_path=str(photo_path),
-                photo_type=PhotoType.PENDING
-            )
-            db.add(db_photo)
-            uploaded_photos.append(str(photo_path))
-
-        # # Коммитим все изменения
-        db.commit()
-
-        return {
-            "success": True,
-            "message": f"Успешно загружено {len(uploaded_photos)} фото",
-            "user_id": user_id,
-            "uploaded_photos": uploaded_photos,
-        }
+        staged = await save_photos(photos)
+    except UploadError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.message)
 
+    uploaded_photos = [blob.path for blob in staged]
+    try:
+        db_photos = [
+            Photo(user_id=user_id, file_path=str(photo_path), photo_type=PhotoType.PENDING)
+            for photo_path in uploaded_photos
+        ]
+        db.add_all(db_photos)
+        revocation_list.profile_changed(db, [user_id])
+        await blobs.acquire(db, staged)
+        await db.commit()
     except Exception as e:
-        for photo_path in uploaded_photos:
-            try:
-                Path(photo_path).unlink(missing_ok=True)
-            except:
-                pass
-        db.rollback()
+        await blobs.discard(staged)
+        await db.rollback()
         logger.error(str(e))
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Ошибка при загрузке фото: {str(e)}"
         )
+
+    await blobs.publish(staged)
+    token_cache.invalidate_tag(user_id)
+    background_tasks.add_task(generate_variants, [(photo.id, photo.file_path) for photo in db_photos])
+
+    return {
+        "success": True,
+        "message": f"Успешно загружено {len(uploaded_photos)} фото",
+        "user_id": user_id,
+        "uploaded_photos": [str(photo_path) for photo_path in uploaded_photos],
+    }
+
+
+@router.delete("/users/photos/{photo_id}")
+async def delete_profile_photo(
+    photo_id: int,
+    current_user: Annotated[User, Depends(get_current_user)],
+    db: AsyncSession = Depends(get_db)
+):
+    stmt = select(Photo).where(Photo.id == photo_id, Photo.user_id == current_user.id)
+    photo = (await db.scalars(stmt)).one_or_none()
+    if not photo:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Фото с ID = {photo_id} отсутствует"
+        )
+    if photo.photo_type == PhotoType.VERIFICATION:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Фото для верификации удалить нельзя"
+        )
+
+    # Файл удаляется, только когда на него не осталось ссылок
+    legacy_files = await blobs.release(db, [photo.file_path])
+    legacy_files += [Path(path) for path in (photo.variants or {}).values() if not blobs.is_blob_path(path)]
+    await db.delete(photo)
+    revocation_list.profile_changed(db, [current_user.id])
+    await db.commit()
+    await blobs.collect_garbage(db)
+    await remove_files(legacy_files)
+    token_cache.invalidate_tag(current_user.id)
+
+    return {"success": True, "message": "Фото удалено", "photo_id": photo_id}